@@ -151,6 +151,13 @@ REDIS_PORT = 6379
 REDIS_DB = 0
 REDIS_PASSWORD = None
 
+# Token缓存配置
+TOKEN_CACHE_PREFIX = 'admin_token_cache'  # Token缓存Redis键前缀
+TOKEN_CACHE_LOCAL_SIZE = 10000  # 单个worker缓存的Token数
+TOKEN_CACHE_LOCAL_TTL = 60  # Token进程内缓存有效期(秒)
+TOKEN_CACHE_REDIS_TTL = 300  # Token Redis缓存有效期(秒)
+TOKEN_LAST_USED_FLUSH_INTERVAL = 60  # Token last_used批量写回间隔(秒)
+
 # InfluxDB 配置
 INFLUXDB_HOST = 'influxdb'
 INFLUXDB_PORT = 8086
@@ -177,4 +184,58 @@ CELERY_BEAT_SCHEDULE = {
         'task': 'apps.user_management.tasks.generate_user_report',
         'schedule': 86400.0,  # 每天执行一次
     },
+    'scale-idle-containers': {
+        'task': 'apps.container_management.tasks.scale_idle_containers',
+        'schedule': 300.0,  # 每5分钟执行一次
+    },
+    'maintain-warm-pool': {
+        'task': 'apps.container_management.tasks.maintain_warm_pool',
+        'schedule': 60.0,  # 每分钟执行一次
+    },
 }
+
+# 空闲缩容配置
+SCALE_TO_ZERO_IDLE_MINUTES = 30  # 无访问超过该时长的容器缩容到零(分钟)
+
+# 预热池配置
+WARM_POOL_ENABLED = True  # 新用户是否优先认领预热Pod
+WARM_POOL_MIN_SIZE = 2  # 预热池最小Pod数
+WARM_POOL_MAX_SIZE = 50  # 预热池最大Pod数
+WARM_POOL_RATE_WINDOW_MINUTES = 60  # 统计注册速率的时间窗口(分钟)
+WARM_POOL_LEAD_MINUTES = 5  # 补充一个预热Pod所需时间(分钟)，池大小覆盖该时间内的预期注册数
+
+# 容器异步开通配置
+PROVISIONING_TIMEOUT = 600  # 开通超过该时长仍无就绪Pod则标记失败(秒)
+PROVISIONING_POLL_INTERVAL = 15  # 未收到watch事件时复查开通状态的间隔(秒)
+PROVISIONING_MAX_RETRIES = 5  # K8s调用失败的最大重试次数
+DEPLOYMENT_WATCH_TIMEOUT = 300  # Deployment watch单次连接时长(秒)
+DEPLOYMENT_WATCH_LEADER_TTL = 30  # 写库进程租约有效期(秒)
+
+# Kubernetes API客户端配置
+K8S_CONNECTION_POOL_MAXSIZE = 32  # 每个进程共享的ApiClient连接池大小
+K8S_CONNECT_TIMEOUT = 5  # K8s API连接超时(秒)
+K8S_READ_TIMEOUT = 30  # K8s API读超时(秒)，watch调用不受限
+
+# 租户资源模板配置
+USER_CONTAINER_TEMPLATE = BASE_DIR.parent / 'pods_yaml' / 'user-container-template.yaml'  # 镜像中由ConfigMap挂载到/pods_yaml
+K8S_APPLY_CONCURRENCY = 8  # 批量server-side apply的并发数，不超过K8S_CONNECTION_POOL_MAXSIZE
+
+# 监控数据降采样与保留配置
+METRICS_RAW_RETENTION_DAYS = 7  # 原始指标/健康检查/路由日志保留天数
+METRICS_MINUTE_RETENTION_DAYS = 14  # 分钟级聚合保留天数
+METRICS_HOUR_RETENTION_DAYS = 90  # 小时级聚合保留天数
+METRICS_DAY_RETENTION_DAYS = 730  # 天级聚合保留天数
+METRICS_ROLLUP_LATENESS_SECONDS = 120  # 原始数据写入延迟，只聚合该时间之前的时间桶(秒)
+METRICS_ROLLUP_MAX_BUCKETS = 60  # 每次每层最多聚合的时间桶数（追赶积压时分多次完成）
+METRICS_DELETE_BATCH_SIZE = 5000  # 每条DELETE最多删除的行数
+METRICS_DELETE_MAX_BATCHES = 20  # 每次清理每张表最多执行的DELETE次数
+
+# 资源异常检测配置
+ANOMALY_EWMA_ALPHA = 0.1  # EWMA均值/方差及Holt水平的平滑系数
+ANOMALY_TREND_BETA = 0.1  # Holt趋势的平滑系数
+ANOMALY_Z_THRESHOLD = 3.0  # 偏离EWMA均值超过该标准差倍数视为突变
+ANOMALY_WARMUP_SAMPLES = 10  # 样本数达到该值后才开始检测
+ANOMALY_TREND_THRESHOLD = 0.1  # 使用率上升趋势阈值(百分点/分钟)
+ANOMALY_LEVEL_THRESHOLD = 80  # 趋势告警要求的当前使用率下限(%)
+ANOMALY_BACKFILL_MINUTES = 60  # 状态缺失时回填的历史长度(分钟)
+ANOMALY_STATE_TTL = 86400  # 检测状态在Redis中的有效期(秒)，容器删除后自然过期
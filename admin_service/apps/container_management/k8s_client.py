@@ -1,3 +1,8 @@
+import asyncio
+import json
+import os
+import threading
+
 from kubernetes import client, config
 from django.conf import settings
 from kubernetes.config.kube_config import KubeConfigLoader
@@ -7,7 +12,8 @@ import urllib3
 urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning)
 
 class K8sClient:
-    def __init__(self):
+    @staticmethod
+    def _kube_config() -> dict:
         # 手动定义Kubernetes配置参数
         kube_config_dict = {
     "apiVersion": "v1",
@@ -43,32 +49,33 @@ class K8sClient:
     ]
 }
 
-        # 加载配置
-        loader = KubeConfigLoader(config_dict=kube_config_dict)
-        configuration = Configuration()
-        loader.load_and_set(configuration)
-
-        # 设置为默认配置
-        client.Configuration.set_default(configuration)
+        return kube_config_dict
 
-        self.core_v1 = client.CoreV1Api()
-        self.apps_v1 = client.AppsV1Api()
+    def __init__(self):
+        # 共享进程内的ApiClient（配置只解析一次，连接池复用TLS连接）
+        api_client = get_api_client()
+        self.core_v1 = client.CoreV1Api(api_client)
+        self.apps_v1 = client.AppsV1Api(api_client)
+        self.custom_objects = client.CustomObjectsApi(api_client)
+        self.autoscaling_v2 = client.AutoscalingV2Api(api_client)
+        self.request_timeout = get_request_timeout()
 
     def create_deployment(self, name: str, spec: dict) -> None:
         """创建Deployment"""
         deployment = client.V1Deployment(metadata=spec["metadata"], spec=spec["spec"])
-        self.apps_v1.create_namespaced_deployment(namespace="user-containers", body=deployment)
+        self.apps_v1.create_namespaced_deployment(namespace="user-containers", body=deployment, _request_timeout=self.request_timeout)
 
     def create_service(self, name: str, spec: dict) -> None:
         """创建Service"""
         service = client.V1Service(metadata=spec["metadata"], spec=spec["spec"])
-        self.core_v1.create_namespaced_service(namespace="user-containers", body=service)
+        self.core_v1.create_namespaced_service(namespace="user-containers", body=service, _request_timeout=self.request_timeout)
 
     def get_deployment_pods(self, deployment_name: str) -> list:
         """获取Deployment关联的Pod列表"""
         pods = self.core_v1.list_namespaced_pod(
             namespace="user-containers",
-            label_selector=f"app={deployment_name}"
+            label_selector=f"app={deployment_name}",
+            _request_timeout=self.request_timeout
         )
         return [{"id": pod.metadata.uid, "name": pod.metadata.name, "ip": pod.status.pod_ip} for pod in pods.items]
 
@@ -76,7 +83,8 @@ class K8sClient:
         """获取Deployment状态"""
         deployment = self.apps_v1.read_namespaced_deployment(
             name=deployment_name,
-            namespace="user-containers"
+            namespace="user-containers",
+            _request_timeout=self.request_timeout
         )
         return {
             "phase": "running" if deployment.status.ready_replicas == deployment.spec.replicas else "pending",
@@ -88,25 +96,143 @@ class K8sClient:
         self.apps_v1.delete_namespaced_deployment(
             name=name,
             namespace="user-containers",
-            body=client.V1DeleteOptions(propagation_policy="Foreground")
+            body=client.V1DeleteOptions(propagation_policy="Foreground"),
+            _request_timeout=self.request_timeout
         )
 
     def delete_service(self, name: str) -> None:
         """删除Service"""
         self.core_v1.delete_namespaced_service(
             name=name,
-            namespace="user-containers"
+            namespace="user-containers",
+            _request_timeout=self.request_timeout
         )
 
     def scale_deployment(self, name: str, replicas: int) -> None:
-        """调整Deployment副本数"""
-        deployment = self.apps_v1.read_namespaced_deployment(
+        """调整Deployment副本数（scale子资源，单次调用且不与其他字段更新冲突）"""
+        self.apps_v1.patch_namespaced_deployment_scale(
             name=name,
-            namespace="user-containers"
+            namespace="user-containers",
+            body={"spec": {"replicas": replicas}},
+            _request_timeout=self.request_timeout
         )
-        deployment.spec.replicas = replicas
-        self.apps_v1.replace_namespaced_deployment(
+
+    def list_pods(self, label_selector: str) -> list:
+        """按标签列出Pod"""
+        return self.core_v1.list_namespaced_pod(
+            namespace="user-containers",
+            label_selector=label_selector,
+            _request_timeout=self.request_timeout
+        ).items
+
+    def patch_pod(self, name: str, body: dict) -> None:
+        """修改Pod（标签/注解）"""
+        self.core_v1.patch_namespaced_pod(
+            name=name,
+            namespace="user-containers",
+            body=body,
+            _request_timeout=self.request_timeout
+        )
+
+    def delete_pod(self, name: str) -> None:
+        """删除Pod"""
+        self.core_v1.delete_namespaced_pod(
             name=name,
             namespace="user-containers",
-            body=deployment
-        )
\ No newline at end of file
+            _request_timeout=self.request_timeout
+        )
+
+    def list_deployments(self, label_selector: str = None) -> list:
+        """列出命名空间下的Deployment"""
+        return self.apps_v1.list_namespaced_deployment(
+            namespace="user-containers",
+            label_selector=label_selector,
+            _request_timeout=self.request_timeout
+        ).items
+
+    def apply(self, body: dict, field_manager: str, force: bool = True) -> dict:
+        """服务端应用(server-side apply)任意命名空间资源：不存在则创建，存在则合并本管理者的字段"""
+        api_version = body["apiVersion"]
+        prefix = "/api/v1" if api_version == "v1" else f"/apis/{api_version}"
+        path = f"{prefix}/namespaces/user-containers/{body['kind'].lower()}s/{body['metadata']['name']}"
+        # apply-patch+yaml的请求体需是字符串（JSON是合法的YAML）
+        return self.core_v1.api_client.call_api(
+            path, 'PATCH',
+            query_params=[('fieldManager', field_manager), ('force', str(force).lower())],
+            header_params={'Content-Type': 'application/apply-patch+yaml', 'Accept': 'application/json'},
+            body=json.dumps(body),
+            response_type='object',
+            auth_settings=['BearerToken'],
+            _return_http_data_only=True,
+            _request_timeout=self.request_timeout
+        )
+
+    def delete_hpa(self, name: str) -> None:
+        """删除HorizontalPodAutoscaler"""
+        self.autoscaling_v2.delete_namespaced_horizontal_pod_autoscaler(
+            name=name,
+            namespace="user-containers",
+            _request_timeout=self.request_timeout
+        )
+
+
+_api_client = None
+_api_client_pid = None
+_api_client_lock = threading.Lock()
+
+
+def get_request_timeout() -> tuple:
+    """K8s API请求的(连接, 读取)超时（watch调用不使用）"""
+    return (
+        getattr(settings, 'K8S_CONNECT_TIMEOUT', 5),
+        getattr(settings, 'K8S_READ_TIMEOUT', 30)
+    )
+
+
+def _load_configuration() -> Configuration:
+    """集群内优先使用ServiceAccount配置，否则使用内置kubeconfig"""
+    configuration = Configuration()
+    try:
+        config.load_incluster_config(client_configuration=configuration)
+    except config.ConfigException:
+        KubeConfigLoader(config_dict=K8sClient._kube_config()).load_and_set(configuration)
+    # urllib3连接池大小：并发的watch线程和Celery任务共用同一组keep-alive连接
+    configuration.connection_pool_maxsize = getattr(settings, 'K8S_CONNECTION_POOL_MAXSIZE', 32)
+    return configuration
+
+
+def get_api_client() -> client.ApiClient:
+    """获取当前进程共享的ApiClient（fork出的子进程重新创建，不共用父进程的连接）"""
+    global _api_client, _api_client_pid
+    pid = os.getpid()
+    if _api_client is None or _api_client_pid != pid:
+        with _api_client_lock:
+            if _api_client is None or _api_client_pid != pid:
+                _api_client = client.ApiClient(_load_configuration())
+                _api_client_pid = pid
+    return _api_client
+
+
+# kubernetes_asyncio为可选依赖：事件循环 -> ApiClient
+_async_api_clients = {}
+
+
+async def get_async_api_client():
+    """获取当前事件循环共享的异步ApiClient，未安装kubernetes_asyncio时返回None"""
+    try:
+        from kubernetes_asyncio import client as async_client, config as async_config
+        from kubernetes_asyncio.config.kube_config import KubeConfigLoader as AsyncKubeConfigLoader
+    except ImportError:
+        return None
+
+    loop = asyncio.get_running_loop()
+    api_client = _async_api_clients.get(loop)
+    if api_client is None:
+        configuration = async_client.Configuration()
+        try:
+            async_config.load_incluster_config(client_configuration=configuration)
+        except async_config.ConfigException:
+            await AsyncKubeConfigLoader(config_dict=K8sClient._kube_config()).load_and_set(configuration)
+        configuration.connection_pool_maxsize = getattr(settings, 'K8S_CONNECTION_POOL_MAXSIZE', 32)
+        api_client = _async_api_clients[loop] = async_client.ApiClient(configuration)
+    return api_client
@@ -1,99 +1,72 @@
+import logging
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Dict, Iterable, Optional, Tuple
+
+from django.conf import settings
+from kubernetes.client.exceptions import ApiException
 from .k8s_client import K8sClient
+from .tenant_resources import DEPLOYMENT_PREFIX, SERVICE_PREFIX, HPA_PREFIX, render_tenant_resources
+
+logger = logging.getLogger(__name__)
+
+# server-side apply的字段管理者：只覆盖本服务声明的字段
+FIELD_MANAGER = "admin-service"
+
 
 class ContainerOrchestrator:
     def __init__(self):
         self.k8s_client = K8sClient()
 
-    def create_k8s_resources(self, user_id: str, tenant_id: str) -> tuple:
-        """创建K8s Deployment和Service（结构与yaml模板一致）"""
-        deployment_name = f"user-container-dep-{tenant_id}"
-        service_name = f"user-container-svc-{tenant_id}"
+    def create_k8s_resources(self, user_id: str, tenant_id: str, resources: Dict[str, str] = None) -> tuple:
+        """创建（或更新）租户的Deployment、Service和HPA"""
+        error = self.apply_tenant_resources([(user_id, tenant_id, resources)])[str(tenant_id)]
+        if error is not None:
+            raise error
+        return f"{DEPLOYMENT_PREFIX}{tenant_id}", f"{SERVICE_PREFIX}{tenant_id}"
 
-        deployment_spec = {
-            "apiVersion": "apps/v1",
-            "kind": "Deployment",
-            "metadata": {
-                "name": deployment_name
-            },
-            "spec": {
-                "replicas": 1,
-                "selector": {
-                    "matchLabels": {
-                        "app": "user-container",
-                        "tenant": tenant_id
-                    }
-                },
-                "template": {
-                    "metadata": {
-                        "labels": {
-                            "app": "user-container",
-                            "tenant": tenant_id
-                        }
-                    },
-                    "spec": {
-                        "containers": [
-                            {
-                                "name": "user-container",
-                                "image": "user_container:latest",
-                                "imagePullPolicy": "IfNotPresent",
-                                "ports": [
-                                    {"containerPort": 8000, "name": "http"}
-                                ],
-                                "env": [
-                                    {"name": "USER_ID", "value": str(user_id)},
-                                    {"name": "TENANT_ID", "value": str(tenant_id)},
-                                    {"name": "ADMIN_SERVICE_URL", "value": "http://admin-service:80"},
-                                    {"name": "GATEWAY_URL", "value": "http://user-gateway:80"}
-                                ],
-                                "startupProbe": {
-                                    "httpGet": {"path": "/healthz", "port": "http"},
-                                    "failureThreshold": 30,
-                                    "periodSeconds": 10
-                                },
-                                "livenessProbe": {
-                                    "httpGet": {"path": "/healthz", "port": "http"},
-                                    "initialDelaySeconds": 20,
-                                    "periodSeconds": 30
-                                },
-                                "readinessProbe": {
-                                    "httpGet": {"path": "/readyz", "port": "http"},
-                                    "initialDelaySeconds": 10,
-                                    "periodSeconds": 10
-                                },
-                                "resources": {
-                                    "requests": {"cpu": "100m", "memory": "128Mi"},
-                                    "limits": {"cpu": "250m", "memory": "256Mi"}
-                                }
-                            }
-                        ]
-                    }
-                }
-            }
-        }
+    def ensure_k8s_resources(self, user_id: str, tenant_id: str, resources: Dict[str, str] = None) -> tuple:
+        """幂等创建K8s资源：server-side apply对已存在的资源只合并字段，可安全重试"""
+        return self.create_k8s_resources(user_id, tenant_id, resources)
 
-        service_spec = {
-            "apiVersion": "v1",
-            "kind": "Service",
-            "metadata": {
-                "name": service_name
-            },
-            "spec": {
-                "selector": {
-                    "app": "user-container",
-                    "tenant": tenant_id
-                },
-                "ports": [
-                    {"protocol": "TCP", "port": 80, "targetPort": 8000}
-                ]
-            }
-        }
+    def apply_tenant_resources(self, tenants: Iterable[Tuple[str, str, Optional[Dict[str, str]]]]
+                               ) -> Dict[str, Optional[Exception]]:
+        """批量server-side apply多个租户的资源，tenants为(user_id, tenant_id, 资源配额)
 
-        self.k8s_client.create_deployment(deployment_name, deployment_spec)
-        self.k8s_client.create_service(service_name, service_spec)
-        return deployment_name, service_name
+        所有租户的所有对象并发提交（共用进程内ApiClient的连接池），
+        返回每个租户的第一个异常，成功为None。
+        """
+        jobs = [
+            (str(tenant_id), body)
+            for user_id, tenant_id, resources in tenants
+            for body in render_tenant_resources(user_id, tenant_id, resources)
+        ]
+        errors = {tenant_id: None for tenant_id, _ in jobs}
+        if not jobs:
+            return errors
+
+        workers = min(getattr(settings, 'K8S_APPLY_CONCURRENCY', 8), len(jobs))
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            futures = {
+                executor.submit(self.k8s_client.apply, body, FIELD_MANAGER): (tenant_id, body)
+                for tenant_id, body in jobs
+            }
+            for future in as_completed(futures):
+                tenant_id, body = futures[future]
+                try:
+                    future.result()
+                except Exception as e:
+                    logger.error(f"Failed to apply {body['kind']} {body['metadata']['name']}: {e}")
+                    if errors[tenant_id] is None:
+                        errors[tenant_id] = e
+        return errors
 
     def delete_k8s_resources(self, deployment_name: str, service_name: str) -> None:
-        """删除K8s Deployment和Service"""
+        """删除K8s Deployment、Service和HPA"""
+        try:
+            self.k8s_client.delete_hpa(HPA_PREFIX + deployment_name[len(DEPLOYMENT_PREFIX):])
+        except ApiException as e:
+            if e.status != 404:
+                raise
         self.k8s_client.delete_deployment(deployment_name)
         self.k8s_client.delete_service(service_name)
 
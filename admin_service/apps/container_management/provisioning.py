@@ -0,0 +1,266 @@
+import logging
+import os
+import socket
+import threading
+import time
+from typing import Dict, List, Optional
+
+import redis
+from django.conf import settings
+from django.db import close_old_connections, transaction
+from django.utils import timezone
+from kubernetes import watch
+from kubernetes.client.exceptions import ApiException
+from ..userdb.models import UserContainer, ContainerInstance
+from .k8s_client import K8sClient
+from .orchestrator import ContainerOrchestrator
+from .tenant_resources import container_resources
+from .warm_pool import WarmPool, _is_ready
+
+logger = logging.getLogger(__name__)
+
+# 开通状态机沿用UserContainer.status取值：requested → deploying → ready / failed
+REQUESTED, DEPLOYING, READY, FAILED = 'pending', 'creating', 'running', 'error'
+PROVISIONING_STATES = {REQUESTED: 'requested', DEPLOYING: 'deploying', READY: 'ready', FAILED: 'failed'}
+
+DEPLOYMENT_PREFIX = "user-container-dep-"
+RESOURCE_FIELDS = ('cpu_request', 'memory_request', 'cpu_limit', 'memory_limit', 'storage_size')
+
+
+def request_provisioning(user, config: Dict = None) -> UserContainer:
+    """登记开通请求并在事务提交后投递异步任务（重复调用不会重复开通）"""
+    from .tasks import provision_container
+
+    config = config or {}
+    tenant_id = str(user.id)
+    resources = {field: config[field] for field in RESOURCE_FIELDS if config.get(field)}
+    if config.get('storage_limit') and 'storage_size' not in resources:
+        resources['storage_size'] = config['storage_limit']
+
+    container, created = UserContainer.objects.get_or_create(
+        user=user,
+        defaults={
+            'container_name': f"user-{tenant_id}-container",
+            'deployment_name': f"{DEPLOYMENT_PREFIX}{tenant_id}",
+            'service_name': f"user-container-svc-{tenant_id}",
+            'status': REQUESTED,
+            **resources,
+        }
+    )
+    # 失败后再次请求时重新开通
+    if not created and container.status == FAILED:
+        created = UserContainer.objects.filter(id=container.id, status=FAILED).update(status=REQUESTED) > 0
+        container.status = REQUESTED
+    if created:
+        transaction.on_commit(lambda: provision_container.delay(container.id))
+    return container
+
+
+def provisioning_state(container: Optional[UserContainer]) -> str:
+    """对外的开通状态"""
+    if container is None:
+        return 'none'
+    return PROVISIONING_STATES.get(container.status, container.status)
+
+
+def progress_failed(deployment) -> bool:
+    """Deployment是否已超过progressDeadlineSeconds仍未完成发布"""
+    return any(
+        condition.type == 'Progressing' and condition.reason == 'ProgressDeadlineExceeded'
+        for condition in deployment.status.conditions or []
+    )
+
+
+def _pod_infos(pods) -> List[Dict]:
+    return [
+        {"id": pod.metadata.uid, "name": pod.metadata.name, "ip": pod.status.pod_ip}
+        for pod in pods if _is_ready(pod)
+    ]
+
+
+class ContainerProvisioner:
+    """容器开通状态机
+
+    每一步都可重复执行：K8s资源已存在视为成功，已认领的预热Pod不会重复认领，
+    数据库只在状态转换时做短事务，不在事务中调用K8s API。
+    """
+
+    def __init__(self, k8s_client: K8sClient = None):
+        self.k8s_client = k8s_client or K8sClient()
+
+    def advance(self, container_id: int) -> str:
+        """推进一步，返回推进后的状态"""
+        container = UserContainer.objects.get(id=container_id)
+        if container.status in (READY, FAILED):
+            return container.status
+        UserContainer.objects.filter(id=container.id, status=REQUESTED).update(status=DEPLOYING)
+
+        tenant_id = str(container.user_id)
+        pods = _pod_infos(self.k8s_client.list_pods(f"app=user-container,tenant={tenant_id}"))
+        if not pods and getattr(settings, 'WARM_POOL_ENABLED', True):
+            warm_pod = WarmPool(self.k8s_client).claim(tenant_id, container.user_id)
+            if warm_pod:
+                pods = [warm_pod]
+
+        ContainerOrchestrator().ensure_k8s_resources(container.user_id, tenant_id, container_resources(container))
+
+        if pods:
+            self.mark_ready(container.id, pods)
+            return READY
+        return DEPLOYING
+
+    def on_deployment_event(self, tenant_id: str, ready_replicas: int, failed: bool):
+        """Deployment状态变化（watch事件）驱动状态转换"""
+        container = UserContainer.objects.filter(
+            user_id=tenant_id, status__in=[REQUESTED, DEPLOYING]
+        ).values_list('id', flat=True).first()
+        if container is None:
+            return
+        if ready_replicas >= 1:
+            self.mark_ready(container, _pod_infos(
+                self.k8s_client.list_pods(f"app=user-container,tenant={tenant_id}")
+            ))
+        elif failed:
+            self.mark_failed(container, 'Deployment exceeded its progress deadline')
+
+    @staticmethod
+    def mark_ready(container_id: int, pods: List[Dict]):
+        with transaction.atomic():
+            updated = UserContainer.objects.filter(
+                id=container_id, status__in=[REQUESTED, DEPLOYING]
+            ).update(status=READY, ready_replicas=len(pods))
+            if not updated:
+                return
+            existing = set(
+                ContainerInstance.objects.filter(container_id=container_id).values_list('instance_id', flat=True)
+            )
+            ContainerInstance.objects.bulk_create([
+                ContainerInstance(
+                    container_id=container_id,
+                    instance_id=pod['id'],
+                    pod_name=pod['name'],
+                    pod_ip=pod['ip'],
+                    port=8000,
+                    status='running'
+                )
+                for pod in pods if pod['id'] not in existing
+            ])
+        logger.info(f"Container {container_id} is ready with {len(pods)} pods")
+
+    @staticmethod
+    def mark_failed(container_id: int, reason: str):
+        UserContainer.objects.filter(id=container_id, status__in=[REQUESTED, DEPLOYING]).update(status=FAILED)
+        logger.error(f"Provisioning failed for container {container_id}: {reason}")
+
+    @staticmethod
+    def timed_out(container_id: int) -> bool:
+        deadline = timezone.now() - timezone.timedelta(seconds=getattr(settings, 'PROVISIONING_TIMEOUT', 600))
+        return UserContainer.objects.filter(id=container_id, created_at__lt=deadline).exists()
+
+
+class DeploymentWatcher:
+    """watch用户容器Deployment，就绪/失败事件推进开通状态机，其余变化交给对账器
+
+    每个进程只启动一个watch线程，只有持有Redis租约的进程写库。
+    """
+
+    LEADER_KEY = "deployment_watcher:leader"
+
+    def __init__(self):
+        self.watch_timeout = getattr(settings, 'DEPLOYMENT_WATCH_TIMEOUT', 300)
+        self.leader_ttl = getattr(settings, 'DEPLOYMENT_WATCH_LEADER_TTL', 30)
+        self._identity = f"{socket.gethostname()}:{os.getpid()}"
+        self._leader_until = 0.0
+        self._redis_client = None
+        self._started_pid = None
+        self._lock = threading.Lock()
+
+    def start(self):
+        pid = os.getpid()
+        if self._started_pid == pid:
+            return
+        with self._lock:
+            if self._started_pid == pid:
+                return
+            self._started_pid = pid
+        threading.Thread(target=self._run, name='deployment-watcher', daemon=True).start()
+        logger.info("Deployment watcher started")
+
+    def _run(self):
+        from .reconciler import ContainerReconciler
+
+        k8s_client = K8sClient()
+        provisioner = ContainerProvisioner(k8s_client)
+        reconciler = ContainerReconciler(k8s_client)
+        list_func = k8s_client.apps_v1.list_namespaced_deployment
+        while True:
+            try:
+                deployments = list_func(namespace="user-containers", label_selector="app=user-container")
+                for deployment in deployments.items:
+                    self._on_event(provisioner, deployment)
+                # (重新)list后做一次全量对账，之后只按事件增量对账
+                if self._is_leader():
+                    close_old_connections()
+                    reconciler.apply(deployments.items, full=True)
+                resource_version = deployments.metadata.resource_version
+                while True:
+                    for event in watch.Watch().stream(
+                        list_func,
+                        namespace="user-containers",
+                        label_selector="app=user-container",
+                        resource_version=resource_version,
+                        timeout_seconds=self.watch_timeout
+                    ):
+                        deployment = event['object']
+                        resource_version = deployment.metadata.resource_version
+                        if event['type'] != 'DELETED':
+                            self._on_event(provisioner, deployment, reconciler)
+            except ApiException as e:
+                if e.status != 410:
+                    logger.error(f"Deployment watch failed: {e}")
+                    time.sleep(5)
+            except Exception as e:
+                logger.error(f"Deployment watch error: {e}")
+                time.sleep(5)
+
+    def _on_event(self, provisioner: ContainerProvisioner, deployment, reconciler=None):
+        name = deployment.metadata.name
+        if not name.startswith(DEPLOYMENT_PREFIX) or not self._is_leader():
+            return
+        failed = progress_failed(deployment)
+        close_old_connections()
+        try:
+            provisioner.on_deployment_event(
+                name[len(DEPLOYMENT_PREFIX):], deployment.status.ready_replicas or 0, failed
+            )
+            if reconciler is not None:
+                reconciler.apply([deployment])
+        except Exception as e:
+            logger.error(f"Failed to apply deployment event for {name}: {e}")
+
+    def _is_leader(self) -> bool:
+        now = time.monotonic()
+        if now < self._leader_until:
+            return True
+        try:
+            if self._redis_client is None:
+                self._redis_client = redis.Redis(
+                    host=settings.REDIS_HOST,
+                    port=settings.REDIS_PORT,
+                    db=settings.REDIS_DB,
+                    password=settings.REDIS_PASSWORD,
+                    decode_responses=True
+                )
+            acquired = self._redis_client.set(self.LEADER_KEY, self._identity, nx=True, ex=self.leader_ttl)
+            if not acquired and self._redis_client.get(self.LEADER_KEY) == self._identity:
+                self._redis_client.expire(self.LEADER_KEY, self.leader_ttl)
+                acquired = True
+        except Exception as e:
+            logger.warning(f"Deployment watcher leader check failed: {e}")
+            return False
+        if acquired:
+            self._leader_until = now + self.leader_ttl / 2
+        return bool(acquired)
+
+
+deployment_watcher = DeploymentWatcher()
@@ -0,0 +1,123 @@
+import logging
+from collections import defaultdict
+from typing import Iterable, Optional, Set
+
+from django.db import transaction
+from django.utils import timezone
+from ..userdb.models import User, UserContainer
+from .k8s_client import K8sClient
+from .provisioning import REQUESTED, DEPLOYING, DEPLOYMENT_PREFIX, provisioning_state, progress_failed
+from .warm_pool import _is_ready
+
+logger = logging.getLogger(__name__)
+
+# 开通中和销毁中的容器由各自流程负责状态转换，对账不覆盖
+SKIP_STATUSES = (REQUESTED, DEPLOYING, 'destroying')
+
+
+def observed_status(replicas: int, ready_replicas: int, failed: bool = False,
+                    tenant_pod_ready: bool = False) -> Optional[str]:
+    """由Deployment副本数推导容器状态，无法判定（发布进行中）时返回None表示保持原状态
+
+    租户有任何就绪Pod（包括认领的预热Pod）即为running；没有就绪Pod时只有发布
+    超过progressDeadlineSeconds才视为error，正常滚动发布和新Deployment启动中不算异常。
+    """
+    if replicas == 0:
+        return 'stopped'
+    if ready_replicas >= 1 or tenant_pod_ready:
+        return 'running'
+    return 'error' if failed else None
+
+
+class ContainerReconciler:
+    """容器状态批量对账
+
+    一次按标签list所有用户容器Deployment（或使用watch推送的单个Deployment），
+    在内存中与数据库比对，只用bulk_update写回有变化的行，
+    用户表的container_status按状态分组各一条UPDATE。
+    """
+
+    def __init__(self, k8s_client: K8sClient = None):
+        self.k8s_client = k8s_client or K8sClient()
+
+    def reconcile(self) -> int:
+        """全量对账：一次list调用"""
+        return self.apply(self.k8s_client.list_deployments("app=user-container"), full=True)
+
+    def apply(self, deployments: Iterable, full: bool = False) -> int:
+        """按观测到的Deployment更新容器状态，返回变化行数
+
+        full为True时表示deployments是全量列表，数据库中有而列表中没有的容器视为异常。
+        """
+        observed = {}
+        for deployment in deployments:
+            name = deployment.metadata.name
+            if name.startswith(DEPLOYMENT_PREFIX):
+                observed[name] = (
+                    deployment.spec.replicas or 0, deployment.status.ready_replicas or 0, progress_failed(deployment)
+                )
+        if not observed and not full:
+            return 0
+
+        # 全量对账一次list所有租户Pod；增量只为没有就绪副本的Deployment按租户查询
+        if full:
+            ready_tenants = self._ready_tenants()
+        else:
+            unready = [
+                name[len(DEPLOYMENT_PREFIX):]
+                for name, (replicas, ready_replicas, _) in observed.items() if replicas and not ready_replicas
+            ]
+            ready_tenants = self._ready_tenants(unready) if unready else set()
+
+        queryset = UserContainer.objects.exclude(status__in=SKIP_STATUSES).only(
+            'id', 'user_id', 'deployment_name', 'status', 'replicas', 'ready_replicas'
+        )
+        if not full:
+            queryset = queryset.filter(deployment_name__in=list(observed))
+
+        now = timezone.now()
+        changed = []
+        for container in queryset.iterator(chunk_size=2000):
+            state = observed.get(container.deployment_name)
+            tenant_pod_ready = str(container.user_id) in ready_tenants
+            if state is None:
+                replicas, ready_replicas = container.replicas, 0
+                status = 'running' if tenant_pod_ready else 'error'
+            else:
+                replicas, ready_replicas, failed = state
+                status = observed_status(replicas, ready_replicas, failed, tenant_pod_ready) or container.status
+            if (container.status, container.replicas, container.ready_replicas) != (status, replicas, ready_replicas):
+                container.status = status
+                container.replicas = replicas
+                container.ready_replicas = ready_replicas
+                container.updated_at = now
+                changed.append(container)
+
+        if changed:
+            users_by_state = defaultdict(list)
+            for container in changed:
+                users_by_state[provisioning_state(container)].append(container.user_id)
+            with transaction.atomic():
+                UserContainer.objects.bulk_update(
+                    changed, ['status', 'replicas', 'ready_replicas', 'updated_at'], batch_size=500
+                )
+                for state, user_ids in users_by_state.items():
+                    User.objects.filter(id__in=user_ids).exclude(container_status=state).update(container_status=state)
+
+        if full:
+            logger.info(f"Reconciled {len(observed)} deployments, {len(changed)} containers changed")
+        return len(changed)
+
+    def _ready_tenants(self, tenant_ids: Optional[Iterable[str]] = None) -> Set[str]:
+        """有就绪Pod的租户（按Pod的tenant标签，包括认领的预热Pod），tenant_ids为None时一次list全部"""
+        if tenant_ids is None:
+            pods = self.k8s_client.list_pods("app=user-container")
+        else:
+            pods = [
+                pod for tenant_id in tenant_ids
+                for pod in self.k8s_client.list_pods(f"app=user-container,tenant={tenant_id}")
+            ]
+        return {
+            pod.metadata.labels["tenant"] for pod in pods
+            if (pod.metadata.labels or {}).get("tenant") and _is_ready(pod)
+        }
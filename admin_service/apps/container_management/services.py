@@ -1,60 +1,22 @@
+import logging
+from django.conf import settings
 from django.db import transaction
+from django.db.models import Q
 from django.utils import timezone
 from ..userdb.models import User, UserContainer, ContainerInstance
 from .k8s_client import K8sClient
 from .orchestrator import ContainerOrchestrator
+from .provisioning import request_provisioning
+
+logger = logging.getLogger(__name__)
 
 class ContainerService:
     @staticmethod
     @transaction.atomic
     def create_user_container(user_id: str, config: dict) -> UserContainer:
-        """创建用户容器（原子操作：K8s部署 + 数据库记录）"""
+        """登记容器开通请求，K8s资源由异步任务创建（事务内不调用K8s API）"""
         user = User.objects.get(id=user_id)
-        orchestrator = ContainerOrchestrator()
-        
-        # 新增：提取MySQL连接配置（假设从用户权限或全局配置获取）
-        mysql_config = {
-            "host": "mysql-service",  # MySQL服务名（K8s内部DNS）
-            "port": "3306",
-            "user": "django_user",
-            "password": "django_pass"
-        }
-        
-        # 合并数据库配置到容器配置
-        extended_config = {
-            **config,
-            "mysql": mysql_config,
-            "port": 8000  # Django应用监听端口（需与Deployment容器端口一致）
-        }
-        
-        # 调用编排器创建K8s资源（需确保orchestrator支持mysql参数）
-        deployment_name, service_name = orchestrator.create_k8s_resources(
-            user.id, 
-            extended_config  # 传递扩展配置
-        )
-        
-        # 创建/更新UserContainer记录
-        container = UserContainer.objects.create(
-            user=user,
-            container_name=f"user-{user_id}-container",
-            deployment_name=deployment_name,
-            service_name=service_name,
-            status='creating',
-            **config  # 包含cpu/memory/storage等配置
-        )
-        
-        # 同步容器实例（假设K8s返回Pod信息）
-        pods = K8sClient().get_deployment_pods(deployment_name)
-        for pod in pods:
-            ContainerInstance.objects.create(
-                container=container,
-                instance_id=pod['id'],
-                pod_name=pod['name'],
-                pod_ip=pod['ip'],
-                port=config.get('port', 8080)
-            )
-        
-        return container
+        return request_provisioning(user, config)
 
     @staticmethod
     def destroy_user_container(user_id: str) -> bool:
@@ -111,6 +73,29 @@ class ContainerService:
         
         return True
 
+    @staticmethod
+    def scale_idle_containers(idle_minutes: int = None) -> int:
+        """将超过空闲时长无访问的容器缩容到零，返回缩容数量（请求到达时由网关冷启动恢复）"""
+        idle_minutes = idle_minutes or getattr(settings, 'SCALE_TO_ZERO_IDLE_MINUTES', 30)
+        cutoff = timezone.now() - timezone.timedelta(minutes=idle_minutes)
+        idle_containers = UserContainer.objects.filter(status='running', replicas__gt=0).filter(
+            Q(last_accessed__lt=cutoff) | Q(last_accessed__isnull=True, created_at__lt=cutoff)
+        ).values_list('id', 'deployment_name')
+
+        orchestrator = ContainerOrchestrator()
+        stopped = []
+        for container_id, deployment_name in idle_containers:
+            try:
+                orchestrator.stop_deployment(deployment_name)
+                stopped.append(container_id)
+            except Exception as e:
+                logger.warning(f"Failed to scale idle deployment {deployment_name} to zero: {e}")
+
+        if stopped:
+            UserContainer.objects.filter(id__in=stopped).update(status='stopped', replicas=0, ready_replicas=0)
+        logger.info(f"Scaled {len(stopped)} idle containers to zero")
+        return len(stopped)
+
     @staticmethod
     def get_container_status(container_id: str) -> dict:
         """查询容器实时状态"""
@@ -1,11 +1,71 @@
 from celery import shared_task
+from django.conf import settings
 from .services import ContainerService
+from .orchestrator import ContainerOrchestrator
+from .tenant_resources import DEFAULT_RESOURCES, container_resources
+from .warm_pool import WarmPool
+from .provisioning import ContainerProvisioner, deployment_watcher, DEPLOYING, FAILED
+from .reconciler import ContainerReconciler
 from ..userdb.models import UserContainer
 
 @shared_task
 def monitor_container_status():
-    """定期监控所有容器状态"""
-    for container in UserContainer.objects.all():
-        ContainerService.get_container_status(container.id)
-    return "容器状态监控完成"
+    """全量对账所有容器状态（一次list调用 + 批量写回），同时确保watch增量对账在运行"""
+    deployment_watcher.start()
+    changed = ContainerReconciler().reconcile()
+    return f"容器状态监控完成，{changed} 个容器状态变化"
 
+
+@shared_task
+def scale_idle_containers():
+    """将空闲容器缩容到零"""
+    count = ContainerService.scale_idle_containers()
+    return f"缩容空闲容器 {count} 个"
+
+
+@shared_task
+def maintain_warm_pool():
+    """按注册速率调整预热池大小并回收已交接的认领Pod"""
+    deployment_watcher.start()
+    return WarmPool().reconcile()
+
+
+@shared_task
+def apply_tenant_resources(container_ids=None):
+    """按当前模板批量重新应用租户资源（模板变更后滚动到所有租户）"""
+    queryset = UserContainer.objects.exclude(status__in=['destroying', FAILED])
+    if container_ids:
+        queryset = queryset.filter(id__in=container_ids)
+    tenants = [
+        (container.user_id, str(container.user_id), container_resources(container))
+        for container in queryset.only('user_id', *DEFAULT_RESOURCES)
+    ]
+    errors = ContainerOrchestrator().apply_tenant_resources(tenants)
+    failed = sum(1 for error in errors.values() if error is not None)
+    return f"应用租户资源 {len(errors)} 个，失败 {failed} 个"
+
+
+@shared_task(bind=True, max_retries=None)
+def provision_container(self, container_id):
+    """推进容器开通状态机：未就绪时定时复查，K8s调用失败时退避重试"""
+    # 就绪事件主要由watch推动，定时复查只是兜底
+    deployment_watcher.start()
+    provisioner = ContainerProvisioner()
+    try:
+        state = provisioner.advance(container_id)
+    except UserContainer.DoesNotExist:
+        return None
+    except Exception as e:
+        if self.request.retries >= getattr(settings, 'PROVISIONING_MAX_RETRIES', 5):
+            provisioner.mark_failed(container_id, str(e))
+            return FAILED
+        raise self.retry(exc=e, countdown=min(2 ** self.request.retries, 60))
+
+    if state == DEPLOYING:
+        if provisioner.timed_out(container_id):
+            provisioner.mark_failed(container_id, 'Timed out waiting for ready pods')
+            return FAILED
+        provision_container.apply_async(
+            (container_id,), countdown=getattr(settings, 'PROVISIONING_POLL_INTERVAL', 15)
+        )
+    return state
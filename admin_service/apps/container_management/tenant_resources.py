@@ -0,0 +1,49 @@
+import string
+from functools import lru_cache
+from typing import Dict, List
+
+import yaml
+from django.conf import settings
+
+DEPLOYMENT_PREFIX = "user-container-dep-"
+SERVICE_PREFIX = "user-container-svc-"
+HPA_PREFIX = "user-container-hpa-"
+
+# 模板占位符 -> UserContainer字段
+RESOURCE_PLACEHOLDERS = {
+    'CPU_REQUEST': 'cpu_request',
+    'MEMORY_REQUEST': 'memory_request',
+    'CPU_LIMIT': 'cpu_limit',
+    'MEMORY_LIMIT': 'memory_limit',
+}
+
+# 与UserContainer字段默认值一致
+DEFAULT_RESOURCES = {
+    'cpu_request': '500m',
+    'memory_request': '1Gi',
+    'cpu_limit': '1000m',
+    'memory_limit': '2Gi',
+}
+
+
+@lru_cache(maxsize=None)
+def _load_template(path: str) -> string.Template:
+    with open(path, encoding='utf-8') as f:
+        return string.Template(f.read())
+
+
+def container_resources(container) -> Dict[str, str]:
+    """UserContainer中保存的租户资源配额"""
+    return {field: getattr(container, field) for field in DEFAULT_RESOURCES}
+
+
+def render_tenant_resources(user_id, tenant_id, resources: Dict[str, str] = None) -> List[dict]:
+    """按user-container-template.yaml渲染租户的Deployment、Service和HPA，资源配额缺省时取字段默认值"""
+    resources = {**DEFAULT_RESOURCES, **{k: v for k, v in (resources or {}).items() if v}}
+    template = _load_template(str(settings.USER_CONTAINER_TEMPLATE))
+    text = template.substitute(
+        USER_ID=str(user_id),
+        TENANT_ID=str(tenant_id),
+        **{placeholder: resources[field] for placeholder, field in RESOURCE_PLACEHOLDERS.items()}
+    )
+    return [document for document in yaml.safe_load_all(text) if document]
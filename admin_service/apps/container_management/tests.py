@@ -16,4 +16,75 @@ class ContainerManagementTests(TestCase):
         self.assertIsInstance(container, UserContainer)
         self.assertEqual(container.user, self.user)
 
+
+class ProvisioningRequestTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username="provision", email="provision@example.com")
+
+    def test_request_is_idempotent(self):
+        """测试重复登记开通请求返回同一容器且状态为requested"""
+        from .provisioning import request_provisioning, provisioning_state
+        first = request_provisioning(self.user, {"cpu_limit": "500m"})
+        second = request_provisioning(self.user)
+        self.assertEqual(first.id, second.id)
+        self.assertEqual(provisioning_state(second), 'requested')
+        self.assertEqual(first.cpu_limit, "500m")
+
+
+class WarmPoolSizeTests(TestCase):
+    def test_target_size_follows_signup_rate(self):
+        """测试预热池大小随注册速率变化并受上下限约束"""
+        from .warm_pool import compute_target_size
+        self.assertEqual(compute_target_size(0, 60, 5, 2, 50), 2)
+        self.assertEqual(compute_target_size(120, 60, 5, 2, 50), 10)
+        self.assertEqual(compute_target_size(6000, 60, 5, 2, 50), 50)
+
+
+class WarmPoolSpecTests(TestCase):
+    def test_deployment_spec_from_template(self):
+        """测试预热池Deployment由租户模板渲染，且不带租户环境变量"""
+        from .tenant_resources import render_tenant_resources
+        from .warm_pool import WarmPool, WARM_LABELS
+        spec = WarmPool._deployment_spec(3)
+        tenant = render_tenant_resources(7, 7)[0]
+        container = spec["spec"]["template"]["spec"]["containers"][0]
+        tenant_container = tenant["spec"]["template"]["spec"]["containers"][0]
+        self.assertEqual(spec["spec"]["replicas"], 3)
+        self.assertEqual(spec["spec"]["selector"]["matchLabels"], WARM_LABELS)
+        self.assertEqual(container["image"], tenant_container["image"])
+        self.assertEqual(container["readinessProbe"], tenant_container["readinessProbe"])
+        self.assertNotIn("USER_ID", {env["name"] for env in container["env"]})
+        self.assertEqual(container["volumeMounts"], tenant_container["volumeMounts"])
+
+
+class ReconcilerStatusTests(TestCase):
+    def test_observed_status(self):
+        """测试由副本数推导容器状态"""
+        from .reconciler import observed_status
+        self.assertEqual(observed_status(0, 0), 'stopped')
+        self.assertEqual(observed_status(1, 1), 'running')
+        self.assertIsNone(observed_status(2, 0))
+        self.assertEqual(observed_status(2, 0, failed=True), 'error')
+        self.assertEqual(observed_status(2, 0, failed=True, tenant_pod_ready=True), 'running')
+
+
+class TenantResourceTemplateTests(TestCase):
+    def test_render_tenant_resources(self):
+        """测试模板渲染出的HPA指向租户Deployment，且不声明副本数"""
+        from .tenant_resources import render_tenant_resources
+        deployment, service, hpa = render_tenant_resources(7, 7)
+        self.assertEqual(deployment["metadata"]["name"], "user-container-dep-7")
+        self.assertNotIn("replicas", deployment["spec"])
+        self.assertEqual(service["spec"]["selector"], {"app": "user-container", "tenant": "7"})
+        self.assertEqual(hpa["spec"]["scaleTargetRef"]["name"], deployment["metadata"]["name"])
+
+    def test_render_tenant_resource_limits(self):
+        """测试容器资源配额来自租户配置，缺省时取字段默认值"""
+        from .tenant_resources import render_tenant_resources
+        deployment, _, _ = render_tenant_resources(7, 7, {'cpu_limit': '2000m', 'memory_limit': None})
+        resources = deployment["spec"]["template"]["spec"]["containers"][0]["resources"]
+        self.assertEqual(resources["limits"], {"cpu": "2000m", "memory": "2Gi"})
+        self.assertEqual(resources["requests"], {"cpu": "500m", "memory": "1Gi"})
+
 # Create your tests here.
+
@@ -0,0 +1,137 @@
+import logging
+import math
+from typing import Dict, Optional
+
+from django.conf import settings
+from django.utils import timezone
+from kubernetes.client.exceptions import ApiException
+from ..userdb.models import User
+from .k8s_client import K8sClient
+from .tenant_resources import render_tenant_resources
+
+logger = logging.getLogger(__name__)
+
+WARM_POOL_DEPLOYMENT = "user-container-warm-pool"
+WARM_LABELS = {"app": "user-container", "pool": "warm"}
+# 预热Pod没有租户环境变量，不能在启动后补写
+TENANT_ENV = ("USER_ID", "TENANT_ID")
+
+
+def compute_target_size(signups: int, window_minutes: float, lead_minutes: float,
+                        min_size: int, max_size: int) -> int:
+    """按注册速率计算预热池大小：覆盖一个补充周期（新Pod拉镜像到就绪）内的预期注册数"""
+    rate = signups / window_minutes if window_minutes > 0 else 0
+    return max(min_size, min(max_size, math.ceil(rate * lead_minutes)))
+
+
+def _is_ready(pod) -> bool:
+    if pod.metadata.deletion_timestamp or pod.status.phase != 'Running':
+        return False
+    return any(c.type == 'Ready' and c.status == 'True' for c in pod.status.conditions or [])
+
+
+class WarmPool:
+    """预热的通用用户容器池
+
+    池由一个selector为app=user-container,pool=warm的Deployment维持。新用户注册时
+    选一个已就绪的Pod改标签为pool=claimed,tenant=<tenant_id>：Pod脱离池的ReplicaSet
+    （ReplicaSet随即异步补充一个新Pod），同时被租户Service选中，无需等待拉镜像和启动探针。
+    租户自己的Deployment就绪后，认领的Pod由reconcile删除。
+    Pod的环境变量在启动后不可修改，认领时把租户写入注解，容器经downward API卷
+    （/etc/podinfo/annotations）读取，与租户Deployment的Pod注解一致。
+    """
+
+    def __init__(self, k8s_client: K8sClient = None):
+        self.k8s_client = k8s_client or K8sClient()
+
+    def claim(self, tenant_id: str, user_id: str) -> Optional[Dict]:
+        """认领一个就绪的预热Pod，池为空时返回None"""
+        try:
+            pods = self.k8s_client.list_pods("app=user-container,pool=warm")
+        except ApiException as e:
+            logger.warning(f"Failed to list warm pool pods: {e}")
+            return None
+
+        for pod in pods:
+            if not _is_ready(pod):
+                continue
+            try:
+                # 带resourceVersion修改，并发认领同一Pod时只有一方成功(其余409)
+                self.k8s_client.patch_pod(pod.metadata.name, {
+                    "metadata": {
+                        "resourceVersion": pod.metadata.resource_version,
+                        "labels": {"pool": "claimed", "tenant": str(tenant_id)},
+                        "annotations": {
+                            "user-container/user-id": str(user_id),
+                            "user-container/tenant-id": str(tenant_id),
+                            "user-container/claimed-at": timezone.now().isoformat(),
+                        },
+                    }
+                })
+            except ApiException as e:
+                if e.status in (404, 409):
+                    continue
+                logger.warning(f"Failed to claim warm pod {pod.metadata.name}: {e}")
+                continue
+            logger.info(f"Claimed warm pod {pod.metadata.name} for tenant {tenant_id}")
+            return {"id": pod.metadata.uid, "name": pod.metadata.name, "ip": pod.status.pod_ip}
+        return None
+
+    def target_size(self) -> int:
+        window = getattr(settings, 'WARM_POOL_RATE_WINDOW_MINUTES', 60)
+        signups = User.objects.filter(
+            created_at__gte=timezone.now() - timezone.timedelta(minutes=window)
+        ).count()
+        return compute_target_size(
+            signups, window,
+            getattr(settings, 'WARM_POOL_LEAD_MINUTES', 5),
+            getattr(settings, 'WARM_POOL_MIN_SIZE', 2),
+            getattr(settings, 'WARM_POOL_MAX_SIZE', 50)
+        )
+
+    def reconcile(self) -> Dict:
+        """按注册速率调整池大小，并回收已由租户Deployment接管的认领Pod"""
+        size = self.target_size()
+        try:
+            self.k8s_client.scale_deployment(WARM_POOL_DEPLOYMENT, replicas=size)
+        except ApiException as e:
+            if e.status != 404:
+                raise
+            self.k8s_client.create_deployment(WARM_POOL_DEPLOYMENT, self._deployment_spec(size))
+
+        released = 0
+        claimed = self.k8s_client.list_pods("app=user-container,pool=claimed")
+        if claimed:
+            ready = {
+                deployment.metadata.name
+                for deployment in self.k8s_client.list_deployments()
+                if (deployment.status.ready_replicas or 0) >= 1
+            }
+            for pod in claimed:
+                tenant_id = pod.metadata.labels.get("tenant")
+                if f"user-container-dep-{tenant_id}" not in ready:
+                    continue
+                try:
+                    self.k8s_client.delete_pod(pod.metadata.name)
+                    released += 1
+                except ApiException as e:
+                    if e.status != 404:
+                        logger.warning(f"Failed to release claimed pod {pod.metadata.name}: {e}")
+
+        logger.info(f"Warm pool reconciled: size={size}, released={released}")
+        return {"size": size, "released": released}
+
+    @staticmethod
+    def _deployment_spec(replicas: int) -> dict:
+        """预热池Deployment：由用户容器模板渲染（镜像、端口、探针、资源与租户一致），去掉租户相关的部分"""
+        deployment = next(
+            document for document in render_tenant_resources('', 'warm') if document['kind'] == 'Deployment'
+        )
+        template = deployment['spec']['template']
+        template['metadata'] = {'labels': dict(WARM_LABELS)}
+        for container in template['spec']['containers']:
+            container['env'] = [env for env in container.get('env', []) if env['name'] not in TENANT_ENV]
+        deployment['metadata'] = {'name': WARM_POOL_DEPLOYMENT, 'labels': dict(WARM_LABELS)}
+        deployment['spec']['replicas'] = replicas
+        deployment['spec']['selector'] = {'matchLabels': dict(WARM_LABELS)}
+        return deployment
@@ -1,5 +1,8 @@
+from collections import defaultdict
 from django.utils import timezone
-from userdb.models import AlertRule, ContainerInstance
+from userdb.models import AlertRule, ContainerInstance, RouteRegistry, MetricRollupMinute
+from .retention import ROLLUP_FIELDS, floor_time
+from .rules import STEP, compile_for, evaluate, is_detector_rule, lookback
 import logging
 import requests 
 from django.conf import settings  
@@ -10,20 +13,56 @@ class AlertManager:
     """警报管理器"""
     
     def check_alerts(self):
-        """执行警报检查"""
-        active_rules = AlertRule.objects.filter(is_active=True)
-        for rule in active_rules:
-            self._evaluate_rule(rule)
-    
-    def _evaluate_rule(self, rule):
-        """评估单个警报规则"""
-        try:
+        """执行警报检查：编译所有激活规则，一次查询加载所需的分钟聚合，逐规则在内存中评估"""
+        rules = []
+        for rule in AlertRule.objects.filter(is_active=True).select_related('container_instance'):
+            # 异常检测规则由AnomalyDetector在采集周期内触发和解除
+            if is_detector_rule(rule):
+                continue
+            compiled = compile_for(rule)
+            if compiled is None:
+                logger.debug(f"跳过无法解析的警报规则 {rule.id}: {rule.trigger_condition}")
+                continue
+            rules.append((rule, compiled))
+        if not rules:
+            return
+
+        route_ids = dict(RouteRegistry.objects.filter(
+            container_id__in={rule.container_instance.container_id for rule, _ in rules}
+        ).values_list('container_id', 'id'))
+
+        def object_id(rule, compiled):
             instance = rule.container_instance
-            condition_met = eval(rule.trigger_condition, {
-                'instance': instance,
-                'health_checks': instance.health_records.all()
-            })
-            
+            if compiled.scope == 'instance':
+                return instance.id
+            if compiled.scope == 'container':
+                return instance.container_id
+            return route_ids.get(instance.container_id)
+
+        targets = [(rule, compiled, object_id(rule, compiled)) for rule, compiled in rules]
+        # 只评估降采样已完成的时间桶
+        end = floor_time(
+            timezone.now() - timezone.timedelta(seconds=getattr(settings, 'METRICS_ROLLUP_LATENESS_SECONDS', 120)),
+            STEP
+        )
+        since = end - max(lookback(compiled) for _, compiled, _ in targets)
+
+        buckets = defaultdict(list)
+        rows = MetricRollupMinute.objects.filter(
+            series__in={compiled.series for _, compiled, _ in targets},
+            object_id__in={target for _, _, target in targets if target is not None},
+            bucket__gte=since,
+            bucket__lt=end
+        ).order_by('bucket').values_list('series', 'object_id', 'bucket', *ROLLUP_FIELDS)
+        for series, target, bucket, *summary in rows:
+            buckets[(series, target)].append((bucket, tuple(summary)))
+
+        for rule, compiled, target in targets:
+            self._evaluate_rule(rule, evaluate(compiled, buckets.get((compiled.series, target), []), end))
+
+    def _evaluate_rule(self, rule, condition_met):
+        """按评估结果切换单个警报规则的状态"""
+        try:
             if condition_met and not rule.triggered_at:
                 self._trigger_alert(rule)
             elif not condition_met and rule.triggered_at:
@@ -56,7 +95,11 @@ class AlertManager:
             'container_cpu': 'cpu',
             'container_memory': 'memory',
             'route_latency': 'network',
-            'instance_health': 'health'
+            'instance_health': 'health',
+            'cpu_trend': 'cpu',
+            'cpu_anomaly': 'cpu',
+            'memory_trend': 'memory',
+            'memory_anomaly': 'memory',
         }
         return mapping.get(rule_type, 'health')
         
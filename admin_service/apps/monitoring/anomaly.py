@@ -0,0 +1,170 @@
+import json
+import logging
+import math
+from collections import defaultdict
+from typing import Dict, Optional, Sequence, Tuple
+
+import numpy as np
+from django.conf import settings
+from django.utils import timezone
+from userdb.models import AlertRule, ContainerInstance, ContainerMetric
+from .rules import DETECTOR_CONDITION
+
+logger = logging.getLogger(__name__)
+
+# 检测的序列 -> ContainerMetric字段
+SERIES_FIELDS = {'cpu': 'cpu_usage', 'memory': 'memory_usage'}
+SERIES_NAMES = {'cpu': 'CPU使用率', 'memory': '内存使用率'}
+
+
+def update_state(state: Optional[Dict], value: float, alpha: float, beta: float) -> Tuple[Dict, float]:
+    """用一个新样本增量更新状态，返回(新状态, 样本相对更新前均值的z分数)
+
+    状态只有常数个字段：EWMA均值/方差用于突变检测，Holt线性平滑的水平/趋势用于趋势检测。
+    """
+    if state is None:
+        return {'n': 1, 'mean': value, 'var': 0.0, 'level': value, 'trend': 0.0}, 0.0
+    diff = value - state['mean']
+    std = math.sqrt(state['var'])
+    z = diff / std if std > 0 else 0.0
+    increment = alpha * diff
+    level = alpha * value + (1 - alpha) * (state['level'] + state['trend'])
+    return {
+        'n': state['n'] + 1,
+        'mean': state['mean'] + increment,
+        'var': (1 - alpha) * (state['var'] + diff * increment),
+        'level': level,
+        'trend': beta * (level - state['level']) + (1 - beta) * state['trend'],
+    }, z
+
+
+def backfill_state(values: Sequence[float], alpha: float) -> Optional[Dict]:
+    """由一段历史样本批量计算状态（无状态时回填），均值/方差按EWMA权重，趋势取最小二乘斜率"""
+    x = np.asarray(values, dtype=float)
+    n = len(x)
+    if n == 0:
+        return None
+    weights = (1 - alpha) ** np.arange(n - 1, -1, -1)
+    weights /= weights.sum()
+    mean = float(np.dot(weights, x))
+    var = float(np.dot(weights, (x - mean) ** 2))
+    if n >= 2:
+        slope, intercept = np.polyfit(np.arange(n), x, 1)
+    else:
+        slope, intercept = 0.0, x[0]
+    return {'n': n, 'mean': mean, 'var': var, 'level': float(intercept + slope * (n - 1)), 'trend': float(slope)}
+
+
+class AnomalyDetector:
+    """容器资源的流式异常检测
+
+    每个容器每个序列在Redis中保存常数大小的状态，每个采集周期只用新样本更新，
+    不再回读历史；状态缺失（新容器或Redis清空）时一次查询回填。
+    同一实例同一序列只保留一条告警规则，条件消失时解除。
+    """
+
+    STATE_PREFIX = "monitoring:anomaly"
+
+    def __init__(self, redis_client, alert_manager):
+        self.redis_client = redis_client
+        self.alert_manager = alert_manager
+        self.alpha = getattr(settings, 'ANOMALY_EWMA_ALPHA', 0.1)
+        self.beta = getattr(settings, 'ANOMALY_TREND_BETA', 0.1)
+        self.z_threshold = getattr(settings, 'ANOMALY_Z_THRESHOLD', 3.0)
+        self.warmup = getattr(settings, 'ANOMALY_WARMUP_SAMPLES', 10)
+        self.trend_threshold = getattr(settings, 'ANOMALY_TREND_THRESHOLD', 0.1)
+        self.level_threshold = getattr(settings, 'ANOMALY_LEVEL_THRESHOLD', 80)
+        self.state_ttl = getattr(settings, 'ANOMALY_STATE_TTL', 86400)
+
+    def observe(self, samples: Dict[int, Dict[str, float]]) -> Dict[Tuple[int, str], Dict]:
+        """用本周期的样本更新状态，返回每个(容器, 序列)检测到的异常（无异常为空dict）"""
+        keys = [(container_id, series) for container_id in samples for series in SERIES_FIELDS]
+        if not keys:
+            return {}
+        raw_states = self.redis_client.mget([self._state_key(*key) for key in keys])
+        states = {key: json.loads(raw) for key, raw in zip(keys, raw_states) if raw}
+        missing = {container_id for container_id, series in keys if (container_id, series) not in states}
+        if missing:
+            states.update(self._backfill(missing))
+
+        findings = {}
+        pipeline = self.redis_client.pipeline(transaction=False)
+        for container_id, series in keys:
+            value = samples[container_id][series]
+            state, z = update_state(states.get((container_id, series)), value, self.alpha, self.beta)
+            pipeline.set(self._state_key(container_id, series), json.dumps(state), ex=self.state_ttl)
+
+            finding = {}
+            if state['n'] > self.warmup:
+                if abs(z) > self.z_threshold:
+                    finding['anomaly'] = z
+                if state['trend'] > self.trend_threshold and value > self.level_threshold:
+                    finding['trend'] = state['trend']
+            finding['value'] = value
+            findings[(container_id, series)] = finding
+        pipeline.execute()
+        return findings
+
+    def raise_alerts(self, findings: Dict[Tuple[int, str], Dict]):
+        """按实例和序列去重地触发或解除告警"""
+        container_ids = {container_id for container_id, _ in findings}
+        instances = defaultdict(list)
+        for instance in ContainerInstance.objects.filter(container_id__in=container_ids, is_healthy=True):
+            instances[instance.container_id].append(instance)
+        rule_types = [f'{series}_{kind}' for series in SERIES_FIELDS for kind in ('trend', 'anomaly')]
+        existing = {
+            (rule.container_instance_id, rule.rule_type): rule
+            for rule in AlertRule.objects.filter(
+                container_instance__container_id__in=container_ids, rule_type__in=rule_types, is_active=True
+            ).select_related('container_instance')
+        }
+
+        for (container_id, series), finding in findings.items():
+            for instance in instances.get(container_id, []):
+                for kind in ('trend', 'anomaly'):
+                    rule = existing.get((instance.id, f'{series}_{kind}'))
+                    if kind in finding:
+                        if rule is None:
+                            rule = AlertRule.objects.create(
+                                container_instance=instance,
+                                level='warning',
+                                rule_type=f'{series}_{kind}',
+                                threshold=self.level_threshold if kind == 'trend' else self.z_threshold,
+                                trigger_condition=DETECTOR_CONDITION,
+                                message=self._describe(series, kind, finding),
+                                is_active=True
+                            )
+                        if not rule.triggered_at:
+                            self.alert_manager._trigger_alert(rule)
+                    elif rule is not None and rule.triggered_at:
+                        self.alert_manager._resolve_alert(rule)
+
+    def _backfill(self, container_ids) -> Dict[Tuple[int, str], Dict]:
+        """一次查询最近的历史样本，批量计算缺失的状态"""
+        since = timezone.now() - timezone.timedelta(minutes=getattr(settings, 'ANOMALY_BACKFILL_MINUTES', 60))
+        history = defaultdict(lambda: defaultdict(list))
+        rows = ContainerMetric.objects.filter(
+            container_id__in=container_ids, timestamp__gte=since
+        ).order_by('timestamp').values_list('container_id', *SERIES_FIELDS.values())
+        for container_id, *values in rows:
+            for series, value in zip(SERIES_FIELDS, values):
+                history[container_id][series].append(value)
+
+        states = {}
+        for container_id, series_values in history.items():
+            for series, values in series_values.items():
+                # 最新一个样本是本周期刚写入的，留给增量更新
+                state = backfill_state(values[:-1], self.alpha)
+                if state is not None:
+                    states[(container_id, series)] = state
+        return states
+
+    def _state_key(self, container_id: int, series: str) -> str:
+        return f"{self.STATE_PREFIX}:{container_id}:{series}"
+
+    @staticmethod
+    def _describe(series: str, kind: str, finding: Dict) -> str:
+        name = SERIES_NAMES[series]
+        if kind == 'trend':
+            return f'{name}持续上升，当前{finding["value"]:.2f}%，趋势{finding["trend"]:.2f}%/分钟'
+        return f'{name}突变，当前{finding["value"]:.2f}%，偏离均值{finding["anomaly"]:.1f}个标准差'
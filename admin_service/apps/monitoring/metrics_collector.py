@@ -1,21 +1,33 @@
+from collections import defaultdict
+from django.db.models import Count, Q
 from django.utils import timezone
-from userdb.models import ContainerInstance, RouteMetrics, HealthCheckRecord
+from userdb.models import ContainerInstance, HealthCheckRecord, ContainerMetric
 from .models import MonitoringConfig
 import logging
-from kubernetes import config, client
+from kubernetes import client
+from kubernetes.utils import parse_quantity
+from apps.container_management.k8s_client import get_api_client, get_request_timeout
 import redis
 
 logger = logging.getLogger(__name__)
 
+
+def usage_percent(usage: float, limit: str) -> float:
+    """用量占资源限制的百分比（用量为核数/字节数，限制为K8s数量字符串，如1000m、2Gi）"""
+    try:
+        limit_value = float(parse_quantity(limit))
+    except (TypeError, ValueError):
+        return 0.0
+    return round(usage / limit_value * 100, 2) if limit_value > 0 else 0.0
+
+
 class MetricsCollector:
     """指标采集器"""
     def __init__(self):
-        try:
-            config.load_incluster_config()
-        except config.ConfigException:
-            config.load_kube_config()
-        self.k8s_client = client.CoreV1Api()
-        self.metrics_client = client.CustomObjectsApi()
+        # 与容器管理共用进程内的ApiClient，不再每次实例化都解析配置
+        api_client = get_api_client()
+        self.k8s_client = client.CoreV1Api(api_client)
+        self.metrics_client = client.CustomObjectsApi(api_client)
         redis_config = MonitoringConfig.get_redis_config()
         self.redis_client = redis.Redis(
             host=redis_config['host'],
@@ -26,62 +38,92 @@ class MetricsCollector:
         )
 
     def collect_container_metrics(self):
-        """采集容器实例指标"""
-        instances = ContainerInstance.objects.all()
+        """采集容器实例指标，返回本周期各容器的资源使用率"""
+        instances = list(ContainerInstance.objects.select_related('container'))
+        self._update_instance_metrics(instances)
+        return self._collect_k8s_metrics(instances)
+
+    def _collect_k8s_metrics(self, instances):
+        """从K8s API批量采集容器指标：每个命名空间一次list，按Pod名关联实例，一次bulk_create写入"""
+        pods_by_namespace = defaultdict(dict)
         for instance in instances:
-            self._update_instance_metrics(instance)
-            self._collect_k8s_metrics(instance)
+            pods_by_namespace[instance.container.namespace][instance.pod_name] = instance
 
-    def _collect_k8s_metrics(self, instance):
-        """从K8s API采集容器指标"""
-        try:
-            # 获取Pod指标
-            metrics = self.metrics_client.list_namespaced_custom_object(
-                group="metrics.k8s.io",
-                version="v1beta1",
-                namespace=instance.container.namespace,
-                plural="pods"
-            )
+        # 同一容器的多个Pod合并为一条记录
+        usage = {}
+        for namespace, instances_by_pod in pods_by_namespace.items():
+            try:
+                metrics = self.metrics_client.list_namespaced_custom_object(
+                    group="metrics.k8s.io",
+                    version="v1beta1",
+                    namespace=namespace,
+                    plural="pods",
+                    _request_timeout=get_request_timeout()
+                )
+            except Exception as e:
+                logger.error(f"K8s指标采集失败({namespace}): {str(e)}")
+                continue
 
             for pod in metrics['items']:
-                if pod['metadata']['name'].startswith(instance.pod_name):
-                    for container in pod['containers']:
-                        cpu_usage = float(container['usage']['cpu'].replace('n', '')) / 10000000
-                        memory_usage = float(container['usage']['memory'].replace('Ki', '')) / 1024 / 1024
+                instance = instances_by_pod.get(pod['metadata']['name'])
+                if instance is None:
+                    continue
+                totals = usage.setdefault(instance.container_id, [instance.container, 0.0, 0.0])
+                for container in pod['containers']:
+                    totals[1] += float(parse_quantity(container['usage']['cpu']))
+                    totals[2] += float(parse_quantity(container['usage']['memory']))
 
-                        # 保存指标
-                        ContainerMetric.objects.create(
-                            container=instance.container,
-                            cpu_usage=cpu_usage,
-                            memory_usage=memory_usage,
-                            # 其他指标...
-                        )
-                        logger.info(f"成功采集实例 {instance.instance_id} 的K8s指标")
-        except Exception as e:
-            logger.error(f"K8s指标采集失败: {str(e)}")
+        now = timezone.now()
+        samples = {
+            container_id: {
+                'cpu': usage_percent(cpu, container.cpu_limit),
+                'memory': usage_percent(memory, container.memory_limit),
+            }
+            for container_id, (container, cpu, memory) in usage.items()
+        }
+        ContainerMetric.objects.bulk_create([
+            ContainerMetric(
+                container=container,
+                timestamp=now,
+                cpu_usage=samples[container_id]['cpu'],
+                memory_usage=samples[container_id]['memory'],
+                # metrics-server不提供磁盘与网络指标
+                disk_usage=0,
+                network_in=0,
+                network_out=0
+            )
+            for container_id, (container, _, _) in usage.items()
+        ], batch_size=500)
+        logger.info(f"成功采集 {len(usage)} 个容器的K8s指标")
+        return samples
     
-    def _update_instance_metrics(self, instance):
-        """更新单个实例指标"""
+    def _update_instance_metrics(self, instances):
+        """汇总最近5分钟的健康检查：一条分组查询统计所有实例，只bulk_update有变化的实例"""
         try:
-            # 获取最近5分钟的健康检查记录
-            health_checks = HealthCheckRecord.objects.filter(
-                container_instance=instance,
+            # 清除默认排序，否则timestamp会进入GROUP BY
+            rollup = HealthCheckRecord.objects.filter(
                 timestamp__gte=timezone.now() - timezone.timedelta(minutes=5)
+            ).order_by().values('container_instance').annotate(
+                success=Count('id', filter=Q(is_healthy=True)),
+                failure=Count('id', filter=Q(is_healthy=False))
             )
-            
-            # 计算健康状态
-            success_checks = health_checks.filter(is_healthy=True).count()
-            failure_checks = health_checks.filter(is_healthy=False).count()
-            
-            # 更新实例指标
-            instance.is_healthy = success_checks > failure_checks
-            instance.consecutive_failures = failure_checks
-            instance.current_connections = RouteMetrics.objects.filter(
-                route_registry__container=instance.container
-            ).aggregate(Sum('current_connections'))['current_connections__sum'] or 0
-            
-            instance.save()
-            logger.info(f"成功更新实例 {instance.instance_id} 指标")
+            counts = {row['container_instance']: (row['success'], row['failure']) for row in rollup}
+
+            now = timezone.now()
+            changed = []
+            for instance in instances:
+                success_checks, failure_checks = counts.get(instance.id, (0, 0))
+                is_healthy = success_checks > failure_checks
+                if (instance.is_healthy, instance.consecutive_failures) != (is_healthy, failure_checks):
+                    instance.is_healthy = is_healthy
+                    instance.consecutive_failures = failure_checks
+                    instance.updated_at = now
+                    changed.append(instance)
+
+            ContainerInstance.objects.bulk_update(
+                changed, ['is_healthy', 'consecutive_failures', 'updated_at'], batch_size=500
+            )
+            logger.info(f"成功更新 {len(changed)} 个实例指标")
             
         except Exception as e:
             logger.error(f"指标采集失败: {str(e)}")
@@ -129,7 +171,7 @@ class ResourceMonitor:
             defaults={
                 'threshold': 90,
                 'message': f'容器资源超限: {alert_type}',
-                'trigger_condition': f'instance.{alert_type}_usage > instance.{alert_type}_limit * 0.9',
+                'trigger_condition': f"avg({alert_type.split('_')[0]}[5m]) > 90",
                 'is_active': True
             }
         )
@@ -0,0 +1,244 @@
+import logging
+import math
+from collections import defaultdict
+from datetime import datetime, timedelta, timezone as dt_timezone
+from typing import Iterable, List, Optional, Tuple
+
+from django.conf import settings
+from django.db import connection
+from django.db.models import Min
+from django.utils import timezone
+from apps.userdb.models import (
+    ContainerMetric, HealthCheckRecord, RouteLog,
+    MetricRollupMinute, MetricRollupHour, MetricRollupDay, RollupWatermark
+)
+
+logger = logging.getLogger(__name__)
+
+# 指标序列：序列名 -> (原始表, 对象字段, 取值字段)
+SERIES = {
+    'container.cpu': (ContainerMetric, 'container_id', 'cpu_usage'),
+    'container.memory': (ContainerMetric, 'container_id', 'memory_usage'),
+    'health.healthy': (HealthCheckRecord, 'container_instance_id', 'is_healthy'),
+    'health.response_time': (HealthCheckRecord, 'container_instance_id', 'response_time'),
+    'route.response_time': (RouteLog, 'route_registry_id', 'response_time'),
+}
+
+# 聚合层级，从细到粗：每层由上一层（第一层由原始表）聚合而来
+TIERS = [
+    ('1m', MetricRollupMinute, timedelta(minutes=1)),
+    ('1h', MetricRollupHour, timedelta(hours=1)),
+    ('1d', MetricRollupDay, timedelta(days=1)),
+]
+TIER_MODELS = {resolution: model for resolution, model, _ in TIERS}
+
+# 聚合层保留期：粒度 -> (配置项, 默认天数)
+TIER_RETENTION = {
+    '1m': ('METRICS_MINUTE_RETENTION_DAYS', 14),
+    '1h': ('METRICS_HOUR_RETENTION_DAYS', 90),
+    '1d': ('METRICS_DAY_RETENTION_DAYS', 730),
+}
+
+ROLLUP_FIELDS = ['count', 'min_value', 'max_value', 'avg_value', 'p95_value']
+
+# (样本数, 最小值, 最大值, 平均值, P95)
+Summary = Tuple[int, float, float, float, float]
+
+
+def floor_time(value: datetime, size: timedelta) -> datetime:
+    """向下取整到桶边界（UTC）"""
+    seconds = size.total_seconds()
+    return datetime.fromtimestamp(value.timestamp() // seconds * seconds, tz=dt_timezone.utc)
+
+
+def summarize(values: List[float]) -> Summary:
+    """由原始样本计算聚合值（P95取最近秩）"""
+    values = sorted(values)
+    count = len(values)
+    return (
+        count, values[0], values[-1], sum(values) / count,
+        values[max(0, math.ceil(0.95 * count) - 1)]
+    )
+
+
+def merge(summaries: Iterable[Summary]) -> Summary:
+    """合并细粒度聚合值：P95为按样本数加权的细粒度P95的95分位（近似值）"""
+    summaries = list(summaries)
+    count = sum(s[0] for s in summaries)
+    rank = 0.95 * count
+    cumulative = 0
+    p95 = summaries[-1][4]
+    for s in sorted(summaries, key=lambda s: s[4]):
+        cumulative += s[0]
+        if cumulative >= rank:
+            p95 = s[4]
+            break
+    return (
+        count,
+        min(s[1] for s in summaries),
+        max(s[2] for s in summaries),
+        sum(s[3] * s[0] for s in summaries) / count,
+        p95
+    )
+
+
+def select_resolution(span: timedelta) -> Optional[str]:
+    """按查询时间范围选择数据层级，None表示读原始表"""
+    if span <= timedelta(hours=1):
+        return None
+    if span <= timedelta(days=1):
+        return '1m'
+    if span <= timedelta(days=30):
+        return '1h'
+    return '1d'
+
+
+class DataCleaner:
+    """监控数据的降采样与保留
+
+    原始表（ContainerMetric、HealthCheckRecord、RouteLog）按分钟聚合，分钟层再聚合为小时层、
+    小时层再聚合为天层，每层记录水位，重复执行只处理水位之后的完整时间桶。
+    过期数据按主键分批删除，且只删除已被上一层聚合过的部分。
+    """
+
+    def cleanup_old_data(self):
+        """降采样后清理过期数据"""
+        try:
+            self.rollup()
+        except Exception as e:
+            logger.error(f"指标降采样失败: {str(e)}")
+        try:
+            self.apply_retention()
+        except Exception as e:
+            logger.error(f"过期数据清理失败: {str(e)}")
+
+    def rollup(self) -> int:
+        """推进所有序列各层级的聚合，返回写入的聚合行数"""
+        now = timezone.now()
+        lateness = timedelta(seconds=getattr(settings, 'METRICS_ROLLUP_LATENESS_SECONDS', 120))
+        max_buckets = getattr(settings, 'METRICS_ROLLUP_MAX_BUCKETS', 60)
+        watermarks = {(w.series, w.resolution): w.position for w in RollupWatermark.objects.all()}
+
+        written = 0
+        for series in SERIES:
+            # 原始数据写入有延迟，只聚合lateness之前的时间桶
+            ready = now - lateness
+            for index, (resolution, model, size) in enumerate(TIERS):
+                end = floor_time(ready, size)
+                start = watermarks.get((series, resolution))
+                if start is None:
+                    start = self._initial_position(series, index, size) or end
+                end = min(end, start + size * max_buckets)
+                if end > start:
+                    if index == 0:
+                        rows = self._summarize_raw(series, start, end, size)
+                    else:
+                        rows = self._merge_tier(series, TIERS[index - 1][1], start, end, size)
+                    self._save(model, series, rows)
+                    written += len(rows)
+                    start = end
+                RollupWatermark.objects.update_or_create(
+                    series=series, resolution=resolution, defaults={'position': start}
+                )
+                # 下一层只能聚合到本层已完成的位置
+                ready = start
+        logger.info(f"指标降采样完成，写入 {written} 行")
+        return written
+
+    def apply_retention(self) -> int:
+        """分批删除过期的原始数据和聚合数据，返回删除行数"""
+        now = timezone.now()
+        watermarks = defaultdict(dict)
+        for w in RollupWatermark.objects.all():
+            watermarks[w.resolution][w.series] = w.position
+
+        deleted = 0
+        # 原始表：不晚于其所有序列的分钟层水位
+        raw_retention = timedelta(days=getattr(settings, 'METRICS_RAW_RETENTION_DAYS', 7))
+        for model in {source for source, _, _ in SERIES.values()}:
+            series = [name for name, (source, _, _) in SERIES.items() if source is model]
+            positions = [watermarks['1m'].get(name) for name in series]
+            if None in positions:
+                continue
+            cutoff = min([now - raw_retention] + positions)
+            deleted += self._delete_before(model, 'timestamp', cutoff)
+
+        # 聚合层：不晚于更粗一层的水位（最粗一层只按保留期）
+        for index, (resolution, model, _) in enumerate(TIERS):
+            setting, default_days = TIER_RETENTION[resolution]
+            cutoff = now - timedelta(days=getattr(settings, setting, default_days))
+            if index + 1 < len(TIERS):
+                positions = list(watermarks[TIERS[index + 1][0]].values())
+                if len(positions) < len(SERIES):
+                    continue
+                cutoff = min([cutoff] + positions)
+            deleted += self._delete_before(model, 'bucket', cutoff)
+
+        if deleted:
+            logger.info(f"清理过期监控数据 {deleted} 行")
+        return deleted
+
+    @staticmethod
+    def _initial_position(series: str, index: int, size: timedelta) -> Optional[datetime]:
+        """首次聚合的起点：源数据中最早的时间"""
+        if index == 0:
+            source, _, _ = SERIES[series]
+            earliest = source.objects.aggregate(earliest=Min('timestamp'))['earliest']
+        else:
+            earliest = TIERS[index - 1][1].objects.filter(series=series).aggregate(earliest=Min('bucket'))['earliest']
+        return floor_time(earliest, size) if earliest else None
+
+    @staticmethod
+    def _summarize_raw(series: str, start: datetime, end: datetime, size: timedelta) -> dict:
+        source, object_field, value_field = SERIES[series]
+        samples = defaultdict(list)
+        rows = source.objects.filter(
+            timestamp__gte=start, timestamp__lt=end, **{f'{value_field}__isnull': False}
+        ).order_by().values_list(object_field, 'timestamp', value_field)
+        for object_id, timestamp, value in rows.iterator(chunk_size=5000):
+            samples[(object_id, floor_time(timestamp, size))].append(float(value))
+        return {key: summarize(values) for key, values in samples.items()}
+
+    @staticmethod
+    def _merge_tier(series: str, source, start: datetime, end: datetime, size: timedelta) -> dict:
+        summaries = defaultdict(list)
+        rows = source.objects.filter(
+            series=series, bucket__gte=start, bucket__lt=end
+        ).values_list('object_id', 'bucket', *ROLLUP_FIELDS)
+        for object_id, bucket, *summary in rows.iterator(chunk_size=5000):
+            summaries[(object_id, floor_time(bucket, size))].append(tuple(summary))
+        return {key: merge(values) for key, values in summaries.items()}
+
+    @staticmethod
+    def _save(model, series: str, rows: dict):
+        """写入聚合行；重复执行同一时间桶时覆盖"""
+        if not rows:
+            return
+        # MySQL的ON DUPLICATE KEY UPDATE不接受冲突字段，其他数据库必须指定
+        unique_fields = None
+        if connection.features.supports_update_conflicts_with_target:
+            unique_fields = ['series', 'object_id', 'bucket']
+        model.objects.bulk_create(
+            [
+                model(series=series, object_id=object_id, bucket=bucket, **dict(zip(ROLLUP_FIELDS, summary)))
+                for (object_id, bucket), summary in rows.items()
+            ],
+            batch_size=1000,
+            update_conflicts=True,
+            unique_fields=unique_fields,
+            update_fields=ROLLUP_FIELDS
+        )
+
+    @staticmethod
+    def _delete_before(model, field: str, cutoff: datetime) -> int:
+        """按主键分批删除，单条DELETE影响行数有上限，不长时间持锁"""
+        batch_size = getattr(settings, 'METRICS_DELETE_BATCH_SIZE', 5000)
+        deleted = 0
+        for _ in range(getattr(settings, 'METRICS_DELETE_MAX_BATCHES', 20)):
+            ids = list(
+                model.objects.filter(**{f'{field}__lt': cutoff}).order_by().values_list('id', flat=True)[:batch_size]
+            )
+            if not ids:
+                break
+            deleted += model.objects.filter(id__in=ids).delete()[0]
+        return deleted
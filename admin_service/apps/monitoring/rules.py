@@ -0,0 +1,118 @@
+import operator
+import re
+from collections import namedtuple
+from datetime import datetime, timedelta
+from functools import lru_cache
+from typing import List, Optional, Tuple
+
+from .retention import merge
+
+# 规则语法：<聚合>(<指标>[<窗口>]) <比较符> <阈值> [for <持续时间>]
+# 例如：avg(cpu[5m]) > 80 for 10m、p95(latency[15m]) >= 500、min(health[10m]) < 1
+RULE_PATTERN = re.compile(
+    r'^\s*(?P<aggregate>avg|min|max|p95|count)\s*\(\s*(?P<metric>[a-z_]+)\s*\[\s*(?P<window>\d+[mhd])\s*\]\s*\)'
+    r'\s*(?P<comparator>>=|<=|==|!=|>|<)\s*(?P<threshold>-?\d+(?:\.\d+)?)'
+    r'(?:\s+for\s+(?P<duration>\d+[mhd]))?\s*$'
+)
+
+# 指标 -> (聚合序列, 对象类型)
+METRICS = {
+    'cpu': ('container.cpu', 'container'),
+    'memory': ('container.memory', 'container'),
+    'health': ('health.healthy', 'instance'),
+    'response_time': ('health.response_time', 'instance'),
+    'latency': ('route.response_time', 'route'),
+}
+
+COMPARATORS = {
+    '>': operator.gt, '>=': operator.ge, '<': operator.lt,
+    '<=': operator.le, '==': operator.eq, '!=': operator.ne,
+}
+
+# 聚合值在(样本数, 最小值, 最大值, 平均值, P95)中的位置
+AGGREGATES = {'count': 0, 'min': 1, 'max': 2, 'avg': 3, 'p95': 4}
+
+# 没有写成规则语法的旧规则按规则类型和阈值生成条件
+DEFAULT_CONDITIONS = {
+    'container_cpu': 'avg(cpu[5m]) > {threshold}',
+    'container_memory': 'avg(memory[5m]) > {threshold}',
+    'route_latency': 'p95(latency[5m]) > {threshold}',
+}
+
+# 由流式异常检测（anomaly.py）触发和解除的规则，check_alerts不按语法评估
+DETECTOR_CONDITION = 'detector'
+DETECTOR_RULE_TYPES = {'cpu_trend', 'cpu_anomaly', 'memory_trend', 'memory_anomaly'}
+
+STEP = timedelta(minutes=1)
+
+CompiledRule = namedtuple('CompiledRule', 'series scope aggregate window comparator threshold duration')
+
+
+class RuleSyntaxError(ValueError):
+    """告警规则语法错误"""
+
+
+def _parse_duration(value: str) -> timedelta:
+    unit = {'m': 'minutes', 'h': 'hours', 'd': 'days'}[value[-1]]
+    return timedelta(**{unit: int(value[:-1])})
+
+
+@lru_cache(maxsize=1024)
+def compile_rule(condition: str) -> CompiledRule:
+    """编译规则表达式（按表达式文本缓存，规则修改后自然使用新的编译结果）"""
+    match = RULE_PATTERN.match(condition or '')
+    if not match:
+        raise RuleSyntaxError(f"无法解析的告警规则: {condition}")
+    if match['metric'] not in METRICS:
+        raise RuleSyntaxError(f"未知指标: {match['metric']}")
+    window = _parse_duration(match['window'])
+    if window < STEP:
+        raise RuleSyntaxError(f"窗口不能小于1分钟: {condition}")
+    series, scope = METRICS[match['metric']]
+    return CompiledRule(
+        series=series,
+        scope=scope,
+        aggregate=AGGREGATES[match['aggregate']],
+        window=window,
+        comparator=COMPARATORS[match['comparator']],
+        threshold=float(match['threshold']),
+        duration=_parse_duration(match['duration']) if match['duration'] else timedelta(0)
+    )
+
+
+def is_detector_rule(rule) -> bool:
+    """是否为异常检测器维护的规则"""
+    return rule.trigger_condition == DETECTOR_CONDITION
+
+
+def compile_for(rule) -> Optional[CompiledRule]:
+    """编译AlertRule的条件，旧格式的条件退回到按规则类型生成的默认条件，都不可用时返回None"""
+    if is_detector_rule(rule):
+        return None
+    try:
+        return compile_rule(rule.trigger_condition)
+    except RuleSyntaxError:
+        default = DEFAULT_CONDITIONS.get(rule.rule_type)
+        return compile_rule(default.format(threshold=rule.threshold)) if default else None
+
+
+def lookback(rule: CompiledRule) -> timedelta:
+    """评估规则需要的历史数据长度"""
+    return rule.window + rule.duration
+
+
+def evaluate(rule: CompiledRule, buckets: List[Tuple[datetime, tuple]], end: datetime) -> bool:
+    """在按时间排序的分钟聚合上评估规则
+
+    for持续时间内每分钟的窗口都满足条件才算触发；窗口内没有数据视为不满足。
+    """
+    steps = int(rule.duration / STEP)
+    for step in range(steps + 1):
+        window_end = end - STEP * step
+        window_start = window_end - rule.window
+        summaries = [summary for bucket, summary in buckets if window_start <= bucket < window_end]
+        if not summaries:
+            return False
+        if not rule.comparator(merge(summaries)[rule.aggregate], rule.threshold):
+            return False
+    return True
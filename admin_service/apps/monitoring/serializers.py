@@ -1,5 +1,6 @@
 from rest_framework import serializers
 from apps.userdb.models import ContainerInstance, AlertRule
+from .rules import DETECTOR_CONDITION, DETECTOR_RULE_TYPES, RuleSyntaxError, compile_rule
 
 class ContainerMetricsSerializer(serializers.Serializer):
     cpu_usage = serializers.CharField(read_only=True)
@@ -18,4 +19,22 @@ class AlertRuleSerializer(serializers.ModelSerializer):
         extra_kwargs = {
             'container_id': {'required': True},
             'created_at': {'read_only': True}
-        }
\ No newline at end of file
+        }
+
+    def validate_trigger_condition(self, value):
+        """规则条件必须符合告警规则语法（异常检测规则为固定标记）"""
+        if value == DETECTOR_CONDITION:
+            return value
+        try:
+            compile_rule(value)
+        except RuleSyntaxError as e:
+            raise serializers.ValidationError(str(e))
+        return value
+
+    def validate(self, attrs):
+        """异常检测标记只能用于异常检测规则类型"""
+        rule_type = attrs.get('rule_type', getattr(self.instance, 'rule_type', None))
+        condition = attrs.get('trigger_condition', getattr(self.instance, 'trigger_condition', None))
+        if (condition == DETECTOR_CONDITION) != (rule_type in DETECTOR_RULE_TYPES):
+            raise serializers.ValidationError({'trigger_condition': '异常检测规则类型必须且只能使用detector条件'})
+        return attrs
@@ -2,7 +2,9 @@ from .metrics_collector import MetricsCollector, ResourceMonitor
 from .alert_manager import AlertManager
 from django.utils import timezone
 from .models import AlertRule
-from apps.userdb.models import ContainerInstance, RouteMetrics
+from apps.userdb.models import ContainerInstance, RouteMetrics, UserContainer, ContainerMetric, ResourceAlert
+from .retention import DataCleaner, TIER_MODELS, select_resolution
+from .anomaly import AnomalyDetector
 from shared_models.userdb.models import BusinessErrorLog  # 添加缺失的导入
 from django.db.models import Avg, Max  
 
@@ -12,17 +14,18 @@ class MonitoringService:
         self.resource_monitor = ResourceMonitor()
         self.alert_manager = AlertManager()
         self.db_cleaner = DataCleaner()
+        self.anomaly_detector = AnomalyDetector(self.metrics_collector.redis_client, self.alert_manager)
 
     def run_monitoring_cycle(self):
         """执行完整监控周期"""
         # 1. 采集指标
-        self.metrics_collector.collect_container_metrics()
+        samples = self.metrics_collector.collect_container_metrics()
         # 2. 检查资源使用
         self.resource_monitor.check_resource_usage()
         # 3. 检查业务异常
         self.check_business_errors()
         # 新增: 分析资源趋势
-        self.analyze_resource_trends()
+        self.analyze_resource_trends(samples)
         # 4. 评估告警规则
         self.alert_manager.check_alerts()
         # 5. 清理历史数据
@@ -68,17 +71,31 @@ class MonitoringService:
                     )
 
     @staticmethod
-    def get_container_dashboard_data(container_id):
-        """获取容器监控面板数据"""
+    def get_container_dashboard_data(container_id, hours=24):
+        """获取容器监控面板数据（按时间范围选择原始数据或降采样层级）"""
         container = UserContainer.objects.get(id=container_id)
-        recent_metrics = ContainerMetric.objects.filter(
-            container=container,
-            timestamp__gte=timezone.now() - timezone.timedelta(hours=24)
-        ).order_by('timestamp')
+        span = timezone.timedelta(hours=hours)
+        since = timezone.now() - span
+        resolution = select_resolution(span)
 
         # 格式化图表数据
-        cpu_data = [{'x': m.timestamp.isoformat(), 'y': m.cpu_usage} for m in recent_metrics]
-        memory_data = [{'x': m.timestamp.isoformat(), 'y': m.memory_usage} for m in recent_metrics]
+        if resolution is None:
+            recent_metrics = ContainerMetric.objects.filter(
+                container=container,
+                timestamp__gte=since
+            ).order_by('timestamp')
+            cpu_data = [{'x': m.timestamp.isoformat(), 'y': m.cpu_usage} for m in recent_metrics]
+            memory_data = [{'x': m.timestamp.isoformat(), 'y': m.memory_usage} for m in recent_metrics]
+        else:
+            points = {'container.cpu': [], 'container.memory': []}
+            rollups = TIER_MODELS[resolution].objects.filter(
+                series__in=list(points),
+                object_id=container.id,
+                bucket__gte=since
+            ).order_by('bucket').values_list('series', 'bucket', 'avg_value', 'max_value')
+            for series, bucket, avg_value, max_value in rollups:
+                points[series].append({'x': bucket.isoformat(), 'y': avg_value, 'max': max_value})
+            cpu_data, memory_data = points['container.cpu'], points['container.memory']
         # 其他指标...
 
         # 获取最近告警
@@ -94,7 +111,8 @@ class MonitoringService:
                 # 其他指标...
             },
             'alerts': recent_alerts,
-            'status': container.status
+            'status': container.status,
+            'resolution': resolution or 'raw'
         }
 
     @staticmethod
@@ -106,62 +124,8 @@ class MonitoringService:
             'usage_percent': {'cpu': 80, 'memory': 75}
         }
 
-    def analyze_resource_trends(self):
-        """分析资源使用趋势并创建告警"""
-        # 分析最近1小时的CPU和内存趋势
-        one_hour_ago = timezone.now() - timezone.timedelta(hours=1)
-        instances = ContainerInstance.objects.filter(is_healthy=True)
-
-        for instance in instances:
-            metrics = ContainerMetric.objects.filter(
-                container=instance.container,
-                timestamp__gte=one_hour_ago
-            ).order_by('timestamp')
-
-            if len(metrics) < 5:  # 需要至少5个数据点才能分析趋势
-                continue
-
-            # 计算CPU使用率趋势
-            cpu_trend = self._calculate_trend([m.cpu_usage for m in metrics])
-            memory_trend = self._calculate_trend([m.memory_usage for m in metrics])
-
-            # CPU使用率持续上升且超过阈值
-            if cpu_trend > 0.1 and metrics.last().cpu_usage > 80:
-                self.alert_manager._trigger_alert(AlertRule.objects.create(
-                    container_instance=instance,
-                    level='warning',
-                    rule_type='cpu_trend',
-                    threshold=80,
-                    trigger_condition=f'CPU使用率持续上升，当前{metrics.last().cpu_usage}%',
-                    message=f'CPU使用率趋势异常: 过去1小时上升{cpu_trend*100:.2f}%',
-                    is_active=True,
-                    triggered_at=timezone.now()
-                ))
-
-            # 内存使用率持续上升且超过阈值
-            if memory_trend > 0.1 and metrics.last().memory_usage > 80:
-                self.alert_manager._trigger_alert(AlertRule.objects.create(
-                    container_instance=instance,
-                    level='warning',
-                    rule_type='memory_trend',
-                    threshold=80,
-                    trigger_condition=f'内存使用率持续上升，当前{metrics.last().memory_usage}%',
-                    message=f'内存使用率趋势异常: 过去1小时上升{memory_trend*100:.2f}%',
-                    is_active=True,
-                    triggered_at=timezone.now()
-                ))
-
-    def _calculate_trend(self, values):
-        """计算数据趋势（简单线性回归斜率）"""
-        n = len(values)
-        if n < 2:
-            return 0
-
-        x = list(range(n))
-        x_mean = sum(x) / n
-        y_mean = sum(values) / n
-
-        numerator = sum((xi - x_mean) * (yi - y_mean) for xi, yi in zip(x, values))
-        denominator = sum((xi - x_mean) **2 for xi in x)
-
-        return numerator / denominator if denominator != 0 else 0
\ No newline at end of file
+    def analyze_resource_trends(self, samples):
+        """用本周期采集的样本增量更新异常检测状态，并按实例和序列去重告警"""
+        if not samples:
+            return
+        self.anomaly_detector.raise_alerts(self.anomaly_detector.observe(samples))
@@ -28,3 +28,73 @@ class MonitoringAPITest(TestCase):
             'container': str(self.container.id)
         })
         self.assertEqual(AlertRule.objects.count(), rule_count + 1)
+
+
+class UsagePercentTests(TestCase):
+    def test_quantity_units(self):
+        """测试CPU/内存数量单位换算为限制百分比"""
+        from .metrics_collector import usage_percent
+        self.assertEqual(usage_percent(0.5, '1000m'), 50.0)
+        self.assertEqual(usage_percent(250000000e-9, '500m'), 50.0)
+        self.assertEqual(usage_percent(512 * 1024 ** 2, '2Gi'), 25.0)
+        self.assertEqual(usage_percent(1.0, 'invalid'), 0.0)
+
+
+class RetentionRollupTests(TestCase):
+    def test_merge_matches_raw_summary(self):
+        """测试分钟聚合合并为小时聚合时样本数、极值和均值与直接聚合一致"""
+        from .retention import summarize, merge
+        first, second = [1.0, 2.0, 3.0], [10.0, 20.0]
+        merged = merge([summarize(first), summarize(second)])
+        direct = summarize(first + second)
+        self.assertEqual(merged[:3], direct[:3])
+        self.assertAlmostEqual(merged[3], direct[3])
+        self.assertEqual(direct[4], 20.0)
+
+    def test_select_resolution(self):
+        """测试按时间范围选择数据层级"""
+        from datetime import timedelta
+        from .retention import select_resolution
+        self.assertIsNone(select_resolution(timedelta(minutes=30)))
+        self.assertEqual(select_resolution(timedelta(hours=24)), '1m')
+        self.assertEqual(select_resolution(timedelta(days=7)), '1h')
+        self.assertEqual(select_resolution(timedelta(days=90)), '1d')
+
+
+class AlertRuleDslTests(TestCase):
+    def test_compile_and_evaluate(self):
+        """测试规则编译、for持续时间判断以及拒绝任意表达式"""
+        from datetime import datetime, timedelta, timezone as dt_timezone
+        from .rules import RuleSyntaxError, compile_rule, evaluate
+        rule = compile_rule('avg(cpu[5m]) > 80 for 2m')
+        end = datetime(2024, 1, 1, 12, 0, tzinfo=dt_timezone.utc)
+        high = [(end - timedelta(minutes=m), (1, 90.0, 90.0, 90.0, 90.0)) for m in range(1, 9)]
+        self.assertTrue(evaluate(rule, high, end))
+        # 只有最近一分钟超阈值时不满足持续时间
+        self.assertFalse(evaluate(rule, high[:1], end))
+        with self.assertRaises(RuleSyntaxError):
+            compile_rule('__import__("os").system("true")')
+
+    def test_detector_rules(self):
+        """测试异常检测规则不按语法评估，告警类型按序列归类"""
+        from types import SimpleNamespace
+        from .alert_manager import AlertManager
+        from .rules import DETECTOR_CONDITION, compile_for
+        rule = SimpleNamespace(trigger_condition=DETECTOR_CONDITION, rule_type='cpu_trend', threshold=80)
+        self.assertIsNone(compile_for(rule))
+        self.assertEqual(AlertManager()._get_alert_type('cpu_anomaly'), 'cpu')
+        self.assertEqual(AlertManager()._get_alert_type('memory_trend'), 'memory')
+
+
+class AnomalyStateTests(TestCase):
+    def test_incremental_and_backfill_state(self):
+        """测试增量状态对突变给出高z分数，回填的趋势为最小二乘斜率"""
+        from .anomaly import update_state, backfill_state
+        state = None
+        for value in [50.0, 51.0, 49.0, 50.0, 52.0, 48.0, 50.0]:
+            state, _ = update_state(state, value, 0.1, 0.1)
+        _, z = update_state(state, 95.0, 0.1, 0.1)
+        self.assertGreater(z, 3)
+        backfilled = backfill_state([10.0, 11.0, 12.0, 13.0], 0.1)
+        self.assertAlmostEqual(backfilled['trend'], 1.0)
+        self.assertAlmostEqual(backfilled['level'], 13.0)
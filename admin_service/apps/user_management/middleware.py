@@ -1,7 +1,23 @@
 from django.http import JsonResponse
 from django.utils.deprecation import MiddlewareMixin
-from rest_framework.authtoken.models import Token
 from django.utils import timezone
+from apps.userdb.models import Token
+from shared_models.token_cache import get_token_cache
+
+
+def _load_token(token_key):
+    """缓存未命中时从数据库加载Token"""
+    try:
+        token = Token.objects.select_related('user').get(key=token_key)
+    except Token.DoesNotExist:
+        return None
+    return {
+        'user': token.user,
+        'scope': token.scope,
+        'expires_at': token.expires_at,
+        'is_revoked': token.is_revoked,
+    }
+
 
 class TokenAuthenticationMiddleware(MiddlewareMixin):
     def process_request(self, request):
@@ -17,18 +33,17 @@ class TokenAuthenticationMiddleware(MiddlewareMixin):
             }, status=401)
 
         token_key = auth_header.split(' ')[1]
-        try:
-            token = Token.objects.get(key=token_key)
-            # 检查token是否过期
-            if token.expires_at and token.expires_at < timezone.now():
-                return JsonResponse({'error': 'Token has expired'}, status=401)
-            # 检查token是否被吊销
-            if token.is_revoked:
-                return JsonResponse({'error': 'Token has been revoked'}, status=401)
-            # 更新最后使用时间
-            token.last_used = timezone.now()
-            token.save()
-            # 将用户添加到请求对象
-            request.user = token.user
-        except Token.DoesNotExist:
-            return JsonResponse({'error': 'Invalid token'}, status=401)
\ No newline at end of file
+        token_cache = get_token_cache()
+        token = token_cache.get(token_key, _load_token)
+        if token is None:
+            return JsonResponse({'error': 'Invalid token'}, status=401)
+        # 检查token是否过期
+        if token['expires_at'] and token['expires_at'] < timezone.now():
+            return JsonResponse({'error': 'Token has expired'}, status=401)
+        # 检查token是否被吊销
+        if token['is_revoked']:
+            return JsonResponse({'error': 'Token has been revoked'}, status=401)
+        # 最后使用时间由缓存合并后批量写回
+        token_cache.touch(token_key)
+        # 将用户添加到请求对象
+        request.user = token['user']
@@ -3,7 +3,9 @@ from typing import Dict, List, Optional
 from django.db import transaction
 from django.utils import timezone
 from .models import User, UserActivity
+from ..userdb.models import Token
 from ..container_management.services import ContainerService
+from ..container_management.provisioning import request_provisioning, provisioning_state
 
 logger = logging.getLogger(__name__)
 
@@ -27,7 +29,6 @@ class UserService:
             user.save()
             
             # 新增：创建用户Token
-            from rest_framework.authtoken.models import Token
             Token.objects.create(user=user)
             
             # 2. 创建用户容器
@@ -39,13 +40,14 @@ class UserService:
                 'permission_level': user.permission_level
             }
             
-            container_info = self.container_service.create_user_container(
+            # 只登记开通请求，K8s资源在事务提交后由异步任务创建
+            container = self.container_service.create_user_container(
                 user.id, container_config
             )
             
             # 3. 更新用户容器信息
-            user.container_id = container_info.get('container_id')
-            user.container_status = container_info.get('status', 'creating')
+            user.container_id = str(container.id)
+            user.container_status = provisioning_state(container)
             user.save()
             
             # 4. 记录用户活动
@@ -236,6 +238,16 @@ class UserService:
                 details=f'User {user.username} created with token'
             )
     
+            # 登记容器开通请求，事务提交后异步开通，注册请求不等待K8s
+            container = request_provisioning(user, {
+                'cpu_limit': user.cpu_limit,
+                'memory_limit': user.memory_limit,
+                'storage_limit': user.storage_limit,
+            })
+            user.container_id = str(container.id)
+            user.container_status = provisioning_state(container)
+            user.save(update_fields=['container_id', 'container_status'])
+    
             return user, token
     
     def get_filtered_users(self, query_params: Dict) -> List[User]:
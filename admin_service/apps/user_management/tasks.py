@@ -27,28 +27,10 @@ def cleanup_user_activities():
 
 @shared_task
 def sync_container_status():
-    """同步用户容器状态"""
+    """同步用户容器状态（与容器对账共用一次list + 批量写回）"""
     try:
-        from ..container_management.services import ContainerService
-        container_service = ContainerService()
-        
-        active_users = User.objects.filter(
-            status='active',
-            container_id__isnull=False
-        )
-        
-        updated_count = 0
-        for user in active_users:
-            try:
-                status_info = container_service.get_container_status(user.container_id)
-                if status_info and status_info.get('status') != user.container_status:
-                    user.container_status = status_info.get('status')
-                    user.save()
-                    updated_count += 1
-            except Exception as e:
-                logger.warning(f"同步用户 {user.username} 容器状态失败: {str(e)}")
-                continue
-        
+        from ..container_management.reconciler import ContainerReconciler
+        updated_count = ContainerReconciler().reconcile()
         logger.info(f"同步了 {updated_count} 个用户的容器状态")
         return updated_count
         
@@ -46,4 +46,51 @@ class UserManagementTests(TestCase):
         )
         self.assertEqual(response.status_code, 200)
         self.normal_user.refresh_from_db()
-        self.assertEqual(self.normal_user.container_status, 'running')  # 假设容器启动后状态为 'running'
\ No newline at end of file
+        self.assertEqual(self.normal_user.container_status, 'running')  # 假设容器启动后状态为 'running'
+
+
+class TokenLoginTests(TestCase):
+    def setUp(self):
+        from unittest import mock
+        from shared_models.token_cache import TokenCache
+        # 使用不连接Redis的Token缓存
+        self.token_cache = TokenCache(local_size=10, local_ttl=60, redis_ttl=300, flush_interval=60)
+        self.token_cache._redis_client = mock.Mock(get=mock.Mock(return_value=None))
+        self.token_cache._ensure_started = lambda: None
+        patcher = mock.patch('apps.user_management.middleware.get_token_cache', return_value=self.token_cache)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def _login(self, username):
+        User.objects.create_user(username=username, email=f'{username}@example.com', password='secret123')
+        response = self.client.post(reverse('auth-login'), {'username': username, 'password': 'secret123'})
+        self.assertEqual(response.status_code, 200)
+        return response.data['data']['token']
+
+    def test_login_token_authenticates(self):
+        """测试登录签发的Token可通过Token认证中间件访问接口"""
+        token = self._login('login-user')
+        response = self.client.get(reverse('auth-profile'), HTTP_AUTHORIZATION=f'Token {token}')
+        self.assertEqual(response.status_code, 200)
+
+    def test_logout_revokes_cached_token(self):
+        """测试登出删除Token后缓存中的条目立即失效，再次使用被拒绝"""
+        from unittest import mock
+        token = self._login('logout-user')
+        with mock.patch('apps.user_management.views.get_token_cache', return_value=self.token_cache), \
+                mock.patch.object(self.token_cache, 'revoke', wraps=self.token_cache.revoke) as revoke:
+            response = self.client.post(reverse('auth-logout'), HTTP_AUTHORIZATION=f'Token {token}')
+        self.assertEqual(response.status_code, 200)
+        revoke.assert_called_once_with(token)
+        response = self.client.get(reverse('auth-profile'), HTTP_AUTHORIZATION=f'Token {token}')
+        self.assertEqual(response.status_code, 401)
+
+    def test_token_expiry_evaluated_per_token(self):
+        """测试Token默认过期时间按创建时计算，而不是模块导入时的固定值"""
+        from datetime import timedelta
+        from django.utils import timezone
+        from apps.userdb.models import Token
+        default = Token._meta.get_field('expires_at').default
+        self.assertTrue(callable(default))
+        self.assertAlmostEqual(default().timestamp(), (timezone.now() + timedelta(days=7)).timestamp(), delta=5)
+
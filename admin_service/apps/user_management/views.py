@@ -4,7 +4,6 @@ from django.shortcuts import render
 from rest_framework import status, viewsets, permissions
 from rest_framework.decorators import action
 from rest_framework.response import Response
-from rest_framework.authtoken.models import Token
 from django.contrib.auth import login, logout
 from django.utils.decorators import method_decorator
 from django.views.decorators.cache import cache_page
@@ -13,6 +12,9 @@ from .serializers import (
     UserSerializer, UserListSerializer, UserActivitySerializer, LoginSerializer
 )
 from .services import UserService
+from ..userdb.models import Token, UserContainer
+from shared_models.token_cache import get_token_cache
+from ..container_management.provisioning import provisioning_state
 from .permissions import IsAdminOrReadOnly
 from common.exceptions import APIException
 
@@ -60,7 +62,8 @@ class UserViewSet(viewsets.ModelViewSet):
                     'success': True,
                     'data': {
                         'user': response_serializer.data,
-                        'token': token.key
+                        'token': token.key,
+                        'provisioning': user.container_status
                     },
                     'message': '用户创建成功'
                 },
@@ -223,6 +226,27 @@ class UserViewSet(viewsets.ModelViewSet):
                 status=status.HTTP_400_BAD_REQUEST
             )
     
+    @action(detail=True, methods=['get'])
+    def provisioning(self, request, pk=None):
+        """查询用户容器开通状态（供注册后轮询，只查一次数据库）"""
+        container = UserContainer.objects.filter(user_id=pk).only(
+            'id', 'status', 'ready_replicas', 'updated_at'
+        ).first()
+        if container is None:
+            return Response(
+                {'success': False, 'message': '容器不存在'},
+                status=status.HTTP_404_NOT_FOUND
+            )
+        return Response({
+            'success': True,
+            'data': {
+                'container_id': container.id,
+                'state': provisioning_state(container),
+                'ready_replicas': container.ready_replicas,
+                'updated_at': container.updated_at,
+            }
+        })
+    
     @action(detail=True, methods=['get'])
     def activities(self, request, pk=None):
         """获取用户活动记录"""
@@ -329,6 +353,8 @@ class AuthViewSet(viewsets.ViewSet):
                 try:
                     token = Token.objects.get(user=request.user)
                     token.delete()
+                    # 认证走Token缓存，删除后需立即使缓存条目失效
+                    get_token_cache().revoke(token.key)
                 except Token.DoesNotExist:
                     pass
                 
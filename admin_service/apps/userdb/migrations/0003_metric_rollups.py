@@ -0,0 +1,71 @@
+from django.db import migrations, models
+
+
+def rollup_fields():
+    return [
+        ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+        ('series', models.CharField(max_length=50, verbose_name='指标序列')),
+        ('object_id', models.BigIntegerField(verbose_name='对象ID')),
+        ('bucket', models.DateTimeField(verbose_name='时间桶起点')),
+        ('count', models.IntegerField(default=0, verbose_name='样本数')),
+        ('min_value', models.FloatField(verbose_name='最小值')),
+        ('max_value', models.FloatField(verbose_name='最大值')),
+        ('avg_value', models.FloatField(verbose_name='平均值')),
+        ('p95_value', models.FloatField(verbose_name='P95')),
+    ]
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('userdb', '0002_containerinstance_max_connections_alertrule'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='MetricRollupMinute',
+            fields=rollup_fields(),
+            options={
+                'verbose_name': '分钟级指标聚合',
+                'verbose_name_plural': '分钟级指标聚合',
+                'db_table': 'metric_rollup_1m',
+                'indexes': [models.Index(fields=['bucket'], name='metric_roll_bucket_1m_idx')],
+                'unique_together': {('series', 'object_id', 'bucket')},
+            },
+        ),
+        migrations.CreateModel(
+            name='MetricRollupHour',
+            fields=rollup_fields(),
+            options={
+                'verbose_name': '小时级指标聚合',
+                'verbose_name_plural': '小时级指标聚合',
+                'db_table': 'metric_rollup_1h',
+                'indexes': [models.Index(fields=['bucket'], name='metric_roll_bucket_1h_idx')],
+                'unique_together': {('series', 'object_id', 'bucket')},
+            },
+        ),
+        migrations.CreateModel(
+            name='MetricRollupDay',
+            fields=rollup_fields(),
+            options={
+                'verbose_name': '天级指标聚合',
+                'verbose_name_plural': '天级指标聚合',
+                'db_table': 'metric_rollup_1d',
+                'indexes': [models.Index(fields=['bucket'], name='metric_roll_bucket_1d_idx')],
+                'unique_together': {('series', 'object_id', 'bucket')},
+            },
+        ),
+        migrations.CreateModel(
+            name='RollupWatermark',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('series', models.CharField(max_length=50, verbose_name='指标序列')),
+                ('resolution', models.CharField(max_length=4, verbose_name='聚合粒度')),
+                ('position', models.DateTimeField(verbose_name='已聚合到')),
+            ],
+            options={
+                'db_table': 'metric_rollup_watermarks',
+                'unique_together': {('series', 'resolution')},
+            },
+        ),
+    ]
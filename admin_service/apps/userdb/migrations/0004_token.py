@@ -0,0 +1,30 @@
+import apps.userdb.models
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('authtoken', '0003_tokenproxy'),
+        ('userdb', '0003_metric_rollups'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Token',
+            fields=[
+                ('token_ptr', models.OneToOneField(auto_created=True, on_delete=django.db.models.deletion.CASCADE, parent_link=True, primary_key=True, serialize=False, to='authtoken.token')),
+                ('expires_at', models.DateTimeField(default=apps.userdb.models.default_token_expiry)),
+                ('is_revoked', models.BooleanField(default=False)),
+                ('scope', models.CharField(blank=True, help_text='Token权限范围，多个用逗号分隔', max_length=255)),
+                ('last_used', models.DateTimeField(blank=True, null=True)),
+            ],
+            options={
+                'verbose_name': 'Token',
+                'verbose_name_plural': 'Tokens',
+                'db_table': 'auth_token',
+            },
+            bases=('authtoken.token',),
+        ),
+    ]
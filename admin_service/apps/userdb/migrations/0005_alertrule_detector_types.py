@@ -0,0 +1,16 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('userdb', '0004_token'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='alertrule',
+            name='rule_type',
+            field=models.CharField(choices=[('container_cpu', '容器CPU使用率'), ('container_memory', '容器内存使用率'), ('route_latency', '路由延迟'), ('instance_health', '实例健康状态'), ('cpu_trend', 'CPU使用率持续上升'), ('cpu_anomaly', 'CPU使用率突变'), ('memory_trend', '内存使用率持续上升'), ('memory_anomaly', '内存使用率突变')], max_length=20, verbose_name='规则类型'),
+        ),
+    ]
@@ -0,0 +1,17 @@
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('userdb', '0005_alertrule_detector_types'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='routelog',
+            name='timestamp',
+            field=models.DateTimeField(db_index=True, default=django.utils.timezone.now, verbose_name='时间戳'),
+        ),
+    ]
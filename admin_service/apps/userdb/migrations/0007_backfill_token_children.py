@@ -0,0 +1,28 @@
+from datetime import timedelta
+
+from django.db import migrations
+
+
+def backfill_token_children(apps, schema_editor):
+    """为此前按DRF Token创建、没有扩展行的Token补建扩展行"""
+    DRFToken = apps.get_model('authtoken', 'Token')
+    Token = apps.get_model('userdb', 'Token')
+    existing = set(Token.objects.values_list('token_ptr_id', flat=True))
+    for parent in DRFToken.objects.exclude(key__in=existing):
+        child = Token(
+            token_ptr_id=parent.key, key=parent.key, user_id=parent.user_id, created=parent.created,
+            expires_at=parent.created + timedelta(days=7), is_revoked=False, scope=''
+        )
+        # 只写入扩展表，父表行已存在
+        child.save_base(raw=True)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('userdb', '0006_routelog_event_timestamp'),
+    ]
+
+    operations = [
+        migrations.RunPython(backfill_token_children, migrations.RunPython.noop),
+    ]
@@ -423,7 +423,7 @@ class RouteLog(models.Model):
     )
     error_message = models.TextField(null=True, blank=True, verbose_name='错误信息')
     
-    timestamp = models.DateTimeField(auto_now_add=True, db_index=True, verbose_name='时间戳')
+    timestamp = models.DateTimeField(default=timezone.now, db_index=True, verbose_name='时间戳')
     
     class Meta:
         db_table = 'route_logs'
@@ -514,7 +514,11 @@ class AlertRule(models.Model):
         ('container_cpu', '容器CPU使用率'),
         ('container_memory', '容器内存使用率'),
         ('route_latency', '路由延迟'),
-        ('instance_health', '实例健康状态')
+        ('instance_health', '实例健康状态'),
+        ('cpu_trend', 'CPU使用率持续上升'),
+        ('cpu_anomaly', 'CPU使用率突变'),
+        ('memory_trend', '内存使用率持续上升'),
+        ('memory_anomaly', '内存使用率突变'),
     ]
     
     container_instance = models.ForeignKey(
@@ -583,11 +587,16 @@ class ResourceAlert(models.Model):
     resolved_at = models.DateTimeField(null=True, blank=True)
     is_resolved = models.BooleanField(default=False)
 
+def default_token_expiry():
+    """Token默认有效期：创建后7天"""
+    return timezone.now() + timezone.timedelta(days=7)
+
 class Token(DRFToken):
     """扩展DRF Token模型，增加过期时间、吊销状态和权限范围"""
-    expires_at = models.DateTimeField(default=timezone.now() + timezone.timedelta(days=7))
+    expires_at = models.DateTimeField(default=default_token_expiry)
     is_revoked = models.BooleanField(default=False)  # 新增吊销状态字段
     scope = models.CharField(max_length=255, blank=True, help_text="Token权限范围，多个用逗号分隔")  # 新增权限范围字段
+    last_used = models.DateTimeField(null=True, blank=True)  # 由Token缓存定期批量写回
     
     class Meta:
         db_table = 'auth_token'
@@ -601,4 +610,59 @@ class Token(DRFToken):
 
     @classmethod
     def generate_key(cls):
-        return binascii.hexlify(os.urandom(20)).decode()
\ No newline at end of file
+        return binascii.hexlify(os.urandom(20)).decode()
+
+class MetricRollup(models.Model):
+    """时序指标降采样聚合（按序列、对象和时间桶）"""
+    series = models.CharField(max_length=50, verbose_name='指标序列')
+    object_id = models.BigIntegerField(verbose_name='对象ID')
+    bucket = models.DateTimeField(verbose_name='时间桶起点')
+
+    count = models.IntegerField(default=0, verbose_name='样本数')
+    min_value = models.FloatField(verbose_name='最小值')
+    max_value = models.FloatField(verbose_name='最大值')
+    avg_value = models.FloatField(verbose_name='平均值')
+    p95_value = models.FloatField(verbose_name='P95')
+
+    class Meta:
+        abstract = True
+
+class MetricRollupMinute(MetricRollup):
+    class Meta:
+        db_table = 'metric_rollup_1m'
+        verbose_name = '分钟级指标聚合'
+        verbose_name_plural = '分钟级指标聚合'
+        unique_together = ['series', 'object_id', 'bucket']
+        indexes = [
+            models.Index(fields=['bucket'], name='metric_roll_bucket_1m_idx'),
+        ]
+
+class MetricRollupHour(MetricRollup):
+    class Meta:
+        db_table = 'metric_rollup_1h'
+        verbose_name = '小时级指标聚合'
+        verbose_name_plural = '小时级指标聚合'
+        unique_together = ['series', 'object_id', 'bucket']
+        indexes = [
+            models.Index(fields=['bucket'], name='metric_roll_bucket_1h_idx'),
+        ]
+
+class MetricRollupDay(MetricRollup):
+    class Meta:
+        db_table = 'metric_rollup_1d'
+        verbose_name = '天级指标聚合'
+        verbose_name_plural = '天级指标聚合'
+        unique_together = ['series', 'object_id', 'bucket']
+        indexes = [
+            models.Index(fields=['bucket'], name='metric_roll_bucket_1d_idx'),
+        ]
+
+class RollupWatermark(models.Model):
+    """各序列在各聚合层级已完成到的位置（不依赖是否有数据，空窗口也能前进）"""
+    series = models.CharField(max_length=50, verbose_name='指标序列')
+    resolution = models.CharField(max_length=4, verbose_name='聚合粒度')
+    position = models.DateTimeField(verbose_name='已聚合到')
+
+    class Meta:
+        db_table = 'metric_rollup_watermarks'
+        unique_together = ['series', 'resolution']
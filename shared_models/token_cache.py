@@ -0,0 +1,225 @@
+import json
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, Optional
+
+import redis
+from django.apps import apps
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import close_old_connections
+from django.db.models import Case, DateTimeField, Value, When
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+logger = logging.getLogger(__name__)
+
+# Redis键前缀；吊销消息发布到 {前缀}:revoke，各worker收到后删除本地缓存
+TOKEN_CACHE_PREFIX = getattr(settings, 'TOKEN_CACHE_PREFIX', 'token_cache')
+TOKEN_REVOCATION_CHANNEL = f"{TOKEN_CACHE_PREFIX}:revoke"
+
+
+class TokenCache:
+    """两级Token缓存（进程内LRU + Redis）
+
+    缓存用户、权限范围、过期时间和吊销状态，稳态下认证不访问数据库。
+    吊销时更新Redis条目、重新签发时删除Redis条目，并通过pub/sub通知所有进程；last_used只记录在内存中，
+    由后台线程定期合并为一条UPDATE写回。admin_service和user_gateway共用本模块，
+    Token模型按userdb应用标签查找。
+    """
+
+    def __init__(self, local_size: int = None, local_ttl: int = None, redis_ttl: int = None,
+                 flush_interval: int = None):
+        self.local_size = local_size or getattr(settings, 'TOKEN_CACHE_LOCAL_SIZE', 10000)
+        self.local_ttl = local_ttl or getattr(settings, 'TOKEN_CACHE_LOCAL_TTL', 60)
+        self.redis_ttl = redis_ttl or getattr(settings, 'TOKEN_CACHE_REDIS_TTL', 300)
+        self.flush_interval = flush_interval or getattr(settings, 'TOKEN_LAST_USED_FLUSH_INTERVAL', 60)
+
+        # token_key -> (entry, 本地过期时间)
+        self._local: OrderedDict = OrderedDict()
+        # 待写回的last_used：token_key -> 时间
+        self._last_used: Dict[str, object] = {}
+        self._lock = threading.Lock()
+        self._redis_client = None
+        self._started_pid = None
+
+    def _client(self):
+        if self._redis_client is None:
+            self._redis_client = redis.Redis(
+                host=settings.REDIS_HOST,
+                port=settings.REDIS_PORT,
+                db=settings.REDIS_DB,
+                password=settings.REDIS_PASSWORD,
+                decode_responses=True,
+                socket_timeout=0.1
+            )
+        return self._redis_client
+
+    @staticmethod
+    def _redis_key(token_key: str) -> str:
+        return f"{TOKEN_CACHE_PREFIX}:{token_key}"
+
+    def get(self, token_key: str, loader) -> Optional[Dict]:
+        """按 进程内LRU -> Redis -> loader(数据库) 的顺序查询Token条目"""
+        self._ensure_started()
+
+        with self._lock:
+            cached = self._local.get(token_key)
+            if cached is not None and cached[1] > time.monotonic():
+                self._local.move_to_end(token_key)
+                return cached[0]
+
+        entry = None
+        try:
+            raw = self._client().get(self._redis_key(token_key))
+            if raw:
+                entry = self._decode(json.loads(raw))
+        except Exception as e:
+            logger.warning(f"Token cache redis lookup failed: {e}")
+
+        if entry is None:
+            entry = loader(token_key)
+            if entry is None:
+                return None
+            self._store_redis(token_key, entry)
+
+        self._store_local(token_key, entry)
+        return entry
+
+    def touch(self, token_key: str):
+        """记录Token使用时间，由后台批量写回"""
+        self._last_used[token_key] = timezone.now()
+
+    def revoke(self, token_key: str):
+        """吊销后调用：标记Redis条目并通知所有进程"""
+        self._local.pop(token_key, None)
+        try:
+            client = self._client()
+            raw = client.get(self._redis_key(token_key))
+            if raw:
+                data = json.loads(raw)
+                data['is_revoked'] = True
+                client.set(self._redis_key(token_key), json.dumps(data, cls=DjangoJSONEncoder), ex=self.redis_ttl)
+            client.publish(TOKEN_REVOCATION_CHANNEL, token_key)
+        except Exception as e:
+            logger.error(f"Failed to publish token revocation: {e}")
+
+    def invalidate(self, token_key: str):
+        """Token被重新签发或修改后调用：删除Redis条目并通知所有进程丢弃本地缓存"""
+        self._local.pop(token_key, None)
+        try:
+            client = self._client()
+            client.delete(self._redis_key(token_key))
+            client.publish(TOKEN_REVOCATION_CHANNEL, token_key)
+        except Exception as e:
+            logger.error(f"Failed to publish token invalidation: {e}")
+
+    def _store_local(self, token_key: str, entry: Dict):
+        with self._lock:
+            self._local[token_key] = (entry, time.monotonic() + self.local_ttl)
+            self._local.move_to_end(token_key)
+            while len(self._local) > self.local_size:
+                self._local.popitem(last=False)
+
+    def _store_redis(self, token_key: str, entry: Dict):
+        user = entry['user']
+        data = {
+            'user': {
+                field.attname: field.value_from_object(user)
+                for field in user._meta.concrete_fields if field.attname != 'password'
+            },
+            'scope': entry['scope'],
+            'expires_at': entry['expires_at'],
+            'is_revoked': entry['is_revoked'],
+        }
+        try:
+            self._client().set(self._redis_key(token_key), json.dumps(data, cls=DjangoJSONEncoder), ex=self.redis_ttl)
+        except Exception as e:
+            logger.warning(f"Token cache redis write failed: {e}")
+
+    @staticmethod
+    def _decode(data: Dict) -> Dict:
+        user_model = get_user_model()
+        fields = {field.attname: field for field in user_model._meta.concrete_fields}
+        user = user_model(**{
+            name: fields[name].to_python(value) for name, value in data['user'].items() if name in fields
+        })
+        user._state.adding = False
+        return {
+            'user': user,
+            'scope': data.get('scope') or '',
+            'expires_at': parse_datetime(data['expires_at']) if data.get('expires_at') else None,
+            'is_revoked': data.get('is_revoked', False),
+        }
+
+    def _ensure_started(self):
+        pid = os.getpid()
+        if self._started_pid == pid:
+            return
+        with self._lock:
+            if self._started_pid == pid:
+                return
+            self._started_pid = pid
+        threading.Thread(target=self._listen_revocations, name='token-revocation-listener', daemon=True).start()
+        threading.Thread(target=self._flush_loop, name='token-last-used-flusher', daemon=True).start()
+
+    def _listen_revocations(self):
+        """订阅吊销消息，断线重连后清空本地缓存"""
+        while True:
+            try:
+                pubsub = redis.Redis(
+                    host=settings.REDIS_HOST,
+                    port=settings.REDIS_PORT,
+                    db=settings.REDIS_DB,
+                    password=settings.REDIS_PASSWORD,
+                    decode_responses=True
+                ).pubsub(ignore_subscribe_messages=True)
+                pubsub.subscribe(TOKEN_REVOCATION_CHANNEL)
+                # 订阅前的消息可能已丢失
+                with self._lock:
+                    self._local.clear()
+
+                for message in pubsub.listen():
+                    self._local.pop(message['data'], None)
+            except Exception as e:
+                logger.error(f"Token revocation listener error: {e}")
+                time.sleep(5)
+
+    def _flush_loop(self):
+        while True:
+            time.sleep(self.flush_interval)
+            try:
+                self.flush_last_used()
+            except Exception as e:
+                logger.error(f"Token last_used flush failed: {e}")
+
+    def flush_last_used(self):
+        """将累计的last_used按Token各自的时间合并为一条CASE UPDATE写回"""
+        token_model = apps.get_model('userdb', 'Token')
+
+        pending, self._last_used = self._last_used, {}
+        if not pending:
+            return
+        close_old_connections()
+        token_model.objects.filter(key__in=list(pending)).update(last_used=Case(
+            *[When(key=token_key, then=Value(used_at)) for token_key, used_at in pending.items()],
+            output_field=DateTimeField()
+        ))
+
+
+_token_cache = None
+_token_cache_lock = threading.Lock()
+
+
+def get_token_cache() -> TokenCache:
+    """获取当前进程的Token缓存"""
+    global _token_cache
+    if _token_cache is None:
+        with _token_cache_lock:
+            if _token_cache is None:
+                _token_cache = TokenCache()
+    return _token_cache
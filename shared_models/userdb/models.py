@@ -134,7 +134,7 @@ class LoadBalancerConfig(models.Model):
 # 监控相关模型
 class AlertRule(models.Model):
     LEVEL_CHOICES = [('info', '信息'), ('warning', '警告'), ('error', '错误'), ('critical', '严重')]
-    RULE_TYPES = [('container_cpu', '容器CPU使用率'), ('container_memory', '容器内存使用率'), ('route_latency', '路由延迟'), ('instance_health', '实例健康状态')]
+    RULE_TYPES = [('container_cpu', '容器CPU使用率'), ('container_memory', '容器内存使用率'), ('route_latency', '路由延迟'), ('instance_health', '实例健康状态'), ('cpu_trend', 'CPU使用率持续上升'), ('cpu_anomaly', 'CPU使用率突变'), ('memory_trend', '内存使用率持续上升'), ('memory_anomaly', '内存使用率突变')]
     container_instance = models.ForeignKey(ContainerInstance, on_delete=models.CASCADE, related_name='alerts', verbose_name='关联容器实例')
     level = models.CharField(max_length=20, choices=LEVEL_CHOICES, default='info', verbose_name='警报级别')
     trigger_condition = models.TextField(verbose_name='触发条件')
@@ -175,9 +175,13 @@ class ResourceAlert(models.Model):
     resolved_at = models.DateTimeField(null=True, blank=True)
     is_resolved = models.BooleanField(default=False)
 
+def default_token_expiry():
+    """Token默认有效期：创建后7天"""
+    return timezone.now() + timezone.timedelta(days=7)
+
 # 扩展Token模型
 class Token(DRFToken):
-    expires_at = models.DateTimeField(default=timezone.now() + timezone.timedelta(days=7))
+    expires_at = models.DateTimeField(default=default_token_expiry)
     is_revoked = models.BooleanField(default=False)
     scope = models.CharField(max_length=255, blank=True, help_text="Token权限范围，多个用逗号分隔")
     last_used = models.DateTimeField(null=True, blank=True)
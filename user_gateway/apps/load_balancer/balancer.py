@@ -1,120 +1,239 @@
-from django.db.models import F
+import random
+import threading
+import time
+from collections import defaultdict
+from typing import Dict, Optional, Set, Tuple
+
+from django.conf import settings
+from django.db.models import Avg, F, Q
+from django.utils import timezone
 from .models import RouteRegistry, LoadBalancerConfig
+from .circuit_breaker import CircuitBreaker
+from .hash_ring import get_hash_ring
+from .selection import InstancePool, shared_counter, inflight_tracker, latency_tracker
 from ..userdb.models import ContainerInstance
-import hashlib  # 新增导入
-from django.core.cache import cache  # 新增导入
+
+# 策略注册表：策略名 -> func(balancer, pool) -> ContainerInstance
+STRATEGY_REGISTRY = {}
+
+
+def register_strategy(name):
+    """策略注册装饰器"""
+    def decorator(func):
+        if name in STRATEGY_REGISTRY:
+            raise ValueError(f"Strategy '{name}' already registered")
+        STRATEGY_REGISTRY[name] = func
+        return func
+    return decorator
+
+
+# 进程内路由注册缓存：user_id -> (RouteRegistry, 过期时间)
+_user_routes: Dict[str, Tuple[RouteRegistry, float]] = {}
+
+
+def get_user_route(user_id) -> Optional[RouteRegistry]:
+    """获取用户的路由注册（带进程内缓存）"""
+    user_id = str(user_id)
+    cached = _user_routes.get(user_id)
+    if cached is not None and cached[1] > time.monotonic():
+        return cached[0]
+    route = RouteRegistry.objects.select_related('load_balancer_config', 'container').filter(
+        user_id=user_id, is_active=True
+    ).first()
+    if route is not None:
+        _user_routes[user_id] = (route, time.monotonic() + getattr(settings, 'ROUTE_REGISTRY_CACHE_TTL', 30))
+    return route
+
+
+# 进程内可用实例快照：route_id -> InstancePool
+_instance_pools: Dict[int, InstancePool] = {}
+# tenant_id -> 该租户已建快照的route_id（按租户失效时使用）
+_tenant_pools: Dict[str, Set[int]] = defaultdict(set)
+_instance_pools_lock = threading.Lock()
+
 
 class LoadBalancer:
     # 类级策略注册表
-    strategy_registry = {}
-    
-    # 策略注册装饰器
+    strategy_registry = STRATEGY_REGISTRY
+    default_strategy = 'round_robin'
+
     @classmethod
     def register_strategy(cls, name):
-        def decorator(func):
-            if name in cls.strategy_registry:
-                raise ValueError(f"Strategy '{name}' already registered")
-            cls.strategy_registry[name] = func
-            return func
-        return decorator
-    
-    def __init__(self, route_registry: RouteRegistry):
+        return register_strategy(name)
+
+    def __init__(self, route_registry: RouteRegistry, client_ip: Optional[str] = None):
         self.route = route_registry
         self.config = route_registry.load_balancer_config
         self.strategy = route_registry.load_balance_strategy
-        # 初始化轮询计数器
-        self.round_robin_counter = 0  # 新增
-
-    # 使用装饰器注册策略
-    @register_strategy('round_robin')
-    def _round_robin(self, instances):
-        """轮询策略（使用计数器实现真正轮询）"""
-        if not instances:  # 新增防御性检查
-            raise RuntimeError("No instances available for round_robin strategy")
-        # 使用计数器取模实现轮询
-        selected_index = self.round_robin_counter % len(instances)
-        self.round_robin_counter += 1
-        return instances[selected_index]
-
-    @register_strategy('least_conn')
-    def _least_connections(self, instances):
-        """最少连接策略"""
-        if not instances:  # 新增
-            raise RuntimeError("No instances available for least_connections strategy")
-        return instances.order_by('current_connections').first()
-
-    def _weighted(self, instances):
-        """权重策略"""
-        if not instances:  # 新增
-            raise RuntimeError("No instances available for weighted strategy")
-        total_weight = sum(inst.weight for inst in instances)
-        random_weight = random.randint(0, total_weight)
-        current = 0
-        for inst in instances:
-            current += inst.weight
-            if current >= random_weight:
-                return inst
-        return instances.first()  # 兜底
-
-    def _ip_hash(self, instances):
-        """IP哈希策略（支持配置哈希算法）"""
-        if not instances:  # 新增防御性检查
-            raise RuntimeError("No instances available for ip_hash strategy")
-        # 从配置获取哈希算法，默认为md5
-        hash_algorithm = self.config.ip_hash_algorithm or 'md5'
-        # 获取真实客户端IP（实际应用需从请求上下文获取）
-        client_ip = self._get_client_ip()  # 需要实现此方法
-        
-        # 使用指定算法计算哈希
-        hash_obj = hashlib.new(hash_algorithm)
-        hash_obj.update(client_ip.encode('utf-8'))
-        hash_value = int(hash_obj.hexdigest(), 16)
-        return instances[hash_value % len(instances)]
-
-    def _response_time(self, instances):
-        """响应时间策略"""
-        if not instances:  # 新增
-            raise RuntimeError("No instances available for response_time strategy")
-        return instances.order_by('health_records__response_time').first()
+        self.client_ip = client_ip
+
+    def _get_client_ip(self) -> str:
+        return self.client_ip or '0.0.0.0'
+
+    def _get_pool(self) -> InstancePool:
+        """获取可用实例快照，过期后重建（仅重建时访问数据库）"""
+        pool = _instance_pools.get(self.route.id)
+        if pool is not None and pool.expires_at > time.monotonic():
+            return pool
+
+        with _instance_pools_lock:
+            pool = _instance_pools.get(self.route.id)
+            if pool is not None and pool.expires_at > time.monotonic():
+                return pool
+            pool = self._build_pool()
+            _instance_pools[self.route.id] = pool
+            _tenant_pools[str(self.route.user_id)].add(self.route.id)
+            return pool
+
+    def _build_pool(self) -> InstancePool:
+        recent = timezone.now() - timezone.timedelta(minutes=5)
+        healthy_instances = list(ContainerInstance.objects.filter(
+            container=self.route.container,
+            is_healthy=True,
+            status='running',
+            current_connections__lt=F('max_connections')
+        ).annotate(
+            recent_response_time=Avg(
+                'health_records__response_time',
+                filter=Q(health_records__timestamp__gte=recent)
+            )
+        ).order_by('id'))
+
+        # 只读排除仍处于打开状态的实例（先批量刷新本地熔断状态镜像）；不在这里调用allow_request，
+        # 以免把到期的熔断器转为半开并消耗探测名额，是否放行由select_instance对选中的实例判断
+        CircuitBreaker.prefetch(instance.id for instance in healthy_instances)
+        instances, reopen_in = [], []
+        for instance in healthy_instances:
+            remaining = CircuitBreaker(instance, self.config).open_remaining()
+            if remaining > 0:
+                reopen_in.append(remaining)
+            else:
+                instances.append(instance)
+
+        fastest_index = 0
+        if instances:
+            fastest_index = min(
+                range(len(instances)),
+                key=lambda i: (
+                    instances[i].recent_response_time is None,
+                    instances[i].recent_response_time or 0,
+                    instances[i].current_connections
+                )
+            )
+
+        hash_ring = get_hash_ring(
+            self.route.id,
+            getattr(settings, 'LB_HASH_RING_VNODES', 160),
+            getattr(settings, 'LB_HASH_BOUNDED_LOAD_FACTOR', 1.25)
+        )
+        hash_ring.sync(instance.id for instance in instances)
+
+        timeout = getattr(self.config, 'cache_timeout', None) or 300
+        # 被熔断排除的实例在恢复超时到期后重建快照，重新参与选择
+        if reopen_in:
+            timeout = min(timeout, min(reopen_in))
+        return InstancePool(instances, time.monotonic() + timeout, fastest_index, hash_ring)
+
+    @classmethod
+    def invalidate(cls, route_id: int):
+        """实例成员或健康状态变化时丢弃快照"""
+        _instance_pools.pop(route_id, None)
+
+    @classmethod
+    def invalidate_tenant(cls, tenant_id):
+        """丢弃租户的路由注册缓存和实例快照（路由失效消息、Endpoints变化时调用）"""
+        tenant_id = str(tenant_id)
+        _user_routes.pop(tenant_id, None)
+        with _instance_pools_lock:
+            route_ids = _tenant_pools.pop(tenant_id, set())
+        for route_id in route_ids:
+            cls.invalidate(route_id)
+
+    @classmethod
+    def invalidate_all(cls):
+        """丢弃全部快照（可能丢失失效消息时使用）"""
+        _user_routes.clear()
+        with _instance_pools_lock:
+            _instance_pools.clear()
+            _tenant_pools.clear()
 
     def select_instance(self) -> ContainerInstance:
         """根据负载均衡策略选择目标容器实例"""
-        # 缓存键设计：包含路由ID确保唯一性
-        cache_key = f"healthy_instances_{self.route.id}"
-        healthy_instances = cache.get(cache_key)
-        
-        if not healthy_instances:
-            # 使用select_related优化关联查询
-            healthy_instances = list(ContainerInstance.objects.filter(
-                container=self.route.container,
-                is_healthy=True,
-                status='running',
-                current_connections__lt=F('max_connections')
-            ).select_related('health_records'))  # 优化查询
-            
-            # 过滤熔断器不允许的实例
-            filtered_instances = []
-            for instance in healthy_instances:
-                cb = CircuitBreaker(instance, self.config)
-                if cb.allow_request():
-                    filtered_instances.append(instance)
-            healthy_instances = filtered_instances
-
-            # 设置缓存，有效期5分钟（可配置）
-            cache.set(cache_key, healthy_instances, timeout=300)
-        
-        if not healthy_instances:
+        pool = self._get_pool()
+        if not pool.instances:
             raise RuntimeError("No healthy instances available")
-        
-        # 添加默认策略避免KeyError
-        selector = {
-            'round_robin': self._round_robin,
-            'least_conn': self._least_connections,
-            'weighted': self._weighted,
-            'ip_hash': self._ip_hash,
-            'response_time': self._response_time
-        }.get(self.strategy, self._round_robin)  # 使用get方法设置默认值
-        
-        return selector(healthy_instances)
-        # 使用注册的策略
-        selector = self.strategy_registry.get(self.strategy, self._round_robin)
+
+        selector = self.strategy_registry.get(self.strategy) or self.strategy_registry[self.default_strategy]
+        instance = selector(self, pool)
+        if CircuitBreaker(instance, self.config).allow_request():
+            return instance
+
+        # 快照构建后实例熔断，改选其他允许通过的实例
+        for candidate in pool.instances:
+            if candidate.id != instance.id and CircuitBreaker(candidate, self.config).allow_request():
+                return candidate
+        raise RuntimeError("No healthy instances available")
+
+    @staticmethod
+    def begin_request(instance: ContainerInstance):
+        """请求转发前调用，记录在途请求"""
+        inflight_tracker.begin(instance.id)
+
+    @staticmethod
+    def end_request(instance: ContainerInstance):
+        """请求结束后调用"""
+        inflight_tracker.end(instance.id)
+
+
+@register_strategy('round_robin')
+def _round_robin(balancer: LoadBalancer, pool: InstancePool):
+    """轮询策略（计数器在各worker间共享）"""
+    index = shared_counter.next(balancer.route.id)
+    return pool.instances[index % len(pool.instances)]
+
+
+@register_strategy('least_conn')
+def _least_connections(balancer: LoadBalancer, pool: InstancePool):
+    """最少连接策略（随机两选一）"""
+    instances = pool.instances
+    if len(instances) == 1:
+        return instances[0]
+    a, b = random.sample(instances, 2)
+    load_a = a.current_connections + inflight_tracker.get(a.id)
+    load_b = b.current_connections + inflight_tracker.get(b.id)
+    return a if load_a <= load_b else b
+
+
+@register_strategy('weighted')
+def _weighted(balancer: LoadBalancer, pool: InstancePool):
+    """权重策略（别名表）"""
+    return pool.instances[pool.alias_table.pick()]
+
+
+@register_strategy('ip_hash')
+def _ip_hash(balancer: LoadBalancer, pool: InstancePool):
+    """IP哈希策略（有界负载一致性哈希，扩缩容时只迁移少量客户端；负载上界按本进程在途请求计算）"""
+    instance_id = pool.hash_ring.get_bounded(balancer._get_client_ip(), inflight_tracker.get)
+    instance = pool.instances_by_id.get(instance_id)
+    if instance is None:
+        # 哈希环已被更新的快照同步，当前快照中没有该实例
+        return pool.instances[0]
+    return instance
+
+
+@register_strategy('peak_ewma')
+def _peak_ewma(balancer: LoadBalancer, pool: InstancePool):
+    """Peak-EWMA策略（随机两选一，比较 延迟EWMA x (在途请求+1)）"""
+    instances = pool.instances
+    if len(instances) == 1:
+        return instances[0]
+    a, b = random.sample(instances, 2)
+    cost_a = latency_tracker.cost(a.id) * (inflight_tracker.get(a.id) + 1)
+    cost_b = latency_tracker.cost(b.id) * (inflight_tracker.get(b.id) + 1)
+    return a if cost_a <= cost_b else b
+
+
+@register_strategy('response_time')
+def _response_time(balancer: LoadBalancer, pool: InstancePool):
+    """响应时间策略（构建快照时预先选出）"""
+    return pool.instances[pool.fastest_index]
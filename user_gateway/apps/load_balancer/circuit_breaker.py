@@ -1,82 +1,243 @@
-from django.utils import timezone
-from django.core.cache import cache
+import logging
+import threading
+import time
+import uuid
+from typing import Dict, Iterable, Optional
+
+import redis
+from django.conf import settings
 from .models import LoadBalancerConfig
 from ..userdb.models import ContainerInstance
 
+logger = logging.getLogger(__name__)
+
+
 class CircuitBreakerState:
     CLOSED = 'closed'
     OPEN = 'open'
     HALF_OPEN = 'half_open'
 
+
+# 状态保存在Redis哈希 circuit_breaker:{id}（state/open_until/probes/probe_reset_at），
+# 滑动窗口内的失败记录保存在有序集合 circuit_breaker:{id}:failures。
+# 每次状态转换由一个Lua脚本原子完成，返回 [state, open_until, transitioned]。
+
+# KEYS: state, failures  ARGV: now_ms, window_ms, threshold, recovery_ms, member
+RECORD_FAILURE_SCRIPT = """
+local state = redis.call('HGET', KEYS[1], 'state') or 'closed'
+local now = tonumber(ARGV[1])
+local recovery = tonumber(ARGV[4])
+if state == 'open' then
+    return {state, redis.call('HGET', KEYS[1], 'open_until') or '0', 0}
+end
+if state == 'closed' then
+    redis.call('ZADD', KEYS[2], now, ARGV[5])
+    redis.call('ZREMRANGEBYSCORE', KEYS[2], '-inf', now - tonumber(ARGV[2]))
+    redis.call('PEXPIRE', KEYS[2], ARGV[2])
+    if redis.call('ZCARD', KEYS[2]) < tonumber(ARGV[3]) then
+        return {state, '0', 0}
+    end
+end
+local open_until = now + recovery
+redis.call('HSET', KEYS[1], 'state', 'open', 'open_until', open_until, 'probes', 0)
+redis.call('PEXPIRE', KEYS[1], recovery * 2)
+redis.call('DEL', KEYS[2])
+return {'open', tostring(open_until), 1}
+"""
+
+# KEYS: state, failures  ARGV: now_ms
+# 打开状态到期后的成功（如健康检查探测成功）同样视为探测成功
+RECORD_SUCCESS_SCRIPT = """
+local state = redis.call('HGET', KEYS[1], 'state') or 'closed'
+local open_until = redis.call('HGET', KEYS[1], 'open_until') or '0'
+if state == 'half_open' or (state == 'open' and tonumber(ARGV[1]) >= tonumber(open_until)) then
+    redis.call('DEL', KEYS[1], KEYS[2])
+    return {'closed', '0', 1}
+end
+return {state, open_until, 0}
+"""
+
+# KEYS: state  ARGV: now_ms, recovery_ms, probe_quota
+ACQUIRE_SCRIPT = """
+local state = redis.call('HGET', KEYS[1], 'state') or 'closed'
+local now = tonumber(ARGV[1])
+local recovery = tonumber(ARGV[2])
+if state == 'closed' then
+    return {state, '0', 1}
+end
+local open_until = redis.call('HGET', KEYS[1], 'open_until') or '0'
+if state == 'open' then
+    if now < tonumber(open_until) then
+        return {state, open_until, 0}
+    end
+    redis.call('HSET', KEYS[1], 'state', 'half_open', 'probes', 1, 'probe_reset_at', now + recovery)
+    redis.call('PEXPIRE', KEYS[1], recovery * 2)
+    return {'half_open', open_until, 1}
+end
+-- half_open：探测名额用尽后拒绝，探测请求丢失时在probe_reset_at后重新发放名额
+local reset_at = tonumber(redis.call('HGET', KEYS[1], 'probe_reset_at') or '0')
+if now >= reset_at then
+    redis.call('HSET', KEYS[1], 'probes', 0, 'probe_reset_at', now + recovery)
+end
+if tonumber(redis.call('HINCRBY', KEYS[1], 'probes', 1)) <= tonumber(ARGV[3]) then
+    return {state, open_until, 1}
+end
+return {state, open_until, 0}
+"""
+
+_redis_client = None
+_scripts = {}
+_client_lock = threading.Lock()
+
+# 进程内状态镜像：instance_id -> (state, open_until_ms, 镜像过期时间)
+_local_mirror: Dict[int, tuple] = {}
+
+
+def _get_scripts():
+    global _redis_client
+    if _redis_client is None:
+        with _client_lock:
+            if _redis_client is None:
+                client = redis.Redis(
+                    host=settings.REDIS_HOST,
+                    port=settings.REDIS_PORT,
+                    db=settings.REDIS_DB,
+                    password=settings.REDIS_PASSWORD,
+                    decode_responses=True,
+                    socket_timeout=0.1
+                )
+                _scripts['failure'] = client.register_script(RECORD_FAILURE_SCRIPT)
+                _scripts['success'] = client.register_script(RECORD_SUCCESS_SCRIPT)
+                _scripts['acquire'] = client.register_script(ACQUIRE_SCRIPT)
+                _redis_client = client
+    return _redis_client, _scripts
+
+
 class CircuitBreaker:
+    """基于Redis Lua脚本的熔断器
+
+    失败按滑动窗口计数，窗口内失败数达到failure_threshold时打开；恢复超时后
+    进入半开状态，只放行有限数量的探测请求，探测成功即关闭。
+    allow_request优先读取短时有效的进程内镜像，关闭状态和未到期的打开状态
+    不需要访问Redis。
+    """
+
     def __init__(self, instance: ContainerInstance, config: LoadBalancerConfig):
         self.instance = instance
         self.config = config
-        self.cache_key = f"circuit_breaker_{instance.id}"
-        
-        # 从缓存加载状态
-        cached_state = cache.get(self.cache_key)
-        if cached_state:
-            self.state = cached_state['state']
-            self.failure_count = cached_state['failure_count']
-            self.last_failure_time = cached_state.get('last_failure_time')
-            self.recovery_time = cached_state.get('recovery_time')
-        else:
-            self.state = CircuitBreakerState.CLOSED
-            self.failure_count = 0
-            self.last_failure_time = None
-            self.recovery_time = None
-
-    def _save_state(self):
-        """保存状态到缓存"""
-        state = {
-            'state': self.state,
-            'failure_count': self.failure_count,
-            'last_failure_time': self.last_failure_time,
-            'recovery_time': self.recovery_time
-        }
-        cache.set(self.cache_key, state, timeout=self.config.recovery_timeout * 2)
-
-    def record_failure(self):
-        """记录失败请求"""
-        if self.state == CircuitBreakerState.CLOSED:
-            self.failure_count += 1
-            self.last_failure_time = timezone.now()
-            
-            if self.failure_count >= self.config.failure_threshold:
-                self._open()
-        self._save_state()
-
-    def record_success(self):
-        """记录成功请求"""
-        if self.state == CircuitBreakerState.HALF_OPEN:
-            self._close()
-        self._save_state()
+        self.state_key = f"circuit_breaker:{instance.id}"
+        self.failures_key = f"{self.state_key}:failures"
+        self.window_ms = int(getattr(settings, 'CIRCUIT_BREAKER_WINDOW_SECONDS', 60) * 1000)
+        self.probe_quota = getattr(settings, 'CIRCUIT_BREAKER_HALF_OPEN_PROBES', 3)
+
+    @property
+    def enabled(self) -> bool:
+        return getattr(self.config, 'circuit_breaker_enabled', True)
+
+    @property
+    def recovery_ms(self) -> int:
+        return int(self.config.recovery_timeout * 1000)
+
+    @staticmethod
+    def _now_ms() -> int:
+        return int(time.time() * 1000)
+
+    def _update_mirror(self, state: str, open_until):
+        ttl = getattr(settings, 'CIRCUIT_BREAKER_LOCAL_TTL', 1.0)
+        _local_mirror[self.instance.id] = (state, int(open_until or 0), time.monotonic() + ttl)
+
+    def _run(self, name: str, keys, args) -> Optional[list]:
+        try:
+            _, scripts = _get_scripts()
+            return scripts[name](keys=keys, args=args)
+        except Exception as e:
+            logger.warning(f"Circuit breaker script '{name}' failed for instance {self.instance.id}: {e}")
+            return None
+
+    def record_failure(self, update_instance: bool = True):
+        """记录失败请求，update_instance为False时熔断打开不写实例状态（由调用方批量写入）"""
+        if not self.enabled:
+            return
+        result = self._run('failure', [self.state_key, self.failures_key], [
+            self._now_ms(), self.window_ms, self.config.failure_threshold,
+            self.recovery_ms, uuid.uuid4().hex
+        ])
+        if result is None:
+            return
+        state, open_until, transitioned = result
+        self._update_mirror(state, open_until)
+        if int(transitioned):
+            logger.warning(f"Circuit opened for instance {self.instance.id}")
+            if update_instance:
+                self.instance.mark_unhealthy()
+
+    def record_success(self, update_instance: bool = True):
+        """记录成功请求（关闭状态下只查本地镜像）"""
+        if not self.enabled or self._mirror_state() == CircuitBreakerState.CLOSED:
+            return
+        result = self._run('success', [self.state_key, self.failures_key], [self._now_ms()])
+        if result is None:
+            return
+        state, open_until, transitioned = result
+        self._update_mirror(state, open_until)
+        if int(transitioned):
+            logger.info(f"Circuit closed for instance {self.instance.id}")
+            if update_instance:
+                self.instance.mark_healthy()
 
     def allow_request(self) -> bool:
         """判断是否允许请求通过"""
-        if self.state == CircuitBreakerState.CLOSED:
+        if not self.enabled:
             return True
-        
-        if self.state == CircuitBreakerState.OPEN:
-            if timezone.now() >= self.recovery_time:
-                self.state = CircuitBreakerState.HALF_OPEN
+
+        entry = _local_mirror.get(self.instance.id)
+        if entry is not None and entry[2] > time.monotonic():
+            state, open_until, _ = entry
+            if state == CircuitBreakerState.CLOSED:
                 return True
-            return False
-        
-        # HALF_OPEN状态允许部分请求测试恢复
-        return True
-
-    def _open(self):
-        """开启熔断"""
-        self.state = CircuitBreakerState.OPEN
-        self.recovery_time = timezone.now() + timezone.timedelta(seconds=self.config.recovery_timeout)
-        self.instance.mark_unhealthy()
-        self._save_state()
-
-    def _close(self):
-        """关闭熔断（恢复正常）"""
-        self.state = CircuitBreakerState.CLOSED
-        self.failure_count = 0
-        self.instance.mark_healthy()
-        self._save_state()
\ No newline at end of file
+            if state == CircuitBreakerState.OPEN and self._now_ms() < open_until:
+                return False
+
+        result = self._run('acquire', [self.state_key], [self._now_ms(), self.recovery_ms, self.probe_quota])
+        if result is None:
+            # Redis不可用时放行，避免熔断器本身造成故障
+            return True
+        state, open_until, allowed = result
+        self._update_mirror(state, open_until)
+        return bool(int(allowed))
+
+    def open_remaining(self) -> float:
+        """只读查询打开状态还剩多少秒（按本地镜像，不执行脚本、不消耗半开探测名额），未打开为0"""
+        if not self.enabled:
+            return 0.0
+        entry = _local_mirror.get(self.instance.id)
+        if entry is None or entry[2] <= time.monotonic() or entry[0] != CircuitBreakerState.OPEN:
+            return 0.0
+        return max(0.0, (entry[1] - self._now_ms()) / 1000)
+
+    def _mirror_state(self) -> Optional[str]:
+        entry = _local_mirror.get(self.instance.id)
+        if entry is not None and entry[2] > time.monotonic():
+            return entry[0]
+        return None
+
+    @classmethod
+    def prefetch(cls, instance_ids: Iterable[int]):
+        """一次pipeline批量刷新多个实例的本地镜像"""
+        now = time.monotonic()
+        stale = [i for i in instance_ids if i not in _local_mirror or _local_mirror[i][2] <= now]
+        if not stale:
+            return
+        try:
+            client, _ = _get_scripts()
+            pipe = client.pipeline(transaction=False)
+            for instance_id in stale:
+                pipe.hmget(f"circuit_breaker:{instance_id}", 'state', 'open_until')
+            results = pipe.execute()
+        except Exception as e:
+            logger.warning(f"Circuit breaker prefetch failed: {e}")
+            return
+
+        expires_at = now + getattr(settings, 'CIRCUIT_BREAKER_LOCAL_TTL', 1.0)
+        for instance_id, (state, open_until) in zip(stale, results):
+            _local_mirror[instance_id] = (state or CircuitBreakerState.CLOSED, int(open_until or 0), expires_at)
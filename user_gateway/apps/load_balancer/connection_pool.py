@@ -0,0 +1,138 @@
+import asyncio
+import logging
+import threading
+import time
+from typing import Dict
+
+import aiohttp
+import requests
+from django.conf import settings
+from requests.adapters import HTTPAdapter
+from .selection import inflight_tracker
+
+logger = logging.getLogger(__name__)
+
+
+class UpstreamPool:
+    """单个上游实例的keep-alive连接池
+
+    连接数上限取LoadBalancerConfig.max_connections与实例max_connections中较小者，
+    空闲连接在idle_timeout后关闭；在途请求数同步到负载均衡器的inflight_tracker。
+    """
+
+    def __init__(self, instance_id: int, limit: int, idle_timeout: int, connect_timeout: int):
+        self.instance_id = instance_id
+        self.limit = limit
+        self.idle_timeout = idle_timeout
+        self.connect_timeout = connect_timeout
+        self.inflight = 0
+        self.last_used = time.monotonic()
+        connector = aiohttp.TCPConnector(
+            limit=limit,
+            keepalive_timeout=idle_timeout,
+            enable_cleanup_closed=True
+        )
+        self.session = aiohttp.ClientSession(connector=connector, auto_decompress=False)
+
+    @property
+    def saturated(self) -> bool:
+        return self.inflight >= self.limit
+
+    @property
+    def idle(self) -> bool:
+        return self.inflight == 0 and self.last_used + self.idle_timeout < time.monotonic()
+
+    def acquire(self):
+        self.inflight += 1
+        self.last_used = time.monotonic()
+        inflight_tracker.begin(self.instance_id)
+
+    def release(self):
+        self.inflight -= 1
+        self.last_used = time.monotonic()
+        inflight_tracker.end(self.instance_id)
+
+    async def close(self):
+        await self.session.close()
+
+
+class UpstreamPoolRegistry:
+    """按上游实例划分的连接池注册表（每个事件循环一份）"""
+
+    def __init__(self, sweep_interval: int = 30):
+        self.sweep_interval = sweep_interval
+        # 事件循环 -> {instance_id: UpstreamPool}
+        self._pools: Dict[asyncio.AbstractEventLoop, Dict[int, UpstreamPool]] = {}
+        self._last_sweep = time.monotonic()
+
+    def _loop_pools(self) -> Dict[int, UpstreamPool]:
+        loop = asyncio.get_running_loop()
+        pools = self._pools.get(loop)
+        if pools is None:
+            pools = self._pools[loop] = {}
+        return pools
+
+    def get(self, instance, config) -> UpstreamPool:
+        """获取实例的连接池，配置变化时重建"""
+        pools = self._loop_pools()
+        limit = min(config.max_connections, getattr(instance, 'max_connections', None) or config.max_connections)
+        pool = pools.get(instance.id)
+        if pool is None or pool.session.closed or (pool.limit, pool.idle_timeout) != (limit, config.idle_timeout):
+            if pool is not None and not pool.session.closed:
+                asyncio.ensure_future(pool.close())
+            pool = UpstreamPool(instance.id, limit, config.idle_timeout, config.connection_timeout)
+            pools[instance.id] = pool
+        self._maybe_sweep(pools)
+        return pool
+
+    def is_saturated(self, instance_id: int) -> bool:
+        """实例连接数是否已达上限（无事件循环时视为未饱和）"""
+        for pools in list(self._pools.values()):
+            pool = pools.get(instance_id)
+            if pool is not None and pool.saturated:
+                return True
+        return False
+
+    def stats(self) -> Dict[int, int]:
+        """各实例在途请求数"""
+        return {
+            instance_id: pool.inflight
+            for pools in list(self._pools.values()) for instance_id, pool in pools.items()
+        }
+
+    def _maybe_sweep(self, pools: Dict[int, UpstreamPool]):
+        """关闭长时间无请求的实例连接池（实例下线后不再被选中）"""
+        now = time.monotonic()
+        if now - self._last_sweep < self.sweep_interval:
+            return
+        self._last_sweep = now
+        for instance_id, pool in list(pools.items()):
+            if pool.idle:
+                del pools[instance_id]
+                asyncio.ensure_future(pool.close())
+                logger.debug(f"Evicted idle upstream pool for instance {instance_id}")
+
+
+upstream_pools = UpstreamPoolRegistry()
+
+# 同步调用（Admin Service、监控系统）的共享Session：base_url -> requests.Session
+_http_sessions: Dict[str, requests.Session] = {}
+_http_sessions_lock = threading.Lock()
+
+
+def get_http_session(base_url: str) -> requests.Session:
+    """获取指向某个服务的keep-alive Session"""
+    session = _http_sessions.get(base_url)
+    if session is None:
+        with _http_sessions_lock:
+            session = _http_sessions.get(base_url)
+            if session is None:
+                session = requests.Session()
+                adapter = HTTPAdapter(
+                    pool_connections=1,
+                    pool_maxsize=getattr(settings, 'HTTP_SESSION_POOL_SIZE', 20)
+                )
+                session.mount('http://', adapter)
+                session.mount('https://', adapter)
+                _http_sessions[base_url] = session
+    return session
@@ -0,0 +1,139 @@
+import bisect
+import heapq
+import math
+import threading
+import zlib
+from typing import Callable, Dict, Hashable, Iterable, List, Optional, Tuple
+
+try:
+    import xxhash
+except ImportError:  # xxhash为可选依赖
+    xxhash = None
+
+_MASK64 = 0xFFFFFFFFFFFFFFFF
+
+
+def _fmix64(value: int) -> int:
+    """MurmurHash3的64位终结混合函数"""
+    value ^= value >> 33
+    value = (value * 0xFF51AFD7ED558CCD) & _MASK64
+    value ^= value >> 33
+    value = (value * 0xC4CEB9FE1A85EC53) & _MASK64
+    value ^= value >> 33
+    return value
+
+
+def fast_hash(data: str) -> int:
+    """非加密64位哈希：优先xxhash，未安装时用crc32+murmur混合"""
+    raw = data.encode('utf-8')
+    if xxhash is not None:
+        return xxhash.xxh64_intdigest(raw)
+    return _fmix64(zlib.crc32(raw) | (zlib.crc32(raw, 0x9E3779B9) << 32))
+
+
+class ConsistentHashRing:
+    """带虚拟节点的一致性哈希环，支持有界负载(bounded loads)选择
+
+    节点增减只插入/删除该节点的虚拟节点，其余客户端的映射保持不变。
+    成员在实例快照重建时同步：路由失效消息和Endpoints变化会丢弃快照（LoadBalancer.invalidate_tenant），
+    下一次选择即按新成员重建并同步哈希环。
+    """
+
+    def __init__(self, vnodes: int = 160, load_factor: float = 1.25):
+        self.vnodes = vnodes
+        self.load_factor = load_factor
+        # (有序虚拟节点哈希, 对应节点)，整体替换以保证读取无锁
+        self._ring: Tuple[List[int], List[Hashable]] = ([], [])
+        self._nodes = frozenset()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._nodes)
+
+    @property
+    def nodes(self):
+        return set(self._nodes)
+
+    def _vnode_points(self, node: Hashable) -> List[Tuple[int, Hashable]]:
+        return sorted((fast_hash(f"{node}#{i}"), node) for i in range(self.vnodes))
+
+    def add(self, node: Hashable):
+        with self._lock:
+            if node in self._nodes:
+                return
+            hashes, owners = self._ring
+            merged = list(heapq.merge(zip(hashes, owners), self._vnode_points(node), key=lambda p: p[0]))
+            self._ring = ([h for h, _ in merged], [owner for _, owner in merged])
+            self._nodes = self._nodes | {node}
+
+    def remove(self, node: Hashable):
+        with self._lock:
+            if node not in self._nodes:
+                return
+            hashes, owners = self._ring
+            keep = [(h, owner) for h, owner in zip(hashes, owners) if owner != node]
+            self._ring = ([h for h, _ in keep], [owner for _, owner in keep])
+            self._nodes = self._nodes - {node}
+
+    def sync(self, nodes: Iterable[Hashable]) -> Tuple[set, set]:
+        """增量同步成员，返回(新增节点, 移除节点)"""
+        nodes = set(nodes)
+        added = nodes - self._nodes
+        removed = self._nodes - nodes
+        for node in removed:
+            self.remove(node)
+        for node in added:
+            self.add(node)
+        return added, removed
+
+    def get(self, key: str) -> Optional[Hashable]:
+        """普通一致性哈希：顺时针第一个虚拟节点"""
+        hashes, owners = self._ring
+        if not hashes:
+            return None
+        index = bisect.bisect(hashes, fast_hash(key)) % len(hashes)
+        return owners[index]
+
+    def get_bounded(self, key: str, load_of: Callable[[Hashable], int]) -> Optional[Hashable]:
+        """有界负载一致性哈希：跳过负载已达 ceil(c * 平均负载) 的节点
+
+        负载取自load_of，网关传入的是本进程的在途请求数：每个worker独立判断，
+        上界只约束本进程分配到各节点的请求，不是跨进程的全局负载。
+        """
+        hashes, owners = self._ring
+        if not hashes:
+            return None
+
+        nodes = self._nodes
+        node_count = max(len(nodes), 1)
+        total_load = sum(load_of(node) for node in nodes)
+        capacity = math.ceil(self.load_factor * (total_load + 1) / node_count)
+
+        start = bisect.bisect(hashes, fast_hash(key))
+        checked = set()
+        for offset in range(len(hashes)):
+            node = owners[(start + offset) % len(hashes)]
+            if node in checked:
+                continue
+            if load_of(node) < capacity:
+                return node
+            checked.add(node)
+            if len(checked) == node_count:
+                break
+        return owners[start % len(hashes)]
+
+
+# 进程内各路由的哈希环：route_id -> ConsistentHashRing
+_hash_rings: Dict[int, ConsistentHashRing] = {}
+_hash_rings_lock = threading.Lock()
+
+
+def get_hash_ring(route_id: int, vnodes: int, load_factor: float) -> ConsistentHashRing:
+    ring = _hash_rings.get(route_id)
+    if ring is None:
+        with _hash_rings_lock:
+            ring = _hash_rings.get(route_id)
+            if ring is None:
+                ring = ConsistentHashRing(vnodes, load_factor)
+                _hash_rings[route_id] = ring
+    return ring
@@ -19,6 +19,7 @@ class RouteRegistry(models.Model):
             ('weighted', '权重'),
             ('ip_hash', 'IP哈希'),
             ('response_time', '响应时间'),
+            ('peak_ewma', '延迟EWMA'),
         ],
         default='round_robin',
         verbose_name='负载均衡策略'
@@ -196,7 +197,7 @@ class RouteLog(models.Model):
     )
     error_message = models.TextField(null=True, blank=True, verbose_name='错误信息')
     
-    timestamp = models.DateTimeField(auto_now_add=True, db_index=True, verbose_name='时间戳')
+    timestamp = models.DateTimeField(default=timezone.now, db_index=True, verbose_name='时间戳')
     
     class Meta:
         db_table = 'route_logs'
@@ -0,0 +1,285 @@
+import asyncio
+import logging
+import time
+import uuid
+from typing import Optional, Tuple
+
+import aiohttp
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.http import HttpResponse, JsonResponse, StreamingHttpResponse
+from .balancer import LoadBalancer, get_user_route
+from .circuit_breaker import CircuitBreaker
+from .connection_pool import upstream_pools
+from .selection import latency_tracker
+from ..userdb.models import ContainerInstance
+from apps.route_management.route_writer import get_route_writer
+from apps.route_management.route_manager import get_k8s_route_manager
+from apps.route_management.cold_start import cold_start_queue
+
+logger = logging.getLogger(__name__)
+
+IDEMPOTENT_METHODS = {'GET', 'HEAD', 'OPTIONS', 'PUT', 'DELETE'}
+
+# 逐跳头部，不向上游/客户端转发
+HOP_BY_HOP_HEADERS = {
+    'connection', 'keep-alive', 'proxy-authenticate', 'proxy-authorization',
+    'te', 'trailers', 'transfer-encoding', 'upgrade', 'host', 'content-length',
+}
+
+class ServiceTarget:
+    """冷启动转发目标：扩容出的Pod尚未登记为实例，经租户Service转发"""
+
+    def __init__(self, tenant_id: str, service_url: str):
+        self.id = f"service:{tenant_id}"
+        self.instance_id = None
+        self.tenant_id = tenant_id
+        self.service_url = service_url
+        self.max_connections = None
+
+
+async def _cold_start_target(tenant_id: str) -> Optional[ServiceTarget]:
+    """租户已缩容到零时排队等待扩容，就绪后返回Service转发目标"""
+    if not getattr(settings, 'SCALE_TO_ZERO_ENABLED', True):
+        return None
+    manager = await sync_to_async(get_k8s_route_manager, thread_sensitive=False)()
+    informer = manager.informer
+    # 已有就绪Pod说明是实例不健康而非冷启动
+    if not informer.synced or informer.get_endpoints(tenant_id):
+        return None
+    if not await cold_start_queue.wait_async(tenant_id, manager.has_ready_endpoints, manager.wake_deployment):
+        return None
+    service = informer.get_service(tenant_id)
+    if service is None:
+        return None
+    port = service['ports'][0]['port'] if service['ports'] else 80
+    return ServiceTarget(tenant_id, f"http://{service['cluster_ip']}:{port}")
+
+
+def _select_instance(lb: LoadBalancer, exclude: set) -> ContainerInstance:
+    """选择实例，尽量避开已尝试过的实例和连接数已满的实例"""
+    instance = lb.select_instance()
+    for _ in range(len(exclude) + 2):
+        if instance.id not in exclude and not upstream_pools.is_saturated(instance.id):
+            break
+        instance = lb.select_instance()
+    return instance
+
+
+class UpstreamProxy:
+    """单次请求的上游转发：连接失败重试，幂等请求超时未返回时对冲到另一实例"""
+
+    def __init__(self, request, lb: LoadBalancer, path: str, body: Optional[bytes]):
+        self.request = request
+        self.lb = lb
+        self.config = lb.config
+        self.path = path
+        self.body = body
+        self.replayable = body is not None
+        self.idempotent = request.method in IDEMPOTENT_METHODS
+        self.tried = set()
+        # instance_id -> UpstreamPool，请求结束时归还
+        self.pools = {}
+        self.headers = {
+            name: value for name, value in request.headers.items()
+            if name.lower() not in HOP_BY_HOP_HEADERS
+        }
+        client_ip = request.META.get('REMOTE_ADDR', '')
+        forwarded = request.headers.get('X-Forwarded-For')
+        self.headers['X-Forwarded-For'] = f"{forwarded}, {client_ip}" if forwarded else client_ip
+        self.headers['X-Request-Id'] = request.headers.get('X-Request-Id') or str(uuid.uuid4())
+
+    def _target_url(self, instance: ContainerInstance) -> str:
+        query = self.request.META.get('QUERY_STRING')
+        url = f"{instance.service_url}/{self.path.lstrip('/')}"
+        return f"{url}?{query}" if query else url
+
+    async def _body_stream(self):
+        """不可重放的大请求体按块读取转发"""
+        while True:
+            chunk = await sync_to_async(self.request.read, thread_sensitive=False)(65536)
+            if not chunk:
+                break
+            yield chunk
+
+    async def _send(self, instance: ContainerInstance) -> aiohttp.ClientResponse:
+        self.tried.add(instance.id)
+        pool = upstream_pools.get(instance, self.config)
+        self.pools[instance.id] = pool
+        pool.acquire()
+        timeout = aiohttp.ClientTimeout(
+            total=None,
+            sock_connect=pool.connect_timeout,
+            sock_read=getattr(settings, 'PROXY_READ_TIMEOUT', 60)
+        )
+        start_time = time.monotonic()
+        try:
+            response = await pool.session.request(
+                self.request.method,
+                self._target_url(instance),
+                headers=self.headers,
+                data=self.body if self.replayable else self._body_stream(),
+                allow_redirects=False,
+                timeout=timeout
+            )
+        except BaseException:
+            pool.release()
+            raise
+        # peak_ewma只使用实测的上游延迟（到收到响应头为止）
+        if isinstance(instance, ContainerInstance):
+            latency_tracker.observe(instance.id, (time.monotonic() - start_time) * 1000)
+        return response
+
+    async def send_to(self, target: ServiceTarget) -> Tuple[aiohttp.ClientResponse, ServiceTarget]:
+        """直接转发到指定目标（不经负载均衡选择，不重试）"""
+        return await self._send(target), target
+
+    def finish(self, instance: ContainerInstance):
+        """请求结束，归还连接池占用"""
+        pool = self.pools.get(instance.id)
+        if pool is not None:
+            pool.release()
+
+    async def _pick(self) -> ContainerInstance:
+        return await sync_to_async(_select_instance, thread_sensitive=False)(self.lb, set(self.tried))
+
+    async def _send_hedged(self, instance: ContainerInstance) -> Tuple[aiohttp.ClientResponse, ContainerInstance]:
+        """首个请求在对冲延迟内未返回响应头时，向另一实例并发发送，取先返回者"""
+        first = asyncio.ensure_future(self._send(instance))
+        done, _ = await asyncio.wait({first}, timeout=getattr(settings, 'PROXY_HEDGE_DELAY_MS', 300) / 1000)
+        if done:
+            return first.result(), instance
+
+        second_instance = await self._pick()
+        if second_instance.id == instance.id:
+            return await first, instance
+
+        second = asyncio.ensure_future(self._send(second_instance))
+        owners = {first: instance, second: second_instance}
+        pending = set(owners)
+        winner, error = None, None
+        while pending and winner is None:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                if task.exception() is not None:
+                    error = task.exception()
+                elif winner is None:
+                    winner = task
+                else:
+                    # 同时返回的另一个响应直接丢弃
+                    task.result().release()
+                    self.finish(owners[task])
+
+        for task in pending:
+            task.cancel()
+        if winner is None:
+            raise error
+        return winner.result(), owners[winner]
+
+    async def send(self) -> Tuple[aiohttp.ClientResponse, ContainerInstance]:
+        attempts = 1 + max(self.config.retry_attempts, 0) if self.replayable else 1
+        last_error = None
+        for attempt in range(attempts):
+            instance = await self._pick()
+            try:
+                if self.idempotent and self.replayable:
+                    return await self._send_hedged(instance)
+                return await self._send(instance), instance
+            except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                last_error = e
+                logger.warning(f"Upstream {instance.service_url} failed (attempt {attempt + 1}/{attempts}): {e}")
+                await sync_to_async(CircuitBreaker(instance, self.config).record_failure, thread_sensitive=False)()
+                # 非幂等请求只在连接未建立时重试
+                if not self.idempotent and not isinstance(e, aiohttp.ClientConnectorError):
+                    break
+                if attempt + 1 < attempts:
+                    await asyncio.sleep(self.config.retry_delay)
+        raise last_error
+
+
+async def proxy_request(request, path=''):
+    """将已认证用户的请求流式转发到其容器实例"""
+    start_time = time.time()
+    user = getattr(request, 'user', None)
+    if user is None or not user.is_authenticated:
+        return JsonResponse({'status': 'error', 'message': 'Authentication required'}, status=401)
+
+    route = await sync_to_async(get_user_route, thread_sensitive=False)(user.pk)
+    if route is None:
+        return JsonResponse({'status': 'error', 'message': 'Route not found'}, status=404)
+    lb = LoadBalancer(route, client_ip=request.META.get('REMOTE_ADDR'))
+
+    # 小请求体读入内存以便重试/对冲，大请求体流式转发且不重试
+    content_length = int(request.META.get('CONTENT_LENGTH') or 0)
+    body = request.body if content_length <= getattr(settings, 'PROXY_REPLAY_BODY_LIMIT', 1048576) else None
+
+    proxy = UpstreamProxy(request, lb, path, body)
+    try:
+        try:
+            upstream, instance = await proxy.send()
+        except RuntimeError as e:
+            target = await _cold_start_target(str(user.pk))
+            if target is None:
+                response = JsonResponse({'status': 'error', 'message': str(e)}, status=503)
+                response['Retry-After'] = str(getattr(settings, 'SINGLE_FLIGHT_RETRY_AFTER', 5))
+                return response
+            upstream, instance = await proxy.send_to(target)
+    except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+        get_route_writer().record({
+            'tenant_id': user.pk,
+            'request_id': proxy.headers['X-Request-Id'],
+            'method': request.method,
+            'path': request.path,
+            'client_ip': request.META.get('REMOTE_ADDR', ''),
+            'response_status': 502,
+            'response_time': (time.time() - start_time) * 1000,
+            'success': False,
+            'error_type': 'timeout' if isinstance(e, asyncio.TimeoutError) else 'connection',
+            'error_message': str(e),
+        })
+        return JsonResponse({'status': 'error', 'message': 'Upstream unavailable'}, status=502)
+
+    target_url = instance.service_url
+
+    async def stream_body():
+        success = False
+        try:
+            async for chunk in upstream.content.iter_chunked(65536):
+                yield chunk
+            success = upstream.status < 500
+            if success and isinstance(instance, ContainerInstance):
+                await sync_to_async(CircuitBreaker(instance, lb.config).record_success, thread_sensitive=False)()
+        finally:
+            upstream.release()
+            proxy.finish(instance)
+            get_route_writer().record({
+                'tenant_id': getattr(instance, 'tenant_id', None),
+                'instance_id': instance.instance_id,
+                'container_instance_id': instance.id if isinstance(instance, ContainerInstance) else None,
+                'request_id': proxy.headers['X-Request-Id'],
+                'method': request.method,
+                'path': request.path,
+                'client_ip': request.META.get('REMOTE_ADDR', ''),
+                'user_agent': request.META.get('HTTP_USER_AGENT', ''),
+                'target_url': target_url,
+                'response_status': upstream.status,
+                'response_time': (time.time() - start_time) * 1000,
+                'success': success,
+                'upstream_success': success,
+                'error_type': 'server' if upstream.status >= 500 else None,
+            })
+
+    if request.method == 'HEAD':
+        response = HttpResponse(status=upstream.status)
+        upstream.release()
+        proxy.finish(instance)
+    else:
+        response = StreamingHttpResponse(stream_body(), status=upstream.status)
+    for name, value in upstream.headers.items():
+        if name.lower() not in HOP_BY_HOP_HEADERS:
+            response[name] = value
+    return response
+
+
+# Django 4.2的csrf_exempt装饰器不支持异步视图，直接标记
+proxy_request.csrf_exempt = True
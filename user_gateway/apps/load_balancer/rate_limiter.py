@@ -0,0 +1,111 @@
+import logging
+import math
+import threading
+import time
+from typing import Dict, Tuple
+
+import redis
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+# 令牌桶：KEYS[1] 桶哈希  ARGV: now_ms, rate_per_ms, capacity, requested
+# 返回 [发放令牌数, 令牌不足时的重试等待毫秒]
+ACQUIRE_TOKENS_SCRIPT = """
+local now = tonumber(ARGV[1])
+local rate = tonumber(ARGV[2])
+local capacity = tonumber(ARGV[3])
+local requested = tonumber(ARGV[4])
+local bucket = redis.call('HMGET', KEYS[1], 'tokens', 'ts')
+local tokens = tonumber(bucket[1]) or capacity
+local ts = tonumber(bucket[2]) or now
+tokens = math.min(capacity, tokens + math.max(0, now - ts) * rate)
+local granted = math.min(requested, math.floor(tokens))
+tokens = tokens - granted
+redis.call('HSET', KEYS[1], 'tokens', tostring(tokens), 'ts', now)
+redis.call('PEXPIRE', KEYS[1], math.ceil(capacity / rate) + 1000)
+if granted > 0 then
+    return {granted, 0}
+end
+return {0, math.ceil((1 - tokens) / rate)}
+"""
+
+
+class RateLimiter:
+    """Redis令牌桶限流，进程内预取租约
+
+    每次访问Redis预取一批令牌（lease_seconds内按速率应发放的令牌数，至少min_lease个，
+    且不超过桶容量的1/10），本地用完或租约过期前不再访问Redis；令牌不足时返回需要等待的秒数。
+    """
+
+    def __init__(self, lease_seconds: float = None, min_lease: int = None, lease_ttl: float = None):
+        self.lease_seconds = lease_seconds or getattr(settings, 'RATE_LIMIT_LEASE_SECONDS', 1.0)
+        self.min_lease = min_lease or getattr(settings, 'RATE_LIMIT_MIN_LEASE', 10)
+        self.lease_ttl = lease_ttl or getattr(settings, 'RATE_LIMIT_LEASE_TTL', 1.0)
+        # key -> [本地剩余令牌, 租约过期时间]
+        self._leases: Dict[str, list] = {}
+        # key -> 被拒绝后到该时间之前直接拒绝（避免每个请求都访问Redis）
+        self._blocked_until: Dict[str, float] = {}
+        self._lock = threading.Lock()
+        self._script = None
+
+    def _get_script(self):
+        if self._script is None:
+            client = redis.Redis(
+                host=settings.REDIS_HOST,
+                port=settings.REDIS_PORT,
+                db=settings.REDIS_DB,
+                password=settings.REDIS_PASSWORD,
+                socket_timeout=0.05
+            )
+            self._script = client.register_script(ACQUIRE_TOKENS_SCRIPT)
+        return self._script
+
+    def acquire(self, key: str, requests_per_minute: int, burst: int = None) -> Tuple[bool, float]:
+        """尝试获取一个令牌，返回(是否允许, 需等待秒数)"""
+        now = time.monotonic()
+        blocked_until = self._blocked_until.get(key)
+        if blocked_until is not None:
+            if blocked_until > now:
+                return False, blocked_until - now
+            self._blocked_until.pop(key, None)
+
+        with self._lock:
+            lease = self._leases.get(key)
+            if lease is not None and lease[0] > 0 and lease[1] > now:
+                lease[0] -= 1
+                return True, 0.0
+
+        capacity = burst or requests_per_minute
+        lease_size = self.lease_size(requests_per_minute, capacity)
+        try:
+            granted, retry_ms = self._get_script()(
+                keys=[f"rate_limit:{key}"],
+                args=[int(time.time() * 1000), requests_per_minute / 60000, capacity, lease_size]
+            )
+        except Exception as e:
+            # Redis不可用时放行
+            logger.warning(f"Rate limiter unavailable for {key}: {e}")
+            return True, 0.0
+
+        granted = int(granted)
+        if granted <= 0:
+            retry_after = int(retry_ms) / 1000
+            self._blocked_until[key] = now + retry_after
+            return False, retry_after
+
+        with self._lock:
+            self._leases[key] = [granted - 1, now + self.lease_ttl]
+        return True, 0.0
+
+    def lease_size(self, requests_per_minute: int, capacity: int) -> int:
+        """单次预取的令牌数；低速率的小桶不让一个进程占满"""
+        size = max(self.min_lease, int(requests_per_minute / 60 * self.lease_seconds))
+        return max(1, min(size, capacity // 10))
+
+
+rate_limiter = RateLimiter()
+
+
+def retry_after_header(seconds: float) -> str:
+    return str(max(1, math.ceil(seconds)))
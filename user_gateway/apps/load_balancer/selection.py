@@ -0,0 +1,153 @@
+import itertools
+import logging
+import math
+import random
+import threading
+import time
+from typing import Dict, List, Sequence
+
+import redis
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+
+class AliasTable:
+    """Vose别名表，按权重随机选择，构建O(n)、选择O(1)"""
+
+    def __init__(self, weights: Sequence[float]):
+        n = len(weights)
+        total = float(sum(weights))
+        if total <= 0:
+            weights = [1] * n
+            total = float(n)
+
+        scaled = [w * n / total for w in weights]
+        self.size = n
+        self.prob = [1.0] * n
+        self.alias = list(range(n))
+
+        small = [i for i, p in enumerate(scaled) if p < 1.0]
+        large = [i for i, p in enumerate(scaled) if p >= 1.0]
+        while small and large:
+            s = small.pop()
+            l = large.pop()
+            self.prob[s] = scaled[s]
+            self.alias[s] = l
+            scaled[l] = scaled[l] + scaled[s] - 1.0
+            if scaled[l] < 1.0:
+                small.append(l)
+            else:
+                large.append(l)
+
+    def pick(self) -> int:
+        r = random.random() * self.size
+        i = int(r)
+        return i if r - i < self.prob[i] else self.alias[i]
+
+
+class SharedCounter:
+    """跨gunicorn worker共享的递增计数器（Redis INCR），Redis不可用时退化为进程内计数"""
+
+    def __init__(self, prefix: str = "lb:rr"):
+        self.prefix = prefix
+        self._redis_client = None
+        self._local = {}
+        self._lock = threading.Lock()
+
+    def _client(self):
+        if self._redis_client is None:
+            self._redis_client = redis.Redis(
+                host=settings.REDIS_HOST,
+                port=settings.REDIS_PORT,
+                db=settings.REDIS_DB,
+                password=settings.REDIS_PASSWORD,
+                socket_timeout=0.05
+            )
+        return self._redis_client
+
+    def next(self, key) -> int:
+        try:
+            return self._client().incr(f"{self.prefix}:{key}")
+        except Exception as e:
+            logger.debug(f"Shared counter unavailable, using local counter: {e}")
+            with self._lock:
+                counter = self._local.setdefault(key, itertools.count())
+            return next(counter)
+
+
+class InflightTracker:
+    """进程内各实例在途请求计数"""
+
+    def __init__(self):
+        self._counts: Dict[int, int] = {}
+        self._lock = threading.Lock()
+
+    def get(self, instance_id: int) -> int:
+        return self._counts.get(instance_id, 0)
+
+    def begin(self, instance_id: int):
+        with self._lock:
+            self._counts[instance_id] = self._counts.get(instance_id, 0) + 1
+
+    def end(self, instance_id: int):
+        with self._lock:
+            count = self._counts.get(instance_id, 0) - 1
+            if count > 0:
+                self._counts[instance_id] = count
+            else:
+                self._counts.pop(instance_id, None)
+
+
+class PeakEwmaTracker:
+    """各实例真实流量延迟的Peak-EWMA估计（毫秒）
+
+    样本只来自代理实测的上游延迟（发出请求到收到响应头），按ContainerInstance.id索引。
+
+    新样本高于当前值时直接取峰值，否则按距上次样本的时间指数衰减，
+    使延迟突增立刻生效、恢复则平滑回落。
+    """
+
+    def __init__(self, decay_seconds: float = 10.0, default_rtt: float = 100.0):
+        self.decay_seconds = decay_seconds
+        self.default_rtt = default_rtt
+        # ContainerInstance.id -> (ewma, 上次更新时间)
+        self._stats: Dict[int, tuple] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, instance_id: int, rtt: float):
+        now = time.monotonic()
+        with self._lock:
+            previous = self._stats.get(instance_id)
+            if previous is None or rtt > previous[0]:
+                cost = rtt
+            else:
+                weight = math.exp(-(now - previous[1]) / self.decay_seconds)
+                cost = previous[0] * weight + rtt * (1 - weight)
+            self._stats[instance_id] = (cost, now)
+
+    def cost(self, instance_id: int) -> float:
+        entry = self._stats.get(instance_id)
+        return entry[0] if entry is not None else self.default_rtt
+
+
+class InstancePool:
+    """某条路由的可用实例快照及预计算的选择结构"""
+
+    def __init__(self, instances: List, expires_at: float, fastest_index: int = 0, hash_ring=None):
+        self.instances = instances
+        self.instances_by_id = {inst.id: inst for inst in instances}
+        self.expires_at = expires_at
+        self.alias_table = AliasTable([inst.weight for inst in instances]) if instances else None
+        # 构建时按近期健康检查响应时间选出的最优实例下标
+        self.fastest_index = fastest_index
+        # ip_hash使用的一致性哈希环（按路由跨快照复用，成员变化时增量更新）
+        self.hash_ring = hash_ring
+
+
+shared_counter = SharedCounter()
+inflight_tracker = InflightTracker()
+latency_tracker = PeakEwmaTracker(
+    getattr(settings, 'LB_PEAK_EWMA_DECAY_SECONDS', 10.0),
+    getattr(settings, 'LB_PEAK_EWMA_DEFAULT_RTT_MS', 100.0)
+)
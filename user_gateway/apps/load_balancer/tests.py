@@ -1,3 +1,4 @@
+import time
 from django.test import TestCase
 from django.contrib.auth import get_user_model
 from ..userdb.models import User, UserContainer, ContainerInstance
@@ -34,3 +35,225 @@ class LoadBalancerTests(TestCase):
         )
         self.assertEqual(record.container_instance, self.instance)
         self.assertTrue(record.is_healthy)
+
+    def test_invalidate_tenant(self):
+        """测试按租户失效丢弃路由注册缓存和实例快照"""
+        from . import balancer
+        tenant_id = str(self.user.id)
+        balancer._user_routes[tenant_id] = (self.route, time.monotonic() + 30)
+        balancer._instance_pools[self.route.id] = object()
+        balancer._tenant_pools[tenant_id].add(self.route.id)
+        balancer.LoadBalancer.invalidate_tenant(self.user.id)
+        self.assertNotIn(tenant_id, balancer._user_routes)
+        self.assertNotIn(self.route.id, balancer._instance_pools)
+
+    def test_hash_ring_resynced_after_invalidate(self):
+        """测试实例成员变化并失效后，哈希环按新成员同步"""
+        from unittest import mock
+        from . import balancer
+        from .hash_ring import get_hash_ring
+        self.route.load_balance_strategy = 'ip_hash'
+        balancer.LoadBalancer.invalidate_tenant(self.user.id)
+        with mock.patch.object(balancer, 'CircuitBreaker') as breaker:
+            breaker.return_value.open_remaining.return_value = 0.0
+            breaker.return_value.allow_request.return_value = True
+            lb = balancer.LoadBalancer(self.route, client_ip='10.1.1.1')
+            lb.select_instance()
+            second = ContainerInstance.objects.create(
+                container=self.container,
+                instance_id="inst-2",
+                pod_ip="10.0.0.2",
+                port=8080,
+                status='running',
+                is_healthy=True
+            )
+            balancer.LoadBalancer.invalidate_tenant(self.user.id)
+            lb.select_instance()
+        ring = get_hash_ring(self.route.id, 160, 1.25)
+        self.assertEqual(ring.nodes, {self.instance.id, second.id})
+
+    def test_pool_build_does_not_acquire_probes(self):
+        """测试构建快照只读熔断状态，打开的实例在恢复超时到期时重新参与选择"""
+        from unittest import mock
+        from . import balancer
+        balancer.LoadBalancer.invalidate_tenant(self.user.id)
+        with mock.patch.object(balancer, 'CircuitBreaker') as breaker:
+            breaker.return_value.open_remaining.return_value = 5.0
+            pool = balancer.LoadBalancer(self.route)._build_pool()
+        breaker.return_value.allow_request.assert_not_called()
+        self.assertEqual(pool.instances, [])
+        self.assertLessEqual(pool.expires_at, time.monotonic() + 5.0)
+
+
+class AliasTableTests(TestCase):
+    def test_zero_weight_never_selected(self):
+        """测试权重为0的实例不会被选中"""
+        from .selection import AliasTable
+        table = AliasTable([0, 100, 0])
+        for _ in range(200):
+            self.assertEqual(table.pick(), 1)
+
+    def test_weight_distribution(self):
+        """测试选择频率与权重成比例"""
+        from .selection import AliasTable
+        table = AliasTable([100, 300])
+        picks = [table.pick() for _ in range(20000)]
+        ratio = picks.count(1) / len(picks)
+        self.assertAlmostEqual(ratio, 0.75, delta=0.03)
+
+
+class ConsistentHashRingTests(TestCase):
+    def test_scale_out_moves_few_keys(self):
+        """测试新增实例时只有少量客户端迁移"""
+        from .hash_ring import ConsistentHashRing
+        ring = ConsistentHashRing(vnodes=160)
+        ring.sync(range(1, 5))
+        keys = [f"10.0.{i // 256}.{i % 256}" for i in range(4000)]
+        before = {key: ring.get(key) for key in keys}
+
+        ring.add(5)
+        moved = [key for key in keys if ring.get(key) != before[key]]
+        self.assertTrue(all(ring.get(key) == 5 for key in moved))
+        self.assertLess(len(moved) / len(keys), 0.3)
+
+    def test_bounded_load_skips_overloaded_node(self):
+        """测试负载超过上限的实例会被跳过"""
+        from .hash_ring import ConsistentHashRing
+        ring = ConsistentHashRing(vnodes=50, load_factor=1.25)
+        ring.sync([1, 2, 3])
+        key = "192.168.1.10"
+        preferred = ring.get(key)
+        loads = {1: 0, 2: 0, 3: 0}
+        loads[preferred] = 10
+        self.assertNotEqual(ring.get_bounded(key, loads.get), preferred)
+
+
+class PeakEwmaTrackerTests(TestCase):
+    def test_peak_then_decay(self):
+        """测试延迟突增立即生效，之后随样本回落"""
+        from .selection import PeakEwmaTracker
+        tracker = PeakEwmaTracker(decay_seconds=0.001, default_rtt=50.0)
+        self.assertEqual(tracker.cost(1), 50.0)
+        tracker.observe(1, 20.0)
+        tracker.observe(1, 500.0)
+        self.assertEqual(tracker.cost(1), 500.0)
+        time.sleep(0.01)
+        tracker.observe(1, 20.0)
+        self.assertLess(tracker.cost(1), 30.0)
+
+
+class RateLimiterLeaseTests(TestCase):
+    def test_lease_avoids_redis_calls(self):
+        """测试默认速率下连续请求大多由本地租约放行"""
+        from .rate_limiter import RateLimiter
+        limiter = RateLimiter(lease_seconds=1.0, min_lease=10, lease_ttl=60)
+        calls = []
+
+        def script(keys, args):
+            calls.append(args)
+            return [args[3], 0]
+
+        limiter._script = script
+        for _ in range(20):
+            allowed, _ = limiter.acquire('user-1', requests_per_minute=1000)
+            self.assertTrue(allowed)
+        self.assertLess(len(calls), 20)
+        self.assertGreater(calls[0][3], 1)
+
+    def test_lease_bounded_by_capacity(self):
+        """测试小容量桶的租约不超过容量的1/10"""
+        from .rate_limiter import RateLimiter
+        limiter = RateLimiter(lease_seconds=1.0, min_lease=10)
+        self.assertEqual(limiter.lease_size(10, 10), 1)
+        self.assertEqual(limiter.lease_size(1000, 1000), 16)
+
+
+class ProxyRequestTests(TestCase):
+    def setUp(self):
+        from types import SimpleNamespace
+        from unittest import mock
+        from django.test import RequestFactory
+        from . import proxy
+        self.proxy = proxy
+        self.first = SimpleNamespace(id=1, instance_id='inst-1', service_url='http://10.0.0.1:8000')
+        self.second = SimpleNamespace(id=2, instance_id='inst-2', service_url='http://10.0.0.2:8000')
+        self.lb = mock.Mock()
+        self.lb.config = SimpleNamespace(retry_attempts=1, retry_delay=0)
+        self.factory = RequestFactory()
+        for target in ('CircuitBreaker', 'get_user_route'):
+            patcher = mock.patch.object(proxy, target)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        patcher = mock.patch.object(proxy, 'LoadBalancer', return_value=self.lb)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def _patch_upstream(self, send):
+        from unittest import mock
+        instances = iter([self.first, self.second])
+
+        async def pick(proxy_self):
+            return next(instances)
+
+        for name, func in (('_pick', pick), ('_send', send)):
+            patcher = mock.patch.object(self.proxy.UpstreamProxy, name, func)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def test_retry_on_upstream_failure(self):
+        """测试上游失败后重试到另一实例并记录熔断失败"""
+        import asyncio
+        from unittest import mock
+
+        async def send(proxy_self, instance):
+            if instance is self.first:
+                raise asyncio.TimeoutError()
+            return mock.Mock(status=200, headers={})
+
+        self._patch_upstream(send)
+        request = self.factory.head('/proxy/items')
+        request.user = mock.Mock(is_authenticated=True, pk=1)
+        response = asyncio.run(self.proxy.proxy_request(request, 'items'))
+        self.assertEqual(response.status_code, 200)
+        self.proxy.CircuitBreaker.assert_called_once_with(self.first, self.lb.config)
+
+    def test_hedge_to_second_instance(self):
+        """测试首个实例超过对冲延迟未响应时取另一实例的响应"""
+        import asyncio
+        from unittest import mock
+        from django.test import override_settings
+        slow = mock.Mock(status=200, headers={})
+        fast = mock.Mock(status=200, headers={})
+
+        async def send(proxy_self, instance):
+            if instance is self.first:
+                await asyncio.sleep(1)
+                return slow
+            return fast
+
+        self._patch_upstream(send)
+        request = self.factory.get('/proxy/items')
+        upstream = self.proxy.UpstreamProxy(request, self.lb, 'items', b'')
+        with override_settings(PROXY_HEDGE_DELAY_MS=10):
+            response, instance = asyncio.run(upstream.send())
+        self.assertIs(response, fast)
+        self.assertIs(instance, self.second)
+
+    def test_upstream_latency_feeds_peak_ewma(self):
+        """测试peak_ewma样本取自代理实测的上游延迟，按实例主键索引"""
+        import asyncio
+        from unittest import mock
+        from ..userdb.models import ContainerInstance
+        from .selection import PeakEwmaTracker
+
+        instance = ContainerInstance(id=5, instance_id='inst-1', pod_ip='10.0.0.1', port=8000)
+        pool = mock.Mock(connect_timeout=1)
+        pool.session.request = mock.AsyncMock(return_value=mock.Mock(status=200))
+        tracker = PeakEwmaTracker(default_rtt=1000.0)
+        request = self.factory.get('/proxy/items')
+        upstream = self.proxy.UpstreamProxy(request, self.lb, 'items', b'')
+        with mock.patch.object(self.proxy.upstream_pools, 'get', return_value=pool), \
+                mock.patch.object(self.proxy, 'latency_tracker', tracker):
+            asyncio.run(upstream._send(instance))
+        self.assertLess(tracker.cost(5), 1000.0)
+        self.assertEqual(tracker.cost('inst-1'), 1000.0)
@@ -1,3 +1,5 @@
+import time
+import uuid
 from django.http import JsonResponse
 from django.views.decorators.http import require_http_methods
 from .models import RouteRegistry, RouteLog
@@ -10,6 +12,7 @@ from rest_framework.authentication import TokenAuthentication
 from rest_framework.permissions import IsAuthenticated
 from rest_framework.exceptions import AuthenticationFailed
 from apps.route_management.utils import TokenValidator
+from apps.route_management.route_writer import get_route_writer
 
 @require_http_methods(["GET"])
 @api_view(['GET'])
@@ -31,33 +34,36 @@ def get_healthy_instances(request, tenant_id):
         
         # 原有业务逻辑
         route_registry = RouteRegistry.objects.get(user__tenant_id=tenant_id, is_active=True)
-        lb = LoadBalancer(route_registry)
+        lb = LoadBalancer(route_registry, client_ip=request.META.get('REMOTE_ADDR'))
         instance = lb.select_instance()
         
         # 记录请求开始时间
         start_time = time.time()
+        lb.begin_request(instance)
+        try:
+            # 实际请求处理逻辑...
+            response_status = 200
+            response_time = (time.time() - start_time) * 1000
+            response_size = 1024
+        finally:
+            lb.end_request(instance)
         
-        # 实际请求处理逻辑...
-        response_status = 200
-        response_time = (time.time() - start_time) * 1000
-        response_size = 1024
-        
-        # 创建路由日志
-        RouteLog.objects.create(
-            route_registry=route_registry,
-            container_instance=instance,
-            request_id=str(uuid.uuid4()),
-            request_method=request.method,
-            request_path=request.path,
-            request_headers=dict(request.headers),
-            client_ip=request.META.get('REMOTE_ADDR', ''),
-            user_agent=request.META.get('HTTP_USER_AGENT', ''),
-            target_url=f"http://{instance.pod_ip}:{instance.port}{request.path}",
-            load_balance_strategy=lb.strategy,
-            response_status=response_status,
-            response_time=response_time,
-            response_size=response_size
-        )
+        # 路由日志由后台批量写入
+        get_route_writer().record({
+            'instance_id': instance.instance_id,
+            'container_instance_id': instance.id,
+            'request_id': str(uuid.uuid4()),
+            'method': request.method,
+            'path': request.path,
+            'headers': dict(request.headers),
+            'client_ip': request.META.get('REMOTE_ADDR', ''),
+            'user_agent': request.META.get('HTTP_USER_AGENT', ''),
+            'target_url': f"http://{instance.pod_ip}:{instance.port}{request.path}",
+            'response_status': response_status,
+            'response_time': response_time,
+            'response_size': response_size,
+            'success': True,
+        })
         
         # 更新熔断器成功状态
         cb = CircuitBreaker(instance, lb.config)
@@ -0,0 +1,107 @@
+import asyncio
+import logging
+import threading
+from collections import defaultdict
+from typing import Callable, Dict, List, Tuple
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from .single_flight import single_flight
+
+logger = logging.getLogger(__name__)
+
+
+class ColdStartQueue:
+    """缩容到零的租户的请求缓冲队列
+
+    异步代理的请求到达时若租户没有就绪Pod，进入有界等待队列并（每个租户只一次）触发扩容，
+    informer收到该租户Endpoints变为就绪的watch事件后唤醒所有等待者；
+    队列已满或等待超时时由调用方返回503。同步视图不排队，只触发扩容（wake）后返回503，
+    避免占用worker线程。
+    """
+
+    def __init__(self, max_waiters: int = None, timeout: float = None):
+        self.max_waiters = max_waiters or getattr(settings, 'COLD_START_QUEUE_SIZE', 200)
+        self.timeout = timeout or getattr(settings, 'COLD_START_TIMEOUT', 60)
+        self._lock = threading.Lock()
+        self._waiting = 0
+        # tenant_id -> [(事件循环, Future), ...]
+        self._futures: Dict[str, List[Tuple[asyncio.AbstractEventLoop, asyncio.Future]]] = defaultdict(list)
+
+    @property
+    def waiting(self) -> int:
+        return self._waiting
+
+    def _reserve(self) -> bool:
+        with self._lock:
+            if self._waiting >= self.max_waiters:
+                return False
+            self._waiting += 1
+            return True
+
+    def _release(self):
+        with self._lock:
+            self._waiting -= 1
+
+    @staticmethod
+    def _should_wake(tenant_id: str) -> bool:
+        """跨进程在锁有效期内只触发一次扩容"""
+        return single_flight.acquire_once(f"wake:{tenant_id}", getattr(settings, 'COLD_START_WAKE_TTL', 30))
+
+    def notify_ready(self, tenant_id: str):
+        """租户Endpoints变为就绪（informer watch线程调用），唤醒全部等待者"""
+        tenant_id = str(tenant_id)
+        with self._lock:
+            futures = self._futures.pop(tenant_id, [])
+        for loop, future in futures:
+            loop.call_soon_threadsafe(_resolve, future)
+        if futures:
+            logger.info(f"Tenant {tenant_id} is ready, released cold-start waiters")
+
+    def wake(self, tenant_id: str, wake: Callable[[str], None]) -> bool:
+        """只触发扩容不等待（同步路径使用），返回本次是否触发"""
+        tenant_id = str(tenant_id)
+        if not self._should_wake(tenant_id):
+            return False
+        wake(tenant_id)
+        return True
+
+    async def wait_async(self, tenant_id: str, is_ready: Callable[[str], bool], wake: Callable[[str], None]) -> bool:
+        """等待租户就绪，返回是否就绪（队列已满或超时返回False）；等待期间不占用线程"""
+        tenant_id = str(tenant_id)
+        if is_ready(tenant_id):
+            return True
+        if not self._reserve():
+            logger.warning(f"Cold-start queue full, rejecting request for tenant {tenant_id}")
+            return False
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        entry = (loop, future)
+        try:
+            with self._lock:
+                self._futures[tenant_id].append(entry)
+            if is_ready(tenant_id):
+                return True
+            if self._should_wake(tenant_id):
+                await sync_to_async(wake, thread_sensitive=False)(tenant_id)
+            try:
+                await asyncio.wait_for(future, self.timeout)
+                return True
+            except asyncio.TimeoutError:
+                return is_ready(tenant_id)
+        finally:
+            with self._lock:
+                waiters = self._futures.get(tenant_id)
+                if waiters and entry in waiters:
+                    waiters.remove(entry)
+                    if not waiters:
+                        del self._futures[tenant_id]
+            self._release()
+
+
+def _resolve(future: asyncio.Future):
+    if not future.done():
+        future.set_result(True)
+
+
+cold_start_queue = ColdStartQueue()
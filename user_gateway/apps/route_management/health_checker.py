@@ -1,134 +1,261 @@
 import asyncio
+import logging
+import time
+from collections import defaultdict
+from typing import Dict, List, Optional
 
-from django.db.models import F
 import aiohttp
-import logging
-from typing import Dict, List
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import close_old_connections, transaction
+from django.db.models import F
 from django.utils import timezone
-from userdb.models import UserContainer, ContainerEndpoint, ContainerInstance
-from .route_manager import K8sRouteManager
+from userdb.models import UserContainer, ContainerInstance
+from .route_manager import get_k8s_route_manager
 from ..load_balancer.circuit_breaker import CircuitBreaker
-from .services import RouteManagementService  
+from ..load_balancer.models import HealthCheckRecord
 
 logger = logging.getLogger(__name__)
 
 
+class ProbeSchedule:
+    """单个Pod的自适应探测间隔：稳定健康时逐步退避，状态翻转或失败时收紧"""
+
+    __slots__ = ('interval', 'next_at', 'healthy')
+
+    def __init__(self, interval: float):
+        self.interval = interval
+        self.next_at = 0.0
+        self.healthy: Optional[bool] = None
+
+    def update(self, healthy: bool, min_interval: float, max_interval: float, backoff: float):
+        if healthy and self.healthy:
+            self.interval = min(self.interval * backoff, max_interval)
+        else:
+            self.interval = min_interval
+        self.healthy = healthy
+        self.next_at = time.monotonic() + self.interval
+
+
 class HealthChecker:
-    """健康检查器"""
-    
+    """健康检查器
+
+    Pod列表取自informer的本地索引，所有探测共用一个连接池化的aiohttp会话，
+    并发数由信号量限制；一轮探测结束后在线程中批量写入检查记录和状态变化。
+    """
+
     def __init__(self):
-        self.route_manager = K8sRouteManager()
+        self.route_manager = get_k8s_route_manager()
         self.check_interval = 30  # 30秒检查一次
         self.timeout = 5  # 5秒超时
-    
-    async def check_container_health(self, container: UserContainer) -> bool:
-        """检查单个容器的健康状态"""
-        try:
-            # 获取容器的所有端点
-            healthy_pods = self.route_manager.get_healthy_user_pods(container.user_id)
-            
-            if not healthy_pods:
-                logger.warning(f"No healthy pods found for user {container.user_id}")
-                container.status = 'error'
-                container.save()
-                return False
-            
-            # 检查每个Pod的健康状态
-            health_results = []
-            for pod in healthy_pods:
-                is_healthy = await self._check_pod_health(pod)
-                health_results.append(is_healthy)
-            
-            # 如果至少有一个Pod是健康的，则认为容器是健康的
-            is_healthy = any(health_results)
-            
-            # 更新容器状态
-            if is_healthy:
-                container.status = 'running'
-                container.last_accessed = timezone.now()
-            else:
-                container.status = 'error'
-            
-            container.save()
-            # 新增: 采集并上报容器资源使用情况
-            for instance in container.instances.all():
-                RouteManagementService.collect_container_resources(instance)
-
-            return is_healthy
-            
-        except Exception as e:
-            logger.error(f"Health check failed for container {container.user_id}: {e}")
-            container.status = 'error'
-            container.save()
-            return False
-    
-    async def _check_pod_health(self, pod_info: Dict) -> bool:
-        """检查单个Pod的健康状态"""
-        pod_info.setdefault("ports", [8000])
-        try:
-            health_url = f"http://{pod_info['ip']}:{pod_info['ports'][0]}/healthz"
-            
-            async with aiohttp.ClientSession(timeout=aiohttp.ClientTimeout(total=self.timeout)) as session:
+        self.concurrency = getattr(settings, 'HEALTH_CHECK_CONCURRENCY', 200)
+        self.min_interval = getattr(settings, 'HEALTH_CHECK_MIN_INTERVAL', 5)
+        self.max_interval = getattr(settings, 'HEALTH_CHECK_MAX_INTERVAL', 300)
+        self.backoff = getattr(settings, 'HEALTH_CHECK_BACKOFF', 1.5)
+        self.sync_timeout = getattr(settings, 'HEALTH_CHECK_SYNC_TIMEOUT', 30)
+
+        # pod key -> ProbeSchedule
+        self._schedules: Dict[str, ProbeSchedule] = {}
+        self._session: Optional[aiohttp.ClientSession] = None
+        self._session_loop = None
+
+    async def _get_session(self) -> aiohttp.ClientSession:
+        """获取当前事件循环上的共享会话"""
+        loop = asyncio.get_running_loop()
+        if self._session is None or self._session.closed or self._session_loop is not loop:
+            connector = aiohttp.TCPConnector(limit=self.concurrency, ttl_dns_cache=300)
+            self._session = aiohttp.ClientSession(
+                connector=connector,
+                timeout=aiohttp.ClientTimeout(total=self.timeout)
+            )
+            self._session_loop = loop
+        return self._session
+
+    async def close(self):
+        if self._session is not None and not self._session.closed:
+            await self._session.close()
+
+    @staticmethod
+    def _pod_key(pod_info: Dict) -> str:
+        return pod_info.get('target_ref') or f"pod-{pod_info['ip']}"
+
+    async def _check_pod_health(self, session: aiohttp.ClientSession, semaphore: asyncio.Semaphore,
+                                pod_info: Dict) -> Dict:
+        """检查单个Pod的健康状态，只返回结果不访问数据库"""
+        port = pod_info['ports'][0] if pod_info.get('ports') else 8000
+        health_url = f"http://{pod_info['ip']}:{port}/healthz"
+        result = {
+            'pod_key': self._pod_key(pod_info),
+            'check_url': health_url,
+            'is_healthy': False,
+            'status_code': None,
+            'response_time': None,
+            'error_message': None,
+        }
+
+        async with semaphore:
+            start_time = time.monotonic()
+            try:
                 async with session.get(health_url) as response:
-                    instance = ContainerInstance.objects.get(pod_name=pod_info['target_ref'])
-                    HealthCheckRecord.objects.create(
-                        container_instance=instance,
-                        is_healthy=response.status == 200,
-                        status_code=response.status,
-                        response_time=(await response.text()) if response.status == 200 else None,
-                        check_url=health_url
-                    )
-                    if response.status == 200:
-                        # 健康检查成功，重置熔断器
-                        instance = ContainerInstance.objects.get(pod_name=pod_info['target_ref'])
-                        cb = CircuitBreaker(instance, instance.container.route_registry.load_balancer_config)
-                        cb.record_success()
-                        return True
-                    else:
+                    result['status_code'] = response.status
+                    result['is_healthy'] = response.status == 200
+                    result['response_time'] = (time.monotonic() - start_time) * 1000
+                    if response.status != 200:
                         logger.warning(f"Pod {pod_info['ip']} health check returned status {response.status}")
-                        # 记录健康检查失败
-                        instance = ContainerInstance.objects.get(pod_name=pod_info['target_ref'])
-                        cb = CircuitBreaker(instance, instance.container.route_registry.load_balancer_config)
-                        cb.record_failure()
-                        return False
-                        
-        except asyncio.TimeoutError:
-            logger.warning(f"Pod {pod_info['ip']} health check timed out")
-            if not False:
+            except asyncio.TimeoutError:
                 logger.warning(f"Pod {pod_info['ip']} health check timed out")
-                instance = ContainerInstance.objects.get(pod_name=pod_info['target_ref'])
-                cb = CircuitBreaker(instance, instance.container.route_registry.load_balancer_config)
-                cb.record_failure()  # 记录失败触发熔断
-            return False
-        except Exception as e:
-            logger.error(f"Pod {pod_info['ip']} health check failed: {e}")
-            return False
-    
+                result['error_message'] = 'timeout'
+            except Exception as e:
+                logger.error(f"Pod {pod_info['ip']} health check failed: {e}")
+                result['error_message'] = str(e)
+        return result
+
+    def _load_containers(self) -> List[tuple]:
+        """加载待检查的容器及其实例（线程中执行）"""
+        close_old_connections()
+        containers = list(UserContainer.objects.filter(status__in=['running', 'creating']).values_list('id', 'user_id'))
+        instances = defaultdict(dict)
+        for instance in ContainerInstance.objects.filter(
+            container_id__in=[container_id for container_id, _ in containers]
+        ).select_related('container__route_registry__load_balancer_config'):
+            instances[instance.container_id][instance.pod_name] = instance
+        return [(container_id, user_id, instances[container_id]) for container_id, user_id in containers]
+
     async def check_all_containers(self):
-        """检查所有容器的健康状态"""
-        containers = UserContainer.objects.filter(status__in=['running', 'creating'])
-        
-        tasks = []
-        for container in containers:
-            task = asyncio.create_task(self.check_container_health(container))
-            tasks.append(task)
-        
-        if tasks:
-            results = await asyncio.gather(*tasks, return_exceptions=True)
-            
-            healthy_count = sum(1 for result in results if result is True)
-            total_count = len(results)
-            
-            logger.info(f"Health check completed: {healthy_count}/{total_count} containers healthy")
-    
+        """检查所有容器的健康状态（一轮）"""
+        informer = self.route_manager.informer
+        if not informer.synced:
+            # 新进程（如Celery首次执行）中informer刚启动，等待首次同步而不是跳过本轮
+            synced = await sync_to_async(informer.wait_synced, thread_sensitive=False)(self.sync_timeout)
+            if not synced:
+                logger.info("Endpoint informer not synced yet, skipping health check round")
+                return
+
+        containers = await sync_to_async(self._load_containers, thread_sensitive=False)()
+        session = await self._get_session()
+        semaphore = asyncio.Semaphore(self.concurrency)
+        now = time.monotonic()
+
+        pods_by_container = {}
+        probes = []
+        for container_id, user_id, _ in containers:
+            pods = informer.get_endpoints(user_id)
+            pods_by_container[container_id] = pods
+            for pod_info in pods:
+                schedule = self._schedules.get(self._pod_key(pod_info))
+                if schedule is None or schedule.next_at <= now:
+                    probes.append(self._check_pod_health(session, semaphore, pod_info))
+
+        started = time.monotonic()
+        results = {result['pod_key']: result for result in await asyncio.gather(*probes)}
+        for pod_key, result in results.items():
+            schedule = self._schedules.setdefault(pod_key, ProbeSchedule(self.check_interval))
+            schedule.update(result['is_healthy'], self.min_interval, self.max_interval, self.backoff)
+
+        # 清理已下线Pod的调度状态
+        live_keys = {self._pod_key(pod) for pods in pods_by_container.values() for pod in pods}
+        for pod_key in set(self._schedules) - live_keys:
+            del self._schedules[pod_key]
+
+        healthy_count = await sync_to_async(self._persist_results, thread_sensitive=False)(
+            containers, pods_by_container, results
+        )
+        logger.info(
+            f"Health check completed: {len(results)} pods probed in {time.monotonic() - started:.2f}s, "
+            f"{healthy_count}/{len(containers)} containers healthy"
+        )
+
+    def _persist_results(self, containers: List[tuple], pods_by_container: Dict[int, List[Dict]],
+                         results: Dict[str, Dict]) -> int:
+        """批量写入检查记录、实例和容器状态变化（线程中执行）"""
+        close_old_connections()
+        now = timezone.now()
+        records = []
+        recovered, failed = [], []
+        container_status = {'running': [], 'error': []}
+
+        for container_id, user_id, instances in containers:
+            pods = pods_by_container.get(container_id) or []
+            if not pods:
+                logger.warning(f"No healthy pods found for user {user_id}")
+
+            container_healthy = False
+            for pod_info in pods:
+                pod_key = self._pod_key(pod_info)
+                schedule = self._schedules.get(pod_key)
+                result = results.get(pod_key)
+                # 本轮未到探测时间的Pod沿用上次结果
+                pod_healthy = result['is_healthy'] if result else bool(schedule and schedule.healthy)
+                container_healthy = container_healthy or pod_healthy
+
+                instance = instances.get(pod_key)
+                if result is None or instance is None:
+                    continue
+                records.append(HealthCheckRecord(
+                    container_instance_id=instance.id,
+                    is_healthy=result['is_healthy'],
+                    status_code=result['status_code'],
+                    response_time=result['response_time'],
+                    check_url=result['check_url'],
+                    error_message=result['error_message'],
+                ))
+                if not result['is_healthy']:
+                    failed.append(instance.id)
+                elif not instance.is_healthy or instance.consecutive_failures:
+                    recovered.append(instance.id)
+                self._record_circuit(instance, result['is_healthy'])
+
+            container_status['running' if container_healthy else 'error'].append(container_id)
+
+        with transaction.atomic():
+            if records:
+                HealthCheckRecord.objects.bulk_create(records, batch_size=1000)
+            # 实例状态和连续失败次数只在这里更新，熔断器不再重复写入
+            if recovered:
+                ContainerInstance.objects.filter(id__in=recovered).update(
+                    is_healthy=True, consecutive_failures=0, last_health_check=now
+                )
+            if failed:
+                ContainerInstance.objects.filter(id__in=failed).update(
+                    is_healthy=False, consecutive_failures=F('consecutive_failures') + 1
+                )
+            if container_status['running']:
+                # 探测不计为访问，last_accessed只由路由流量更新（用于空闲缩容判断）
+                UserContainer.objects.filter(id__in=container_status['running']).update(status='running')
+            if container_status['error']:
+                UserContainer.objects.filter(id__in=container_status['error']).update(status='error')
+
+        return len(container_status['running'])
+
+    @staticmethod
+    def _record_circuit(instance: ContainerInstance, is_healthy: bool):
+        """将探测结果同步到熔断器（实例状态由批量更新写入）"""
+        try:
+            config = instance.container.route_registry.load_balancer_config
+        except Exception:
+            return
+        cb = CircuitBreaker(instance, config)
+        if is_healthy:
+            cb.record_success(update_instance=False)
+        else:
+            cb.record_failure(update_instance=False)
+
+    def run_once(self):
+        """同步执行一轮检查（供Celery任务调用）"""
+        async def _run():
+            try:
+                await self.check_all_containers()
+            finally:
+                await self.close()
+        asyncio.run(_run())
+
     async def start_health_checking(self):
-        """启动健康检查循环"""
+        """启动健康检查循环，按最短探测间隔轮询到期的Pod"""
         logger.info("Starting health checker")
-        
+
         while True:
             try:
                 await self.check_all_containers()
-                await asyncio.sleep(self.check_interval)
             except Exception as e:
                 logger.error(f"Health check loop error: {e}")
-                await asyncio.sleep(self.check_interval)
+            await asyncio.sleep(self.min_interval)
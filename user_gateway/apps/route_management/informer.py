@@ -0,0 +1,322 @@
+import logging
+import os
+import socket
+import threading
+import time
+from typing import Dict, List, Optional
+
+import redis
+from kubernetes import client, watch
+from kubernetes.client.exceptions import ApiException
+from django.conf import settings
+from django.db import close_old_connections
+from django.utils import timezone
+from .cold_start import cold_start_queue
+
+logger = logging.getLogger(__name__)
+
+SERVICE_PREFIX = "user-container-svc-"
+
+
+class EndpointInformer:
+    """基于watch的用户容器Service/Endpoints发现
+
+    启动时list一次USER_CONTAINER_NAMESPACE下的Service和Endpoints，之后通过watch
+    增量维护tenant_id到ClusterIP/Pod IP的本地索引，路由时直接查索引而不调用API。
+    索引变化时只把变化部分写回UserContainer/ContainerEndpoint，且只由持有Redis
+    租约的一个worker写库，避免每个进程重复写入。
+    """
+
+    LEADER_KEY = "endpoint_informer:leader"
+
+    def __init__(self, core_v1: client.CoreV1Api, namespace: str):
+        self.core_v1 = core_v1
+        self.namespace = namespace
+        self.watch_timeout = getattr(settings, 'ENDPOINT_INFORMER_WATCH_TIMEOUT', 300)
+        self.leader_ttl = getattr(settings, 'ENDPOINT_INFORMER_LEADER_TTL', 30)
+
+        # tenant_id -> service_info
+        self._services: Dict[str, Dict] = {}
+        # tenant_id -> [pod_info, ...]
+        self._endpoints: Dict[str, List[Dict]] = {}
+        self._services_synced = threading.Event()
+        self._endpoints_synced = threading.Event()
+        self._lock = threading.Lock()
+
+        self._identity = f"{socket.gethostname()}:{os.getpid()}"
+        self._leader_until = 0.0
+        self._redis_client = None
+        self._started_pid = None
+
+    @property
+    def synced(self) -> bool:
+        return self._services_synced.is_set() and self._endpoints_synced.is_set()
+
+    def wait_synced(self, timeout: float) -> bool:
+        """等待首次同步完成（最多timeout秒），返回是否已同步"""
+        deadline = time.monotonic() + timeout
+        for event in (self._services_synced, self._endpoints_synced):
+            if not event.wait(max(0.0, deadline - time.monotonic())):
+                return False
+        return True
+
+    def get_service(self, tenant_id: str) -> Optional[Dict]:
+        """查询租户Service（本地索引）"""
+        return self._services.get(str(tenant_id))
+
+    def get_endpoints(self, tenant_id: str) -> List[Dict]:
+        """查询租户就绪Pod（本地索引）"""
+        return self._endpoints.get(str(tenant_id), [])
+
+    def start(self):
+        """启动Service和Endpoints的watch线程（每个worker进程只启动一次）"""
+        pid = os.getpid()
+        if self._started_pid == pid:
+            return
+        with self._lock:
+            if self._started_pid == pid:
+                return
+            self._started_pid = pid
+
+        threading.Thread(
+            target=self._run_watch,
+            args=(self.core_v1.list_namespaced_service, self._services_synced, self._on_service_event),
+            name='informer-services', daemon=True
+        ).start()
+        threading.Thread(
+            target=self._run_watch,
+            args=(self.core_v1.list_namespaced_endpoints, self._endpoints_synced, self._on_endpoints_event),
+            name='informer-endpoints', daemon=True
+        ).start()
+        logger.info(f"Endpoint informer started for namespace {self.namespace}")
+
+    def _run_watch(self, list_func, synced: threading.Event, handler):
+        """list + watch循环；资源版本过期(410)或断线时重新list"""
+        while True:
+            try:
+                resource_list = list_func(namespace=self.namespace)
+                handler('SYNC', resource_list.items)
+                synced.set()
+                resource_version = resource_list.metadata.resource_version
+
+                while True:
+                    stream = watch.Watch().stream(
+                        list_func,
+                        namespace=self.namespace,
+                        resource_version=resource_version,
+                        timeout_seconds=self.watch_timeout
+                    )
+                    for event in stream:
+                        obj = event['object']
+                        resource_version = obj.metadata.resource_version
+                        handler(event['type'], [obj])
+            except ApiException as e:
+                # 重新list完成前索引可能已过期
+                synced.clear()
+                if e.status != 410:
+                    logger.error(f"Informer watch failed: {e}")
+                    time.sleep(5)
+            except Exception as e:
+                synced.clear()
+                logger.error(f"Informer watch error: {e}")
+                time.sleep(5)
+
+    @staticmethod
+    def _tenant_id(name: str) -> Optional[str]:
+        if name and name.startswith(SERVICE_PREFIX):
+            return name[len(SERVICE_PREFIX):]
+        return None
+
+    def _on_service_event(self, event_type: str, services):
+        changed = {}
+        removed = set()
+
+        with self._lock:
+            if event_type == 'SYNC':
+                seen = set()
+                for service in services:
+                    tenant_id = self._tenant_id(service.metadata.name)
+                    if tenant_id:
+                        seen.add(tenant_id)
+                removed = set(self._services) - seen
+
+            for service in services:
+                tenant_id = self._tenant_id(service.metadata.name)
+                if not tenant_id:
+                    continue
+                if event_type == 'DELETED':
+                    if self._services.pop(tenant_id, None) is not None:
+                        removed.add(tenant_id)
+                    continue
+
+                service_info = {
+                    'cluster_ip': service.spec.cluster_ip,
+                    'ports': [{'port': port.port, 'target_port': port.target_port} for port in service.spec.ports or []],
+                    'selector': service.spec.selector,
+                    'service_name': service.metadata.name,
+                    'namespace': self.namespace
+                }
+                previous = self._services.get(tenant_id)
+                if (previous is None or previous['cluster_ip'] != service_info['cluster_ip']
+                        or previous['ports'] != service_info['ports']):
+                    changed[tenant_id] = service_info
+                self._services[tenant_id] = service_info
+
+            for tenant_id in removed:
+                self._services.pop(tenant_id, None)
+
+        if changed or removed:
+            self._apply_service_deltas(changed, removed)
+
+    def _on_endpoints_event(self, event_type: str, endpoints_list):
+        changed = {}
+
+        with self._lock:
+            if event_type == 'SYNC':
+                seen = {self._tenant_id(ep.metadata.name) for ep in endpoints_list}
+                for tenant_id in set(self._endpoints) - seen:
+                    changed[tenant_id] = (self._endpoints.pop(tenant_id), [])
+
+            for endpoints in endpoints_list:
+                tenant_id = self._tenant_id(endpoints.metadata.name)
+                if not tenant_id:
+                    continue
+
+                pods = []
+                if event_type != 'DELETED':
+                    for subset in endpoints.subsets or []:
+                        ports = [port.port for port in subset.ports] if subset.ports else [80]
+                        for address in subset.addresses or []:
+                            pods.append({
+                                'ip': address.ip,
+                                'ports': ports,
+                                'target_ref': address.target_ref.name if address.target_ref else None
+                            })
+
+                previous = self._endpoints.get(tenant_id, [])
+                if pods:
+                    self._endpoints[tenant_id] = pods
+                else:
+                    self._endpoints.pop(tenant_id, None)
+                if previous != pods:
+                    changed[tenant_id] = (previous, pods)
+
+        # 从无就绪Pod变为有就绪Pod：唤醒冷启动队列中等待该租户的请求
+        for tenant_id, (previous, pods) in changed.items():
+            if pods and not previous:
+                cold_start_queue.notify_ready(tenant_id)
+
+        if changed:
+            self._apply_endpoint_deltas(changed)
+
+    def _is_leader(self) -> bool:
+        """通过Redis租约选出唯一写库的worker"""
+        now = time.monotonic()
+        if now < self._leader_until:
+            return True
+        try:
+            if self._redis_client is None:
+                self._redis_client = redis.Redis(
+                    host=settings.REDIS_HOST,
+                    port=settings.REDIS_PORT,
+                    db=settings.REDIS_DB,
+                    password=settings.REDIS_PASSWORD,
+                    decode_responses=True
+                )
+            acquired = self._redis_client.set(self.LEADER_KEY, self._identity, nx=True, ex=self.leader_ttl)
+            if not acquired and self._redis_client.get(self.LEADER_KEY) == self._identity:
+                self._redis_client.expire(self.LEADER_KEY, self.leader_ttl)
+                acquired = True
+        except Exception as e:
+            logger.warning(f"Informer leader check failed: {e}")
+            return False
+        if acquired:
+            # 提前续约，避免租约在写库过程中过期
+            self._leader_until = now + self.leader_ttl / 2
+        return bool(acquired)
+
+    def _apply_service_deltas(self, changed: Dict[str, Dict], removed: set):
+        from .registry import ContainerRegistry
+        from .route_table import get_route_table
+
+        route_table = get_route_table()
+        for tenant_id in list(changed) + list(removed):
+            route_table.invalidate(tenant_id)
+
+        if not self._is_leader():
+            return
+        close_old_connections()
+        registry = ContainerRegistry()
+        for tenant_id, service_info in changed.items():
+            registry.register_container(tenant_id, {
+                'service_name': service_info['service_name'],
+                'cluster_ip': service_info['cluster_ip'],
+                'port': service_info['ports'][0]['port'] if service_info['ports'] else 80,
+                'namespace': self.namespace,
+                'deployment_name': f"user-container-dep-{tenant_id}",
+                'status': 'Running'
+            })
+        for tenant_id in removed:
+            registry.unregister_container(tenant_id)
+
+    def _apply_endpoint_deltas(self, changed: Dict[str, tuple]):
+        from userdb.models import UserContainer, ContainerEndpoint
+        from ..load_balancer.balancer import LoadBalancer
+
+        # 每个进程都丢弃本地实例快照，下次选择时按新成员重建
+        for tenant_id in changed:
+            LoadBalancer.invalidate_tenant(tenant_id)
+
+        if not self._is_leader():
+            return
+        close_old_connections()
+        # user_id是UUID，索引中的tenant_id是字符串
+        containers = {
+            str(user_id): container_id
+            for user_id, container_id in UserContainer.objects.filter(
+                user_id__in=list(changed)
+            ).values_list('user_id', 'id')
+        }
+        now = timezone.now()
+        for tenant_id, (previous, pods) in changed.items():
+            container_id = containers.get(tenant_id)
+            if container_id is None:
+                continue
+            current_names = set()
+            for pod_info in pods:
+                if pod_info in previous:
+                    current_names.add(pod_info['target_ref'] or f"pod-{pod_info['ip']}")
+                    continue
+                pod_name = pod_info['target_ref'] or f"pod-{pod_info['ip']}"
+                current_names.add(pod_name)
+                ContainerEndpoint.objects.update_or_create(
+                    container_id=container_id,
+                    pod_name=pod_name,
+                    defaults={
+                        'pod_ip': pod_info['ip'],
+                        'port': pod_info['ports'][0] if pod_info['ports'] else 80,
+                        'is_ready': True,
+                        'last_health_check': now
+                    }
+                )
+            removed_names = {
+                pod_info['target_ref'] or f"pod-{pod_info['ip']}" for pod_info in previous
+            } - current_names
+            if removed_names:
+                ContainerEndpoint.objects.filter(
+                    container_id=container_id, pod_name__in=removed_names
+                ).update(is_ready=False)
+
+
+_informer = None
+_informer_lock = threading.Lock()
+
+
+def get_endpoint_informer(core_v1: client.CoreV1Api, namespace: str) -> EndpointInformer:
+    """获取当前进程的Endpoint informer"""
+    global _informer
+    if _informer is None:
+        with _informer_lock:
+            if _informer is None:
+                _informer = EndpointInformer(core_v1, namespace)
+    return _informer
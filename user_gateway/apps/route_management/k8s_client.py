@@ -0,0 +1,65 @@
+import asyncio
+import os
+import threading
+
+from django.conf import settings
+from kubernetes import client, config
+
+_api_client = None
+_api_client_pid = None
+_api_client_lock = threading.Lock()
+
+# kubernetes_asyncio为可选依赖：事件循环 -> ApiClient
+_async_api_clients = {}
+
+
+def get_request_timeout() -> tuple:
+    """K8s API请求的(连接, 读取)超时（watch调用不使用）"""
+    return (
+        getattr(settings, 'K8S_CONNECT_TIMEOUT', 5),
+        getattr(settings, 'K8S_READ_TIMEOUT', 30)
+    )
+
+
+def _load_configuration() -> client.Configuration:
+    """集群内使用ServiceAccount配置，否则使用本地kubeconfig"""
+    configuration = client.Configuration()
+    try:
+        config.load_incluster_config(client_configuration=configuration)
+    except config.ConfigException:
+        config.load_kube_config(client_configuration=configuration)
+    # urllib3连接池大小：informer的watch线程与路由解析、扩缩容调用共用keep-alive连接
+    configuration.connection_pool_maxsize = getattr(settings, 'K8S_CONNECTION_POOL_MAXSIZE', 32)
+    return configuration
+
+
+def get_api_client() -> client.ApiClient:
+    """获取当前进程共享的ApiClient（fork出的子进程重新创建，不共用父进程的连接）"""
+    global _api_client, _api_client_pid
+    pid = os.getpid()
+    if _api_client is None or _api_client_pid != pid:
+        with _api_client_lock:
+            if _api_client is None or _api_client_pid != pid:
+                _api_client = client.ApiClient(_load_configuration())
+                _api_client_pid = pid
+    return _api_client
+
+
+async def get_async_api_client():
+    """获取当前事件循环共享的异步ApiClient，未安装kubernetes_asyncio时返回None"""
+    try:
+        from kubernetes_asyncio import client as async_client, config as async_config
+    except ImportError:
+        return None
+
+    loop = asyncio.get_running_loop()
+    api_client = _async_api_clients.get(loop)
+    if api_client is None:
+        configuration = async_client.Configuration()
+        try:
+            async_config.load_incluster_config(client_configuration=configuration)
+        except async_config.ConfigException:
+            await async_config.load_kube_config(client_configuration=configuration)
+        configuration.connection_pool_maxsize = getattr(settings, 'K8S_CONNECTION_POOL_MAXSIZE', 32)
+        api_client = _async_api_clients[loop] = async_client.ApiClient(configuration)
+    return api_client
@@ -1,8 +1,10 @@
 import time
 import logging
+from django.http import JsonResponse
 from django.utils.deprecation import MiddlewareMixin
-from django.utils import timezone  # 添加缺失的导入
-from shared_models.userdb.models import RouteMetrics, ContainerInstance
+from .route_writer import get_route_writer
+from ..load_balancer.balancer import get_user_route
+from ..load_balancer.rate_limiter import rate_limiter, retry_after_header
 
 logger = logging.getLogger(__name__)
 
@@ -15,35 +17,16 @@ class RequestMetricsMiddleware(MiddlewareMixin):
     def process_response(self, request, response):
         try:
             if hasattr(request, 'start_time') and request.instance_id:
-                # 计算请求耗时
+                # 计算请求耗时，指标由后台批量写入
                 duration = (time.time() - request.start_time) * 1000  # 毫秒
-                instance = ContainerInstance.objects.filter(instance_id=request.instance_id).first()
-
-                if instance:
-                    # 更新路由指标
-                    metric, created = RouteMetrics.objects.get_or_create(
-                        container=instance.container,
-                        timestamp__date=timezone.now().date(),
-                        defaults={'timestamp': timezone.now()}
-                    )
-                    metric.total_requests += 1
-
-                    # 记录状态码
-                    if 200 <= response.status_code < 300:
-                        metric.successful_requests += 1
-                    else:
-                        metric.failed_requests += 1
-
-                    # 更新延迟统计
-                    metric.avg_latency = (
-                        (metric.avg_latency * (metric.total_requests - 1) + duration) / metric.total_requests
-                    )
-                    if duration > metric.max_latency or metric.max_latency == 0:
-                        metric.max_latency = duration
-                    if duration < metric.min_latency or metric.min_latency == 0:
-                        metric.min_latency = duration
-
-                    metric.save()
+                get_route_writer().record({
+                    'instance_id': request.instance_id,
+                    'response_status': response.status_code,
+                    'response_time': duration,
+                    'success': 200 <= response.status_code < 300,
+                    'error_type': 'server' if response.status_code >= 500 else None,
+                    'log': False,
+                })
         except Exception as e:
             logger.error(f'请求指标采集失败: {str(e)}')
 
@@ -79,4 +62,32 @@ class TokenAuthenticationMiddleware(MiddlewareMixin):
             
         # 验证Token
         user = TokenValidator.validate_token(token_key)
-        request.user = user
\ No newline at end of file
+        request.user = user
+
+
+class RateLimitMiddleware(MiddlewareMixin):
+    """按租户路由的LoadBalancerConfig限流，需放在Token认证中间件之后"""
+
+    def process_request(self, request):
+        user = getattr(request, 'user', None)
+        if user is None or not user.is_authenticated:
+            return
+
+        route = get_user_route(user.pk)
+        config = getattr(route, 'load_balancer_config', None) if route else None
+        if config is None or not config.rate_limit_enabled or config.requests_per_minute <= 0:
+            return
+
+        allowed, retry_after = rate_limiter.acquire(
+            f"{user.pk}:{route.id}", config.requests_per_minute
+        )
+        if allowed:
+            return
+
+        response = JsonResponse({
+            'status': 'error',
+            'message': 'Rate limit exceeded'
+        }, status=429)
+        response['Retry-After'] = retry_after_header(retry_after)
+        response['X-RateLimit-Limit'] = str(config.requests_per_minute)
+        return response
@@ -6,6 +6,7 @@ from typing import Dict, List, Optional
 from django.conf import settings
 from django.utils import timezone
 from userdb.models import UserContainer, ContainerEndpoint
+from .route_table import ROUTE_INVALIDATION_CHANNEL
 
 logger = logging.getLogger(__name__)
 
@@ -41,7 +42,13 @@ class ContainerRegistry:
                 }
             )
             
+            route_changed = created
             if not created:
+                route_changed = (
+                    container.cluster_ip != container_info.get('cluster_ip')
+                    or container.port != container_info.get('port', 80)
+                    or container.status != 'running'
+                )
                 container.cluster_ip = container_info.get('cluster_ip')
                 container.port = container_info.get('port', 80)
                 container.status = 'running'
@@ -56,6 +63,10 @@ class ContainerRegistry:
                 json.dumps(container_info)
             )
             
+            # 路由目标变化时通知各网关worker失效本地路由表
+            if route_changed:
+                self._publish_invalidation(user_id)
+            
             logger.info(f"Container registered for user {user_id}")
             return True
             
@@ -75,6 +86,7 @@ class ContainerRegistry:
             # 从Redis缓存中删除
             cache_key = f"{self.registry_prefix}:{user_id}"
             self.redis_client.delete(cache_key)
+            self._publish_invalidation(user_id)
             
             logger.info(f"Container unregistered for user {user_id}")
             return True
@@ -83,6 +95,17 @@ class ContainerRegistry:
             logger.error(f"Failed to unregister container for user {user_id}: {e}")
             return False
     
+    def _publish_invalidation(self, user_id: str):
+        """递增租户路由版本并广播失效消息"""
+        try:
+            version = self.redis_client.incr(f"{self.registry_prefix}:version:{user_id}")
+            self.redis_client.publish(
+                ROUTE_INVALIDATION_CHANNEL,
+                json.dumps({'tenant_id': str(user_id), 'version': version})
+            )
+        except Exception as e:
+            logger.error(f"Failed to publish route invalidation for user {user_id}: {e}")
+    
     def get_container_info(self, user_id: str) -> Optional[Dict]:
         """获取容器信息"""
         # 先从Redis缓存获取
@@ -1,45 +1,68 @@
 import logging
 import json
 import asyncio
+import threading
 from typing import Dict, List, Optional, Tuple
-from kubernetes import client, config
+from kubernetes import client
 from kubernetes.client.exceptions import ApiException
 from django.conf import settings
 from django.utils import timezone
 from django.core.cache import cache
 from userdb.models import UserContainer, ContainerEndpoint, RouteCache
 from .registry import ContainerRegistry
+from .route_table import get_route_table
+from .route_writer import get_route_writer
+from .informer import get_endpoint_informer
+from .target_health import get_target_health
+from .single_flight import single_flight
+from .cold_start import cold_start_queue
+from .k8s_client import get_api_client, get_request_timeout
 
 logger = logging.getLogger(__name__)
 
-
 class K8sRouteManager:
     """基于Kubernetes的路由管理器"""
     
     def __init__(self):
-        try:
-            # 尝试加载集群内配置
-            config.load_incluster_config()
-        except config.ConfigException:
-            # 如果不在集群内，加载本地配置
-            config.load_kube_config()
-        
-        self.k8s_client = client.CoreV1Api()
-        self.apps_client = client.AppsV1Api()
-        self.autoscaling_client = client.AutoscalingV2Api()
-        self.networking_client = client.NetworkingV1Api()
+        # 进程内共享的ApiClient：配置只加载一次，连接池复用TLS连接
+        api_client = get_api_client()
+        self.k8s_client = client.CoreV1Api(api_client)
+        self.apps_client = client.AppsV1Api(api_client)
+        self.autoscaling_client = client.AutoscalingV2Api(api_client)
+        self.networking_client = client.NetworkingV1Api(api_client)
+        self.request_timeout = get_request_timeout()
         
         self.registry = ContainerRegistry()
         self.namespace = settings.USER_CONTAINER_NAMESPACE
         self.admin_service_url = settings.ADMIN_SERVICE_URL
         
+        # 基于watch的Service/Endpoints本地索引
+        self.informer = get_endpoint_informer(self.k8s_client, self.namespace)
+        self.informer.start()
+        
+        # 进程内路由表，首次使用时启动后台刷新与失效订阅
+        self.route_table = get_route_table()
+        self.route_table.start(self._resolve_route)
+        
+        # 目标健康评分（流量被动上报 + 后台主动探测）
+        self.target_health = get_target_health()
+        self.target_health.start()
+        
+        # 缩容到零的租户的请求缓冲队列
+        self.cold_start = cold_start_queue
+        
     def get_user_container_service(self, tenant_id: str) -> Optional[Dict]:
         """通过Kubernetes Service发现用户容器"""
+        # informer完成首次同步后本地索引即为权威数据，不再调用API
+        if self.informer.synced:
+            return self.informer.get_service(tenant_id)
+        
         service_name = f"user-container-svc-{tenant_id}"
         try:
             service = self.k8s_client.read_namespaced_service(
                 name=service_name, 
-                namespace=self.namespace
+                namespace=self.namespace,
+                _request_timeout=self.request_timeout
             )
             service_info = {
                 'cluster_ip': service.spec.cluster_ip,
@@ -67,11 +90,15 @@ class K8sRouteManager:
     
     def get_healthy_user_pods(self, tenant_id: str) -> List[Dict]:
         """获取用户的健康Pod列表"""
+        if self.informer.synced:
+            return list(self.informer.get_endpoints(tenant_id))
+        
         service_name = f"user-container-svc-{tenant_id}"
         try:
             endpoints = self.k8s_client.read_namespaced_endpoints(
                 name=service_name, 
-                namespace=self.namespace
+                namespace=self.namespace,
+                _request_timeout=self.request_timeout
             )
             healthy_pods = []
             if endpoints.subsets:
@@ -122,7 +149,6 @@ class K8sRouteManager:
         """基于K8s Service进行路由"""
         import time
         import uuid
-        from ..load_balancer.models import RouteRegistry, RouteLog
         start_time = time.time()
         request_id = request_data.get('request_id', str(uuid.uuid4()))
         client_ip = request_data.get('client_ip', 'unknown')
@@ -138,35 +164,56 @@ class K8sRouteManager:
         error_type = None
         error_message = None
         try:
-            cached_route = self._get_cached_route(tenant_id)
-            if cached_route and self._verify_route_health(cached_route):
-                target_url = cached_route['target_url']
-                route_info = cached_route
-                success = True
-                response_time = (time.time() - start_time) * 1000
-                response_status = 200
-                error_type = None
-                error_message = None
-                return target_url, route_info
+            # 进程内路由表命中：不访问MySQL和K8s
+            route_info = self.route_table.get(tenant_id)
+            if not (route_info and self._verify_route_health(tenant_id, route_info)):
+                # 在加载前记录版本，加载期间若收到失效消息则不回填
+                table_version = self.route_table.current_version(tenant_id)
+                
+                # 同一租户的并发未命中（跨进程）只加载一次，其余请求等待结果
+                try:
+                    route_info = single_flight.do_shared(
+                        f"route:{tenant_id}",
+                        lambda: self._load_route(tenant_id),
+                        wait_timeout=getattr(settings, 'SINGLE_FLIGHT_WAIT_TIMEOUT', 5),
+                        result_ttl=getattr(settings, 'SINGLE_FLIGHT_RESULT_TTL', 2)
+                    )
+                except TimeoutError:
+                    success = False
+                    response_time = (time.time() - start_time) * 1000
+                    response_status = 503
+                    error_type = 'gateway'
+                    error_message = 'Route resolution in progress'
+                    return None, {'status': 'resolving', 'message': 'Route resolution in progress', 'retry_after': 1}
+                
+                if not route_info:
+                    retry_after = self._trigger_container_creation_once(tenant_id)
+                    success = False
+                    response_time = (time.time() - start_time) * 1000
+                    response_status = 503
+                    error_type = 'gateway'
+                    error_message = 'Container is being created'
+                    return None, {'status': 'creating', 'message': 'Container is being created', 'retry_after': retry_after}
+                
+                self.route_table.put(tenant_id, route_info, table_version)
             
-            service_info = self.get_user_container_service(tenant_id)
-            if not service_info:
-                self._trigger_container_creation(tenant_id)
+            # 租户已缩容到零：同步路径不阻塞等待，触发扩容后返回503由客户端重试
+            # （排队等待只在异步代理中进行）
+            if self.informer.synced and not self.informer.get_endpoints(tenant_id):
+                self.cold_start.wake(tenant_id, self.wake_deployment)
+                route_info = {}
                 success = False
                 response_time = (time.time() - start_time) * 1000
                 response_status = 503
                 error_type = 'gateway'
-                error_message = 'Container is being created'
-                return None, {'status': 'creating', 'message': 'Container is being created'}
-            
-            target_url = f"http://{service_info['cluster_ip']}:{service_info['ports'][0]['port']}"
-            route_info = {
-                'target_url': target_url,
-                'service_info': service_info,
-                'cached_at': timezone.now().isoformat()
-            }
-            self._cache_route(tenant_id, route_info)
+                error_message = 'Container is starting'
+                return None, {
+                    'status': 'creating',
+                    'message': 'Container is starting',
+                    'retry_after': getattr(settings, 'SINGLE_FLIGHT_RETRY_AFTER', 5)
+                }
             
+            target_url = route_info['target_url']
             success = True
             response_time = (time.time() - start_time) * 1000
             response_status = 200
@@ -185,53 +232,46 @@ class K8sRouteManager:
             return None, {'status': 'error', 'message': str(e)}
         
         finally:
-            # 记录路由日志
-            try:
-                from userdb.models import UserContainer
-                container = UserContainer.objects.get(user_id=tenant_id)
-                route_registry = RouteRegistry.objects.get(container=container)
-                metric, created = ContainerMetric.objects.get_or_create(
-                    container=container,
-                    timestamp=timezone.now().replace(second=0, microsecond=0),
-                    defaults={'request_count': 0, 'error_count': 0}
-                )
-                metric.request_count += 1
-                if not success:
-                    metric.error_count += 1
-                metric.save()
-                RouteLog.objects.create(
-                    route_registry=route_registry,
-                    request_id=request_id,
-                    request_method=request_method,
-                    request_path=request_path,
-                    request_headers=headers,
-                    client_ip=client_ip,
-                    user_agent=user_agent,
-                    target_url=target_url,
-                    load_balance_strategy=route_registry.load_balance_strategy,
-                    response_status=response_status,
-                    response_time=response_time,
-                    error_type=error_type,
-                    error_message=error_message
-                )
-
-                # 更新路由指标
-                if hasattr(route_registry, 'metrics'):
-                    route_registry.metrics.update_metrics(
-                        response_time=response_time,
-                        success=success,
-                        error_type=error_type
-                    )
-
-            except UserContainer.DoesNotExist:
-                logger.warning(f"Container not found for tenant {tenant_id}, cannot log route")
-            except RouteRegistry.DoesNotExist:
-                logger.warning(f"Route registry not found for tenant {tenant_id}, cannot log route")
-            except Exception as e:
-                logger.error(f"Failed to log route request: {str(e)}")
+            # 路由日志与指标交给后台批量写入，请求路径不访问数据库
+            get_route_writer().record({
+                'tenant_id': tenant_id,
+                'request_id': request_id,
+                'method': request_method,
+                'path': request_path,
+                'headers': headers,
+                'client_ip': client_ip,
+                'user_agent': user_agent,
+                'target_url': target_url,
+                'response_status': response_status,
+                'response_time': response_time,
+                'success': success,
+                'error_type': error_type,
+                'error_message': error_message,
+            })
 
         return target_url, route_info
     
+    def _resolve_route(self, tenant_id: str) -> Optional[Dict]:
+        """通过K8s Service解析路由并写入数据库缓存（路由表未命中及后台刷新时调用）"""
+        service_info = self.get_user_container_service(tenant_id)
+        if not service_info:
+            return None
+        
+        route_info = {
+            'target_url': f"http://{service_info['cluster_ip']}:{service_info['ports'][0]['port']}",
+            'service_info': service_info,
+            'cached_at': timezone.now().isoformat()
+        }
+        self._cache_route(tenant_id, route_info)
+        return route_info
+    
+    def _load_route(self, tenant_id: str) -> Optional[Dict]:
+        """路由表未命中时加载路由：优先数据库缓存，其次K8s Service"""
+        cached_route = self._get_cached_route(tenant_id)
+        if cached_route and self._verify_route_health(tenant_id, cached_route):
+            return cached_route
+        return self._resolve_route(tenant_id)
+    
     def _get_cached_route(self, tenant_id: str) -> Optional[Dict]:
         """从缓存获取路由信息"""
         try:
@@ -263,209 +303,60 @@ class K8sRouteManager:
             }
         )
     
-    def _verify_route_health(self, route_info: Dict) -> bool:
-        """增强的路由健康检查逻辑"""
-        try:
-            service_info = route_info.get('service_info', {})
-            cluster_ip = service_info.get('cluster_ip')
-            port = service_info['ports'][0]['port'] if service_info.get('ports') else 80
-            
-            if not cluster_ip:
-                return False
-            
-            # 多维度健康检查
-            health_checks = [
-                self._check_http_health(f"http://{cluster_ip}:{port}/health"),
-                self._check_tcp_health(cluster_ip, port),
-                self._check_latency(f"http://{cluster_ip}:{port}/ping")
-            ]
-            
-            # 至少2项检查通过才算健康
-            return sum(health_checks) >= 2
-        except Exception as e:
-            logger.error(f"Route health check failed: {e}")
-            return False
+    def _verify_route_health(self, tenant_id: str, route_info: Dict) -> bool:
+        """查询目标健康评分（不做同步探测），评分未知时视为健康
+
+        代理按Pod地址上报真实流量结果，因此有就绪Pod时按Pod评分判断，任一Pod未被判为
+        不健康即视为健康；索引中没有Pod时退回到Service地址的探测评分。
+        """
+        pod_urls = [
+            f"http://{pod['ip']}:{pod['ports'][0] if pod['ports'] else 80}"
+            for pod in self.informer.get_endpoints(tenant_id)
+        ]
+        if pod_urls:
+            return any(self.target_health.is_healthy(url) is not False for url in pod_urls)
+        return self.target_health.is_healthy(route_info['target_url']) is not False
     
-    def _check_http_health(self, url: str) -> bool:
-        """HTTP健康检查"""
-        try:
-            response = requests.get(url, timeout=2)
-            return response.status_code == 200
-        except:
-            return False
+    def has_ready_endpoints(self, tenant_id: str) -> bool:
+        """租户是否有就绪Pod"""
+        return bool(self.get_healthy_user_pods(tenant_id))
     
-    def _check_tcp_health(self, host: str, port: int) -> bool:
-        """TCP端口检查"""
+    def wake_deployment(self, tenant_id: str):
+        """将缩容到零的租户Deployment恢复为1个副本"""
+        deployment_name = f"user-container-dep-{tenant_id}"
         try:
-            with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as s:
-                s.settimeout(2)
-                return s.connect_ex((host, port)) == 0
-        except:
-            return False
+            self.apps_client.patch_namespaced_deployment_scale(
+                name=deployment_name,
+                namespace=self.namespace,
+                body={"spec": {"replicas": 1}},
+                _request_timeout=self.request_timeout
+            )
+            # 置为creating，使健康检查重新纳入该容器并在就绪后标记为running
+            UserContainer.objects.filter(user_id=tenant_id, status='stopped').update(
+                status='creating', replicas=1
+            )
+            logger.info(f"Scaled up idle deployment {deployment_name}")
+        except ApiException as e:
+            logger.error(f"Failed to scale up deployment for tenant {tenant_id}: {e}")
     
-    def _check_latency(self, url: str) -> bool:
-        """响应延迟检查"""
-        try:
-            start_time = time.time()
-            requests.get(url, timeout=1)
-            latency = (time.time() - start_time) * 1000  # 转换为毫秒
-            return latency < 300  # 延迟小于300ms
-        except:
-            return False
+    def _trigger_container_creation_once(self, tenant_id: str) -> int:
+        """在锁有效期内只触发一次容器创建，返回建议的重试等待秒数"""
+        key = f"create:{tenant_id}"
+        if single_flight.acquire_once(key, getattr(settings, 'SINGLE_FLIGHT_CREATE_TTL', 60)):
+            self._trigger_container_creation(tenant_id)
+        return getattr(settings, 'SINGLE_FLIGHT_RETRY_AFTER', 5)
     
     def _trigger_container_creation(self, tenant_id: str):
-        """触发容器创建"""
+        """触发容器创建：K8s资源统一由Admin Service按user-container-template.yaml渲染和应用"""
         try:
-            # 可以直接在这里创建容器，或者通知Admin Service
-            if settings.ENABLE_DIRECT_CONTAINER_CREATION:
-                self.create_user_deployment(tenant_id)
-            else:
-                self._notify_admin_service(tenant_id)
+            self._notify_admin_service(tenant_id)
         except Exception as e:
             logger.error(f"Failed to trigger container creation for tenant {tenant_id}: {e}")
     
-    def create_user_deployment(self, tenant_id: str):
-        """创建用户的Kubernetes Deployment和Service"""
-        try:
-            # 创建Deployment
-            deployment = self._build_deployment_spec(tenant_id)
-            self.apps_client.create_namespaced_deployment(
-                namespace=self.namespace, 
-                body=deployment
-            )
-            
-            # 创建Service
-            service = self._build_service_spec(tenant_id)
-            self.k8s_client.create_namespaced_service(
-                namespace=self.namespace, 
-                body=service
-            )
-            
-            # 创建HPA
-            hpa = self._build_hpa_spec(tenant_id)
-            self.autoscaling_client.create_namespaced_horizontal_pod_autoscaler(
-                namespace=self.namespace,
-                body=hpa
-            )
-            
-            logger.info(f"Created deployment and service for tenant {tenant_id}")
-            
-        except ApiException as e:
-            logger.error(f"Failed to create deployment for tenant {tenant_id}: {e}")
-            raise
-    
-    def _build_deployment_spec(self, tenant_id: str) -> client.V1Deployment:
-        """构建Deployment规格"""
-        return client.V1Deployment(
-            metadata=client.V1ObjectMeta(
-                # 统一Deployment命名规范
-                name=f"user-container-dep-{tenant_id}",
-                namespace=self.namespace,
-                labels={"app": "user-container", "tenant": str(tenant_id), "managed-by": "user-gateway"}
-            ),
-            spec=client.V1DeploymentSpec(
-                replicas=1,
-                selector=client.V1LabelSelector(
-                    match_labels={"app": "user-container", "tenant": str(tenant_id)}
-                ),
-                template=client.V1PodTemplateSpec(
-                    metadata=client.V1ObjectMeta(
-                        labels={"app": "user-container", "tenant": str(tenant_id)}
-                    ),
-                    spec=client.V1PodSpec(
-                        containers=[
-                            client.V1Container(
-                                name=f"user-container-{tenant_id}",
-                                image=settings.USER_CONTAINER_IMAGE,
-                                ports=[client.V1ContainerPort(container_port=8080)],
-                                env=[
-                                    client.V1EnvVar(name="USER_ID", value=str(tenant_id)),
-                                    # 添加TENANT_ID环境变量，确保与tenant_id一致
-                                    client.V1EnvVar(name="TENANT_ID", value=str(tenant_id)),
-                                    client.V1EnvVar(name="DB_NAME", value=f"user_{tenant_id}_db"),
-                                    client.V1EnvVar(name="GATEWAY_URL", value=settings.GATEWAY_URL)
-                                ],
-                                resources=client.V1ResourceRequirements(
-                                    requests={"cpu": "500m", "memory": "1Gi"},
-                                    limits={"cpu": "1000m", "memory": "2Gi"}
-                                ),
-                                readiness_probe=client.V1Probe(
-                                    http_get=client.V1HTTPGetAction(
-                                        path="/health",
-                                        port=8080
-                                    ),
-                                    initial_delay_seconds=10,
-                                    period_seconds=5
-                                ),
-                                liveness_probe=client.V1Probe(
-                                    http_get=client.V1HTTPGetAction(
-                                        path="/health",
-                                        port=8080
-                                    ),
-                                    initial_delay_seconds=30,
-                                    period_seconds=10
-                                )
-                            )
-                        ]
-                    )
-                )
-            )
-        )
-    
-    def _build_service_spec(self, tenant_id: str) -> client.V1Service:
-        """构建Service规格"""
-        return client.V1Service(
-            metadata=client.V1ObjectMeta(
-                name=f"user-container-svc-{tenant_id}",
-                namespace=self.namespace,
-                labels={"app": f"user-{tenant_id}", "user-id": str(tenant_id)}
-            ),
-            spec=client.V1ServiceSpec(
-                selector={"app": f"user-{tenant_id}"},
-                ports=[client.V1ServicePort(
-                    port=80, 
-                    target_port=8080,
-                    protocol="TCP"
-                )],
-                type="ClusterIP"
-            )
-        )
-    
-    def _build_hpa_spec(self, tenant_id: str) -> client.V2HorizontalPodAutoscaler:
-        """构建HPA规格"""
-        return client.V2HorizontalPodAutoscaler(
-            metadata=client.V1ObjectMeta(
-                name=f"user-{tenant_id}-hpa",
-                namespace=self.namespace
-            ),
-            spec=client.V2HorizontalPodAutoscalerSpec(
-                scale_target_ref=client.V2CrossVersionObjectReference(
-                    api_version="apps/v1",
-                    kind="Deployment",
-                    name=f"user-{tenant_id}"
-                ),
-                min_replicas=1,
-                max_replicas=3,
-                metrics=[
-                    client.V2MetricSpec(
-                        type="Resource",
-                        resource=client.V2ResourceMetricSource(
-                            name="cpu",
-                            target=client.V2MetricTarget(
-                                type="Utilization",
-                                average_utilization=70
-                            )
-                        )
-                    )
-                ]
-            )
-        )
-    
     def _notify_admin_service(self, tenant_id: str):
         """通知Admin Service创建容器"""
         try:
-            import requests
-            from django.conf import settings
+            from ..load_balancer.connection_pool import get_http_session
             
             payload = {
                 'tenant_id': tenant_id,
@@ -473,7 +364,7 @@ class K8sRouteManager:
                 'timestamp': timezone.now().isoformat()
             }
             
-            response = requests.post(
+            response = get_http_session(settings.ADMIN_SERVICE_URL).post(
                 f"{settings.ADMIN_SERVICE_URL}/api/containers/notify",
                 json=payload,
                 headers={'Content-Type': 'application/json'},
@@ -494,8 +385,9 @@ class K8sRouteManager:
             # 删除HPA
             try:
                 self.autoscaling_client.delete_namespaced_horizontal_pod_autoscaler(
-                    name=f"user-{tenant_id}-hpa",
-                    namespace=self.namespace
+                    name=f"user-container-hpa-{tenant_id}",
+                    namespace=self.namespace,
+                    _request_timeout=self.request_timeout
                 )
             except ApiException as e:
                 if e.status != 404:
@@ -505,7 +397,8 @@ class K8sRouteManager:
             try:
                 self.k8s_client.delete_namespaced_service(
                     name=f"user-container-svc-{tenant_id}",
-                    namespace=self.namespace
+                    namespace=self.namespace,
+                    _request_timeout=self.request_timeout
                 )
             except ApiException as e:
                 if e.status != 404:
@@ -515,7 +408,8 @@ class K8sRouteManager:
             try:
                 self.apps_client.delete_namespaced_deployment(
                     name=f"user-container-dep-{tenant_id}",
-                    namespace=self.namespace
+                    namespace=self.namespace,
+                    _request_timeout=self.request_timeout
                 )
             except ApiException as e:
                 if e.status != 404:
@@ -549,3 +443,17 @@ class K8sRouteManager:
                     'instance_id': instances[0].instance_id
                 }
             return None
+
+
+_route_manager = None
+_route_manager_lock = threading.Lock()
+
+
+def get_k8s_route_manager() -> K8sRouteManager:
+    """获取当前进程共享的K8sRouteManager（异步代理等长期运行路径使用）"""
+    global _route_manager
+    if _route_manager is None:
+        with _route_manager_lock:
+            if _route_manager is None:
+                _route_manager = K8sRouteManager()
+    return _route_manager
@@ -0,0 +1,192 @@
+import json
+import logging
+import os
+import threading
+import time
+from typing import Callable, Dict, Optional
+
+import redis
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+# 容器注册表变更时发布失效消息的频道（ContainerRegistry负责发布）
+ROUTE_INVALIDATION_CHANNEL = "container_registry:invalidate"
+
+
+class RouteTable:
+    """进程内路由表
+
+    按tenant_id缓存路由信息，命中时不访问MySQL/K8s。
+    条目带TTL和版本号：ContainerRegistry注册/注销容器时通过Redis发布失效消息，
+    每个worker订阅后删除本地条目；后台刷新器在条目过期前为活跃租户续期。
+    """
+
+    def __init__(self, ttl: int = None, refresh_interval: int = None, max_size: int = None):
+        self.ttl = ttl if ttl is not None else getattr(settings, 'ROUTE_TABLE_TTL', 30)
+        self.refresh_interval = (
+            refresh_interval if refresh_interval is not None
+            else getattr(settings, 'ROUTE_TABLE_REFRESH_INTERVAL', 10)
+        )
+        self.max_size = max_size if max_size is not None else getattr(settings, 'ROUTE_TABLE_MAX_SIZE', 10000)
+
+        # tenant_id -> (route_info, expires_at, version)
+        self._entries: Dict[str, tuple] = {}
+        # tenant_id -> 已收到的最新失效版本
+        self._versions: Dict[str, int] = {}
+        # 上次刷新后被访问过的租户，只为这些租户续期
+        self._touched = set()
+        self._lock = threading.Lock()
+
+        self._loader: Optional[Callable[[str], Optional[Dict]]] = None
+        self._started_pid = None
+
+    def get(self, tenant_id: str) -> Optional[Dict]:
+        """查询路由（热路径，无锁、无IO）"""
+        tenant_id = str(tenant_id)
+        entry = self._entries.get(tenant_id)
+        if entry is None:
+            return None
+        route_info, expires_at, _ = entry
+        if expires_at < time.monotonic():
+            return None
+        self._touched.add(tenant_id)
+        return route_info
+
+    def current_version(self, tenant_id: str) -> int:
+        """获取租户当前已知的版本号，加载路由前调用，put时用于丢弃过期的回填"""
+        return self._versions.get(str(tenant_id), 0)
+
+    def put(self, tenant_id: str, route_info: Dict, version: int = None) -> bool:
+        """写入路由；若加载期间收到了更新的失效消息则放弃写入"""
+        tenant_id = str(tenant_id)
+        with self._lock:
+            known_version = self._versions.get(tenant_id, 0)
+            if version is not None and version < known_version:
+                return False
+
+            if tenant_id not in self._entries and len(self._entries) >= self.max_size:
+                self._evict()
+
+            self._entries[tenant_id] = (route_info, time.monotonic() + self.ttl, known_version)
+            self._touched.add(tenant_id)
+            return True
+
+    def invalidate(self, tenant_id: str, version: int = None):
+        """使租户路由失效"""
+        tenant_id = str(tenant_id)
+        with self._lock:
+            known_version = self._versions.get(tenant_id, 0)
+            self._versions[tenant_id] = max(known_version + 1, version or 0)
+            self._entries.pop(tenant_id, None)
+
+    def clear(self):
+        """清空路由表（与Redis断连后可能丢失失效消息时使用）"""
+        with self._lock:
+            for tenant_id in self._entries:
+                self._versions[tenant_id] = self._versions.get(tenant_id, 0) + 1
+            self._entries.clear()
+
+    def _evict(self):
+        """容量已满时先清理过期条目，仍不足则淘汰最早写入的条目"""
+        now = time.monotonic()
+        expired = [key for key, (_, expires_at, _) in self._entries.items() if expires_at < now]
+        for key in expired:
+            del self._entries[key]
+        if len(self._entries) >= self.max_size:
+            del self._entries[next(iter(self._entries))]
+
+    def start(self, loader: Callable[[str], Optional[Dict]]):
+        """启动后台刷新线程和失效订阅线程（每个worker进程只启动一次）"""
+        self._loader = loader
+        pid = os.getpid()
+        if self._started_pid == pid:
+            return
+        with self._lock:
+            if self._started_pid == pid:
+                return
+            self._started_pid = pid
+
+        threading.Thread(target=self._refresh_loop, name='route-table-refresher', daemon=True).start()
+        threading.Thread(target=self._listen_invalidations, name='route-table-listener', daemon=True).start()
+        logger.info(f"Route table started in worker {pid}")
+
+    def _refresh_loop(self):
+        """为即将过期且最近被访问过的租户续期，其余条目自然过期"""
+        while True:
+            time.sleep(self.refresh_interval)
+            try:
+                self._refresh_once()
+            except Exception as e:
+                logger.error(f"Route table refresh failed: {e}")
+
+    def _refresh_once(self):
+        touched, self._touched = self._touched, set()
+        deadline = time.monotonic() + self.refresh_interval
+
+        for tenant_id, (_, expires_at, _) in list(self._entries.items()):
+            if expires_at > deadline:
+                continue
+            if tenant_id not in touched or self._loader is None:
+                if expires_at < time.monotonic():
+                    with self._lock:
+                        entry = self._entries.get(tenant_id)
+                        if entry and entry[1] < time.monotonic():
+                            del self._entries[tenant_id]
+                continue
+
+            version = self.current_version(tenant_id)
+            try:
+                route_info = self._loader(tenant_id)
+            except Exception as e:
+                logger.warning(f"Failed to refresh route for tenant {tenant_id}: {e}")
+                continue
+            if route_info:
+                self.put(tenant_id, route_info, version)
+            else:
+                self.invalidate(tenant_id)
+
+    def _listen_invalidations(self):
+        """订阅注册表失效消息，断线重连后清空路由表"""
+        from ..load_balancer.balancer import LoadBalancer
+
+        while True:
+            try:
+                redis_client = redis.Redis(
+                    host=settings.REDIS_HOST,
+                    port=settings.REDIS_PORT,
+                    db=settings.REDIS_DB,
+                    password=settings.REDIS_PASSWORD,
+                    decode_responses=True
+                )
+                pubsub = redis_client.pubsub(ignore_subscribe_messages=True)
+                pubsub.subscribe(ROUTE_INVALIDATION_CHANNEL)
+                # 订阅前的消息可能已丢失
+                self.clear()
+                LoadBalancer.invalidate_all()
+
+                for message in pubsub.listen():
+                    try:
+                        data = json.loads(message['data'])
+                        self.invalidate(str(data['tenant_id']), data.get('version'))
+                        # 实例快照随路由一起失效，下次选择时按新成员重建
+                        LoadBalancer.invalidate_tenant(data['tenant_id'])
+                    except (ValueError, KeyError) as e:
+                        logger.warning(f"Invalid route invalidation message: {message.get('data')} ({e})")
+            except Exception as e:
+                logger.error(f"Route invalidation listener error: {e}")
+                time.sleep(self.refresh_interval)
+
+
+_route_table = None
+_route_table_lock = threading.Lock()
+
+
+def get_route_table() -> RouteTable:
+    """获取当前进程的路由表"""
+    global _route_table
+    if _route_table is None:
+        with _route_table_lock:
+            if _route_table is None:
+                _route_table = RouteTable()
+    return _route_table
@@ -0,0 +1,238 @@
+import atexit
+import logging
+import os
+import threading
+from collections import deque
+from typing import Dict, List
+
+from django.conf import settings
+from django.db import close_old_connections, transaction
+from django.db.models import Case, F, Value, When
+from django.db.models.functions import Greatest, Least
+from django.utils import timezone
+
+from .target_health import get_target_health
+
+logger = logging.getLogger(__name__)
+
+
+class RouteEventWriter:
+    """路由事件异步批量写入器
+
+    请求路径只把事件追加到进程内环形缓冲区，后台线程每隔flush_interval毫秒
+    或累计batch_size条事件时批量落库：RouteLog用bulk_create写入（时间戳取事件发生时间），
+    RouteMetrics按路由聚合后用F()表达式增量更新。ContainerMetric只由指标采集写入，
+    请求/错误数按容器统计时从RouteLog聚合，避免写入未采集的CPU/内存占位值。
+    缓冲区满时直接丢弃新事件并计数，数据库变慢不会阻塞请求处理。
+    """
+
+    def __init__(self, batch_size: int = None, flush_interval_ms: int = None, max_buffer: int = None):
+        self.batch_size = batch_size or getattr(settings, 'ROUTE_WRITER_BATCH_SIZE', 500)
+        self.flush_interval = (flush_interval_ms or getattr(settings, 'ROUTE_WRITER_FLUSH_INTERVAL_MS', 200)) / 1000
+        self.max_buffer = max_buffer or getattr(settings, 'ROUTE_WRITER_MAX_BUFFER', 10000)
+
+        self._buffer = deque()
+        self._wakeup = threading.Event()
+        self._flush_lock = threading.Lock()
+        self._start_lock = threading.Lock()
+        self._started_pid = None
+
+        # 运行统计
+        self.recorded_count = 0
+        self.dropped_count = 0
+        self.flushed_count = 0
+        self.failed_count = 0
+
+    def record(self, event: Dict) -> bool:
+        """记录一条路由事件（不访问数据库）；缓冲区已满时丢弃并返回False"""
+        # 上游转发结果作为路由目标的被动健康样本
+        if event.get('target_url') and event.get('upstream_success') is not None:
+            get_target_health().observe(event['target_url'], event['upstream_success'])
+
+        if len(self._buffer) >= self.max_buffer:
+            self.dropped_count += 1
+            return False
+
+        event.setdefault('timestamp', timezone.now())
+        self._buffer.append(event)
+        self.recorded_count += 1
+
+        if len(self._buffer) >= self.batch_size:
+            self._wakeup.set()
+        self._ensure_started()
+        return True
+
+    def stats(self) -> Dict:
+        """写入器运行统计"""
+        return {
+            'buffered': len(self._buffer),
+            'recorded': self.recorded_count,
+            'dropped': self.dropped_count,
+            'flushed': self.flushed_count,
+            'failed': self.failed_count,
+        }
+
+    def _ensure_started(self):
+        pid = os.getpid()
+        if self._started_pid == pid:
+            return
+        with self._start_lock:
+            if self._started_pid == pid:
+                return
+            self._started_pid = pid
+        threading.Thread(target=self._run, name='route-event-writer', daemon=True).start()
+        atexit.register(self.flush)
+
+    def _run(self):
+        while True:
+            self._wakeup.wait(self.flush_interval)
+            self._wakeup.clear()
+            try:
+                self.flush()
+            except Exception as e:
+                logger.error(f"Route event flush failed: {e}")
+
+    def flush(self):
+        """将缓冲区中的事件批量写入数据库"""
+        with self._flush_lock:
+            while self._buffer:
+                events = []
+                while self._buffer and len(events) < self.batch_size:
+                    events.append(self._buffer.popleft())
+
+                close_old_connections()
+                try:
+                    self._write_batch(events)
+                    self.flushed_count += len(events)
+                except Exception as e:
+                    # 写入失败的批次直接丢弃，避免积压拖垮进程
+                    self.failed_count += len(events)
+                    logger.error(f"Failed to write {len(events)} route events: {e}")
+
+    def _write_batch(self, events: List[Dict]):
+        from userdb.models import UserContainer, ContainerInstance
+        from ..load_balancer.models import RouteRegistry, RouteLog, RouteMetrics
+
+        # 一次查询解析tenant/实例到容器和路由
+        tenant_ids = {str(e['tenant_id']) for e in events if e.get('tenant_id')}
+        instance_ids = {e['instance_id'] for e in events if e.get('instance_id') and not e.get('tenant_id')}
+
+        container_by_tenant = {
+            str(user_id): container_id
+            for container_id, user_id in UserContainer.objects.filter(
+                user_id__in=tenant_ids
+            ).values_list('id', 'user_id')
+        } if tenant_ids else {}
+        container_by_instance = dict(
+            ContainerInstance.objects.filter(instance_id__in=instance_ids).values_list('instance_id', 'container_id')
+        ) if instance_ids else {}
+
+        container_ids = set(container_by_tenant.values()) | set(container_by_instance.values())
+        routes = {
+            container_id: (route_id, strategy)
+            for route_id, container_id, strategy in RouteRegistry.objects.filter(
+                container_id__in=container_ids
+            ).values_list('id', 'container_id', 'load_balance_strategy')
+        }
+
+        route_logs = []
+        accessed_containers = set()
+        route_stats = {}
+
+        for event in events:
+            if event.get('tenant_id'):
+                container_id = container_by_tenant.get(str(event['tenant_id']))
+            else:
+                container_id = container_by_instance.get(event.get('instance_id'))
+            if container_id is None:
+                continue
+
+            accessed_containers.add(container_id)
+            success = event.get('success', False)
+
+            route = routes.get(container_id)
+            if route is None:
+                continue
+            route_id, strategy = route
+
+            stat = route_stats.setdefault(route_id, {
+                'total': 0, 'success': 0, 'failed': 0, 'timeout': 0, 'connection': 0, 'server': 0,
+                'time_sum': 0.0, 'time_min': None, 'time_max': 0.0, 'last': event['timestamp'],
+            })
+            response_time = event.get('response_time') or 0.0
+            stat['total'] += 1
+            stat['time_sum'] += response_time
+            stat['time_max'] = max(stat['time_max'], response_time)
+            stat['time_min'] = response_time if stat['time_min'] is None else min(stat['time_min'], response_time)
+            stat['last'] = max(stat['last'], event['timestamp'])
+            if success:
+                stat['success'] += 1
+            else:
+                stat['failed'] += 1
+                if event.get('error_type') in ('timeout', 'connection', 'server'):
+                    stat[event['error_type']] += 1
+
+            if event.get('log', True):
+                route_logs.append(RouteLog(
+                    route_registry_id=route_id,
+                    container_instance_id=event.get('container_instance_id'),
+                    request_id=event.get('request_id', ''),
+                    request_method=event.get('method', 'GET'),
+                    request_path=event.get('path', '/'),
+                    request_headers=event.get('headers', {}),
+                    client_ip=event.get('client_ip', 'unknown'),
+                    user_agent=event.get('user_agent', ''),
+                    target_url=event.get('target_url') or '',
+                    load_balance_strategy=strategy,
+                    response_status=event.get('response_status'),
+                    response_time=event.get('response_time'),
+                    response_size=event.get('response_size'),
+                    error_type=event.get('error_type'),
+                    error_message=event.get('error_message'),
+                    timestamp=event['timestamp'],
+                ))
+
+        with transaction.atomic():
+            if route_logs:
+                RouteLog.objects.bulk_create(route_logs, batch_size=self.batch_size)
+
+            # 批次跨度只有毫秒级，访问时间统一取批次内最新事件时间，供空闲缩容判断
+            if accessed_containers:
+                UserContainer.objects.filter(id__in=accessed_containers).update(
+                    last_accessed=max(event['timestamp'] for event in events)
+                )
+
+            for route_id, stat in route_stats.items():
+                # 平均值和最小值依赖更新前的total_requests，需排在total_requests之前赋值
+                RouteMetrics.objects.filter(route_registry_id=route_id).update(
+                    avg_response_time=(
+                        (F('avg_response_time') * F('total_requests') + stat['time_sum'])
+                        / (F('total_requests') + stat['total'])
+                    ),
+                    min_response_time=Case(
+                        When(total_requests=0, then=Value(stat['time_min'])),
+                        default=Least(F('min_response_time'), Value(stat['time_min']))
+                    ),
+                    max_response_time=Greatest(F('max_response_time'), Value(stat['time_max'])),
+                    total_requests=F('total_requests') + stat['total'],
+                    successful_requests=F('successful_requests') + stat['success'],
+                    failed_requests=F('failed_requests') + stat['failed'],
+                    timeout_count=F('timeout_count') + stat['timeout'],
+                    connection_error_count=F('connection_error_count') + stat['connection'],
+                    server_error_count=F('server_error_count') + stat['server'],
+                    last_request_time=stat['last'],
+                )
+
+
+_route_writer = None
+_route_writer_lock = threading.Lock()
+
+
+def get_route_writer() -> RouteEventWriter:
+    """获取当前进程的路由事件写入器"""
+    global _route_writer
+    if _route_writer is None:
+        with _route_writer_lock:
+            if _route_writer is None:
+                _route_writer = RouteEventWriter()
+    return _route_writer
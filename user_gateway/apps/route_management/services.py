@@ -1,15 +1,16 @@
 import redis
-import requests
 from influxdb import InfluxDBClient
 from django.conf import settings
 from django.utils import timezone
 from datetime import timedelta
 import logging
 from .models import ContainerHealthRecord, ExceptionData, MetricsData
+from ..load_balancer.connection_pool import get_http_session
 
 import psutil
 import docker
-from kubernetes import client, config
+from kubernetes import client
+from .k8s_client import get_api_client, get_request_timeout
 
 logger = logging.getLogger(__name__)
 
@@ -36,16 +37,14 @@ class RouteManagementService:
         """采集容器实际资源使用情况"""
         try:
             # 优先使用Kubernetes API
-            config.load_incluster_config()
-            v1 = client.CoreV1Api()
-            
-            # 获取Pod指标
-            metrics_client = client.CustomObjectsApi()
+            # 获取Pod指标（共用进程内的ApiClient）
+            metrics_client = client.CustomObjectsApi(get_api_client())
             metrics = metrics_client.list_namespaced_custom_object(
                 group="metrics.k8s.io",
                 version="v1beta1",
                 namespace="user-containers",
-                plural="pods"
+                plural="pods",
+                _request_timeout=get_request_timeout()
             )
             
             for pod in metrics['items']:
@@ -202,7 +201,7 @@ class DataCollectorService:
 
         # 上报到监控系统
         try:
-            response = requests.post(
+            response = get_http_session(settings.MONITORING_SERVICE_URL).post(
                 f"{settings.MONITORING_SERVICE_URL}/api/exceptions",
                 json={'exceptions': report_data},
                 headers={'Content-Type': 'application/json'},
@@ -233,7 +232,7 @@ class DataCollectorService:
                 )
             
             # 上报到监控系统
-            response = requests.post(
+            response = get_http_session(settings.MONITORING_SERVICE_URL).post(
                 f"{settings.MONITORING_SERVICE_URL}/api/metrics",
                 json={'service_id': service_id, 'metrics': metrics},
                 headers={'Content-Type': 'application/json'},
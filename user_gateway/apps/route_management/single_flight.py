@@ -0,0 +1,147 @@
+import json
+import logging
+import os
+import socket
+import threading
+import time
+from typing import Any, Callable, Dict
+
+import redis
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+
+class _Call:
+    __slots__ = ('done', 'result', 'error')
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight:
+    """请求合并：同一key的并发调用只执行一次
+
+    进程内由第一个调用者执行，其余调用者等待其结果；do_shared再用Redis锁在进程间选出
+    唯一执行者，结果短暂写入Redis供其他进程读取。跨进程的副作用（如创建容器）
+    另外通过Redis锁保证在锁有效期内只触发一次。
+    """
+
+    POLL_INTERVAL = 0.05
+
+    def __init__(self, prefix: str = "single_flight"):
+        self.prefix = prefix
+        self._calls: Dict[str, _Call] = {}
+        # Redis不可用时的进程内锁：key -> 过期时间
+        self._local_locks: Dict[str, float] = {}
+        self._lock = threading.Lock()
+        self._redis_client = None
+        self._identity = f"{socket.gethostname()}:{os.getpid()}"
+
+    def do(self, key: str, func: Callable[[], Any], wait_timeout: float = None) -> Any:
+        """执行或等待同key的调用；等待超时抛出TimeoutError"""
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+
+        if not leader:
+            if not call.done.wait(wait_timeout):
+                raise TimeoutError(f"Timed out waiting for in-flight call '{key}'")
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            call.result = func()
+            return call.result
+        except Exception as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                self._calls.pop(key, None)
+            call.done.set()
+
+    def do_shared(self, key: str, func: Callable[[], Any], wait_timeout: float, result_ttl: float) -> Any:
+        """跨进程合并同key的调用，结果需可JSON序列化；Redis不可用时退化为进程内合并"""
+        return self.do(key, lambda: self._do_across_processes(key, func, wait_timeout, result_ttl), wait_timeout)
+
+    def _do_across_processes(self, key: str, func: Callable[[], Any], wait_timeout: float, result_ttl: float) -> Any:
+        lock_key = f"{self.prefix}:lock:{key}"
+        result_key = f"{self.prefix}:result:{key}"
+        try:
+            client = self._client()
+            cached = client.get(result_key)
+            if cached is not None:
+                return json.loads(cached)
+            leader = client.set(lock_key, self._identity, nx=True, ex=max(int(wait_timeout), 1))
+        except Exception as e:
+            logger.warning(f"Single-flight lock unavailable for {key}: {e}")
+            return func()
+
+        if leader:
+            try:
+                result = func()
+                self._publish(result_key, result, result_ttl)
+                return result
+            finally:
+                self._release(lock_key)
+
+        # 其他进程正在执行：等待其结果，执行者失败退出（锁已释放且无结果）时自行执行
+        deadline = time.monotonic() + wait_timeout
+        while time.monotonic() < deadline:
+            time.sleep(self.POLL_INTERVAL)
+            try:
+                cached = self._client().get(result_key)
+                if cached is not None:
+                    return json.loads(cached)
+                if not self._client().exists(lock_key):
+                    return func()
+            except Exception as e:
+                logger.warning(f"Single-flight wait failed for {key}: {e}")
+                return func()
+        raise TimeoutError(f"Timed out waiting for in-flight call '{key}'")
+
+    def _publish(self, result_key: str, result: Any, result_ttl: float):
+        try:
+            self._client().set(result_key, json.dumps(result), px=int(result_ttl * 1000))
+        except Exception as e:
+            logger.warning(f"Failed to publish single-flight result {result_key}: {e}")
+
+    def _release(self, lock_key: str):
+        try:
+            self._client().delete(lock_key)
+        except Exception as e:
+            logger.warning(f"Failed to release single-flight lock {lock_key}: {e}")
+
+    def _client(self):
+        if self._redis_client is None:
+            self._redis_client = redis.Redis(
+                host=settings.REDIS_HOST,
+                port=settings.REDIS_PORT,
+                db=settings.REDIS_DB,
+                password=settings.REDIS_PASSWORD,
+                decode_responses=True,
+                socket_timeout=0.1
+            )
+        return self._redis_client
+
+    def acquire_once(self, key: str, ttl: int) -> bool:
+        """获取跨进程锁，有效期内只有一个调用者返回True（Redis不可用时退化为进程内合并）"""
+        try:
+            return bool(self._client().set(f"{self.prefix}:{key}", self._identity, nx=True, ex=ttl))
+        except Exception as e:
+            logger.warning(f"Single-flight lock unavailable for {key}: {e}")
+            now = time.monotonic()
+            with self._lock:
+                if self._local_locks.get(key, 0) > now:
+                    return False
+                self._local_locks[key] = now + ttl
+            return True
+
+
+single_flight = SingleFlight()
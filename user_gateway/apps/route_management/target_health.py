@@ -0,0 +1,115 @@
+import asyncio
+import logging
+import os
+import threading
+import time
+from typing import Dict, Optional
+
+import aiohttp
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+
+class TargetHealthCache:
+    """路由目标的被动健康评分
+
+    真实流量结果和后台主动探测结果都写入同一份评分（成功率EWMA），
+    评分超过TTL未更新即视为未知；请求路径只查评分，不做同步探测。
+    """
+
+    def __init__(self, ttl: int = None, probe_interval: int = None, threshold: float = None):
+        self.ttl = ttl if ttl is not None else getattr(settings, 'TARGET_HEALTH_TTL', 30)
+        self.probe_interval = (
+            probe_interval if probe_interval is not None
+            else getattr(settings, 'TARGET_HEALTH_PROBE_INTERVAL', 10)
+        )
+        self.threshold = threshold if threshold is not None else getattr(settings, 'TARGET_HEALTH_THRESHOLD', 0.5)
+        self.alpha = 0.2  # 流量样本权重
+        self.probe_weight = 0.5  # 主动探测样本权重
+        self.idle_timeout = 300  # 超过该时间未被路由的目标不再探测
+        self.probe_timeout = 2
+
+        # target_url -> [score, 更新时间]
+        self._scores: Dict[str, list] = {}
+        # target_url -> 最近一次被路由的时间
+        self._tracked: Dict[str, float] = {}
+        self._lock = threading.Lock()
+        self._started_pid = None
+
+    def is_healthy(self, target_url: str) -> Optional[bool]:
+        """查询目标健康状态；无有效评分时返回None（热路径，无IO）"""
+        self._tracked[target_url] = time.monotonic()
+        entry = self._scores.get(target_url)
+        if entry is None or entry[1] + self.ttl < time.monotonic():
+            return None
+        return entry[0] >= self.threshold
+
+    def observe(self, target_url: str, success: bool, weight: float = None):
+        """记录一次结果（流量或探测）"""
+        weight = self.alpha if weight is None else weight
+        sample = 1.0 if success else 0.0
+        now = time.monotonic()
+        with self._lock:
+            entry = self._scores.get(target_url)
+            if entry is None or entry[1] + self.ttl < now:
+                self._scores[target_url] = [sample, now]
+            else:
+                entry[0] = entry[0] * (1 - weight) + sample * weight
+                entry[1] = now
+
+    def start(self):
+        """启动后台探测线程（每个worker进程只启动一次）"""
+        pid = os.getpid()
+        if self._started_pid == pid:
+            return
+        with self._lock:
+            if self._started_pid == pid:
+                return
+            self._started_pid = pid
+        threading.Thread(target=lambda: asyncio.run(self._probe_loop()), name='target-prober', daemon=True).start()
+
+    async def _probe_loop(self):
+        timeout = aiohttp.ClientTimeout(total=self.probe_timeout)
+        async with aiohttp.ClientSession(timeout=timeout, connector=aiohttp.TCPConnector(limit=50)) as session:
+            while True:
+                await asyncio.sleep(self.probe_interval)
+                try:
+                    await self._probe_once(session)
+                except Exception as e:
+                    logger.error(f"Target probe round failed: {e}")
+
+    async def _probe_once(self, session: aiohttp.ClientSession):
+        now = time.monotonic()
+        for target_url, last_seen in list(self._tracked.items()):
+            if last_seen + self.idle_timeout < now:
+                self._tracked.pop(target_url, None)
+                self._scores.pop(target_url, None)
+
+        targets = list(self._tracked)
+        if targets:
+            await asyncio.gather(*(self._probe(session, target_url) for target_url in targets))
+
+    async def _probe(self, session: aiohttp.ClientSession, target_url: str):
+        try:
+            # 与用户容器模板的readinessProbe一致
+            async with session.get(f"{target_url}/readyz") as response:
+                healthy = response.status == 200
+        except Exception as e:
+            logger.debug(f"Probe of {target_url} failed: {e}")
+            healthy = False
+        self.observe(target_url, healthy, self.probe_weight)
+
+
+_target_health = None
+_target_health_lock = threading.Lock()
+
+
+def get_target_health() -> TargetHealthCache:
+    """获取当前进程的目标健康评分缓存"""
+    global _target_health
+    if _target_health is None:
+        with _target_health_lock:
+            if _target_health is None:
+                _target_health = TargetHealthCache()
+    return _target_health
@@ -27,12 +27,16 @@ def report_metrics_task():
     # 这里可以添加具体的指标收集逻辑
     logger.info("Metrics reporting task executed")
 
+_health_checker = None
+
+
 @shared_task
 def start_health_checker():
-    """启动健康检查循环"""
-    health_checker = HealthChecker()
-    health_checker.start_checking()
-    logger.info("Health checker started")
+    """执行一轮健康检查（由beat周期调度，探测间隔状态在worker进程内保留）"""
+    global _health_checker
+    if _health_checker is None:
+        _health_checker = HealthChecker()
+    _health_checker.run_once()
 
 # Celery beat配置建议添加到settings.py
 CELERY_BEAT_SCHEDULE = {
@@ -1,3 +1,362 @@
 from django.test import TestCase
 
-# Create your tests here.
+from .route_table import RouteTable
+
+
+class RouteTableTests(TestCase):
+    def setUp(self):
+        self.table = RouteTable(ttl=30, refresh_interval=10, max_size=2)
+        self.route = {'target_url': 'http://10.0.0.1:80'}
+
+    def test_put_and_get(self):
+        """测试路由写入与命中"""
+        self.table.put('1', self.route)
+        self.assertEqual(self.table.get('1'), self.route)
+        self.assertEqual(self.table.get(1), self.route)
+
+    def test_invalidate(self):
+        """测试失效后不再命中"""
+        self.table.put('1', self.route)
+        self.table.invalidate('1', version=3)
+        self.assertIsNone(self.table.get('1'))
+        self.assertEqual(self.table.current_version('1'), 3)
+
+    def test_stale_fill_discarded(self):
+        """测试加载期间收到失效消息时丢弃回填"""
+        version = self.table.current_version('1')
+        self.table.invalidate('1')
+        self.assertFalse(self.table.put('1', self.route, version))
+        self.assertIsNone(self.table.get('1'))
+
+    def test_expired_entry(self):
+        """测试过期条目不命中"""
+        table = RouteTable(ttl=-1, refresh_interval=10, max_size=10)
+        table.put('1', self.route)
+        self.assertIsNone(table.get('1'))
+
+    def test_max_size(self):
+        """测试容量上限淘汰最早条目"""
+        for tenant_id in ('1', '2', '3'):
+            self.table.put(tenant_id, self.route)
+        self.assertIsNone(self.table.get('1'))
+        self.assertEqual(self.table.get('3'), self.route)
+
+
+class ProbeScheduleTests(TestCase):
+    def test_backoff_and_tighten(self):
+        """测试稳定健康时退避，状态翻转时收紧"""
+        from .health_checker import ProbeSchedule
+        schedule = ProbeSchedule(interval=30)
+        schedule.update(True, 5, 300, 2)
+        self.assertEqual(schedule.interval, 5)
+        schedule.update(True, 5, 300, 2)
+        schedule.update(True, 5, 300, 2)
+        self.assertEqual(schedule.interval, 20)
+        schedule.update(False, 5, 300, 2)
+        self.assertEqual(schedule.interval, 5)
+
+
+class TargetHealthCacheTests(TestCase):
+    def test_passive_score(self):
+        """测试评分由流量结果驱动，未知目标返回None"""
+        from .target_health import TargetHealthCache
+        cache = TargetHealthCache(ttl=30, probe_interval=10, threshold=0.5)
+        target = 'http://10.0.0.1:80'
+        self.assertIsNone(cache.is_healthy(target))
+        cache.observe(target, True)
+        self.assertTrue(cache.is_healthy(target))
+        for _ in range(5):
+            cache.observe(target, False)
+        self.assertFalse(cache.is_healthy(target))
+
+    def test_route_health_uses_pod_samples(self):
+        """测试代理按Pod地址上报的流量结果决定路由健康"""
+        from unittest import mock
+        from .route_manager import K8sRouteManager
+        from .target_health import TargetHealthCache
+        manager = K8sRouteManager.__new__(K8sRouteManager)
+        manager.target_health = TargetHealthCache(ttl=30, probe_interval=10, threshold=0.5)
+        manager.informer = mock.Mock()
+        manager.informer.get_endpoints.return_value = [{'ip': '10.0.0.5', 'ports': [8000], 'target_ref': 'pod-a'}]
+        route_info = {'target_url': 'http://10.96.0.10:80'}
+
+        self.assertTrue(manager._verify_route_health('1', route_info))
+        for _ in range(5):
+            manager.target_health.observe('http://10.0.0.5:8000', False)
+        self.assertFalse(manager._verify_route_health('1', route_info))
+
+
+class SingleFlightTests(TestCase):
+    def test_concurrent_calls_coalesced(self):
+        """测试同key并发调用只执行一次并共享结果"""
+        import threading
+        from .single_flight import SingleFlight
+        flight = SingleFlight()
+        started = threading.Event()
+        release = threading.Event()
+        calls = []
+
+        def load():
+            calls.append(1)
+            started.set()
+            release.wait(1)
+            return {'target_url': 'http://10.0.0.1:80'}
+
+        results = []
+        leader = threading.Thread(target=lambda: results.append(flight.do('route:1', load)))
+        leader.start()
+        started.wait(1)
+        follower = threading.Thread(target=lambda: results.append(flight.do('route:1', load, wait_timeout=1)))
+        follower.start()
+        release.set()
+        leader.join()
+        follower.join()
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(results[0], results[1])
+
+    def test_calls_coalesced_across_processes(self):
+        """测试另一进程持有锁时等待其发布的结果，不重复执行"""
+        import json
+        import threading
+        from .single_flight import SingleFlight
+
+        class FakeRedis:
+            def __init__(self):
+                self.data = {}
+
+            def get(self, key):
+                return self.data.get(key)
+
+            def set(self, key, value, nx=False, **kwargs):
+                if nx and key in self.data:
+                    return None
+                self.data[key] = value
+                return True
+
+            def exists(self, key):
+                return int(key in self.data)
+
+            def delete(self, key):
+                self.data.pop(key, None)
+
+        redis_client = FakeRedis()
+        flight = SingleFlight()
+        flight._redis_client = redis_client
+        # 模拟另一进程正在加载
+        redis_client.set('single_flight:lock:route:1', 'other')
+        route = {'target_url': 'http://10.0.0.1:80'}
+
+        def publish():
+            redis_client.set('single_flight:result:route:1', json.dumps(route))
+            redis_client.delete('single_flight:lock:route:1')
+
+        threading.Timer(0.1, publish).start()
+        calls = []
+        result = flight.do_shared('route:1', lambda: calls.append(1), wait_timeout=2, result_ttl=2)
+        self.assertEqual(result, route)
+        self.assertEqual(calls, [])
+
+
+
+class RouteEventWriterTests(TestCase):
+    def setUp(self):
+        from unittest import mock
+        from .route_writer import RouteEventWriter
+        self.writer = RouteEventWriter(batch_size=2, flush_interval_ms=1000, max_buffer=3)
+        self.writer._ensure_started = lambda: None
+        self.batches = []
+        patcher = mock.patch.object(self.writer, '_write_batch', side_effect=lambda events: self.batches.append(events))
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_buffer_overflow_drops_events(self):
+        """测试缓冲区满时丢弃新事件并计数，不阻塞记录"""
+        results = [self.writer.record({'tenant_id': '1'}) for _ in range(5)]
+        self.assertEqual(results, [True, True, True, False, False])
+        self.assertEqual(self.writer.stats()['buffered'], 3)
+        self.assertEqual(self.writer.dropped_count, 2)
+
+    def test_flush_in_batches_keeps_event_time(self):
+        """测试按batch_size分批写入，事件保留记录时的时间戳"""
+        from datetime import datetime, timezone as dt_timezone
+        occurred = datetime(2024, 1, 1, 12, 0, 30, tzinfo=dt_timezone.utc)
+        self.writer.record({'tenant_id': '1', 'timestamp': occurred})
+        self.writer.record({'tenant_id': '1'})
+        self.writer.record({'tenant_id': '2'})
+        self.writer.flush()
+        self.assertEqual([len(batch) for batch in self.batches], [2, 1])
+        self.assertEqual(self.batches[0][0]['timestamp'], occurred)
+        self.assertEqual(self.writer.stats()['buffered'], 0)
+        self.assertEqual(self.writer.flushed_count, 3)
+
+    def test_failed_batch_counted(self):
+        """测试写入失败的批次计入failed并丢弃"""
+        self.writer._write_batch.side_effect = RuntimeError('db down')
+        self.writer.record({'tenant_id': '1'})
+        self.writer.flush()
+        self.assertEqual(self.writer.failed_count, 1)
+        self.assertEqual(self.writer.stats()['buffered'], 0)
+
+    def test_batch_does_not_write_container_metrics(self):
+        """测试路由事件不写ContainerMetric，CPU/内存聚合只包含采集到的样本"""
+        import uuid
+        from unittest import mock
+        from django.utils import timezone
+        from .route_writer import RouteEventWriter
+
+        user_id = uuid.uuid4()
+        with mock.patch('userdb.models.UserContainer') as container_model, \
+                mock.patch('userdb.models.ContainerInstance'), \
+                mock.patch('apps.load_balancer.models.RouteRegistry') as route_model, \
+                mock.patch('apps.load_balancer.models.RouteLog'), \
+                mock.patch('apps.load_balancer.models.RouteMetrics'), \
+                mock.patch('shared_models.userdb.models.ContainerMetric') as metric_model:
+            container_model.objects.filter.return_value.values_list.return_value = [(7, user_id)]
+            route_model.objects.filter.return_value.values_list.return_value = [(3, 7, 'round_robin')]
+            RouteEventWriter()._write_batch([
+                {'tenant_id': str(user_id), 'timestamp': timezone.now(), 'success': False, 'response_time': 12.0}
+            ])
+        self.assertEqual(metric_model.mock_calls, [])
+
+class ColdStartQueueTests(TestCase):
+    def test_waiter_released_on_ready(self):
+        """测试等待者触发一次扩容，Endpoints就绪后被唤醒"""
+        import asyncio
+        import threading
+        from .cold_start import ColdStartQueue
+        queue = ColdStartQueue(max_waiters=10, timeout=1)
+        ready = set()
+        woken = []
+
+        def wake(tenant_id):
+            woken.append(tenant_id)
+            ready.add(tenant_id)
+            threading.Timer(0.05, queue.notify_ready, args=(tenant_id,)).start()
+
+        self.assertTrue(asyncio.run(
+            queue.wait_async('cold-start-test', lambda tenant_id: tenant_id in ready, wake)
+        ))
+        self.assertEqual(woken, ['cold-start-test'])
+        self.assertEqual(queue.waiting, 0)
+
+    def test_sync_wake_does_not_wait(self):
+        """测试同步路径只触发一次扩容且不阻塞"""
+        from .cold_start import ColdStartQueue
+        queue = ColdStartQueue(max_waiters=10, timeout=1)
+        woken = []
+        self.assertTrue(queue.wake('cold-start-sync-test', woken.append))
+        self.assertFalse(queue.wake('cold-start-sync-test', woken.append))
+        self.assertEqual(woken, ['cold-start-sync-test'])
+
+
+class EndpointInformerDeltaTests(TestCase):
+    def test_endpoint_deltas_written(self):
+        """测试Endpoints变化按tenant_id写回ContainerEndpoint"""
+        import uuid
+        from unittest import mock
+        from .informer import EndpointInformer
+
+        user_id = uuid.uuid4()
+        tenant_id = str(user_id)
+        informer = EndpointInformer(core_v1=None, namespace='user-containers')
+        informer._is_leader = lambda: True
+        pod = {'ip': '10.0.0.5', 'ports': [8000], 'target_ref': 'pod-a'}
+
+        with mock.patch('userdb.models.UserContainer') as container_model, \
+                mock.patch('userdb.models.ContainerEndpoint', create=True) as endpoint_model:
+            container_model.objects.filter.return_value.values_list.return_value = [(user_id, 7)]
+
+            informer._apply_endpoint_deltas({tenant_id: ([], [pod])})
+            endpoint_model.objects.update_or_create.assert_called_once()
+            kwargs = endpoint_model.objects.update_or_create.call_args.kwargs
+            self.assertEqual(kwargs['container_id'], 7)
+            self.assertEqual(kwargs['pod_name'], 'pod-a')
+            self.assertTrue(kwargs['defaults']['is_ready'])
+
+            informer._apply_endpoint_deltas({tenant_id: ([pod], [])})
+            endpoint_model.objects.filter.assert_called_with(container_id=7, pod_name__in={'pod-a'})
+            endpoint_model.objects.filter.return_value.update.assert_called_with(is_ready=False)
+
+    def test_wait_synced(self):
+        """测试等待首次同步：超时返回False，两类资源都同步后返回True"""
+        from .informer import EndpointInformer
+
+        informer = EndpointInformer(core_v1=None, namespace='user-containers')
+        informer._services_synced.set()
+        self.assertFalse(informer.wait_synced(0.01))
+        informer._endpoints_synced.set()
+        self.assertTrue(informer.wait_synced(0.01))
+
+
+class TokenCacheTests(TestCase):
+    class FakeRedis:
+        def __init__(self):
+            self.data = {}
+            self.published = []
+
+        def get(self, key):
+            return self.data.get(key)
+
+        def set(self, key, value, ex=None):
+            self.data[key] = value
+
+        def delete(self, key):
+            self.data.pop(key, None)
+
+        def publish(self, channel, message):
+            self.published.append((channel, message))
+
+    def _cache(self, client):
+        from shared_models.token_cache import TokenCache
+        cache = TokenCache(local_size=10, local_ttl=60, redis_ttl=300, flush_interval=60)
+        cache._redis_client = client
+        cache._ensure_started = lambda: None
+        return cache
+
+    def test_revocation_propagated(self):
+        """测试吊销后通知其他进程，且其他进程从Redis读到吊销状态"""
+        from django.contrib.auth import get_user_model
+        from shared_models.token_cache import TOKEN_REVOCATION_CHANNEL
+        client = self.FakeRedis()
+        entry = {'user': get_user_model()(username='token-user'), 'scope': '', 'expires_at': None, 'is_revoked': False}
+        first, second = self._cache(client), self._cache(client)
+        self.assertFalse(first.get('key-1', lambda token_key: entry)['is_revoked'])
+
+        first.revoke('key-1')
+        self.assertIn((TOKEN_REVOCATION_CHANNEL, 'key-1'), client.published)
+        self.assertTrue(second.get('key-1', lambda token_key: None)['is_revoked'])
+
+    def test_invalidate_after_relogin(self):
+        """测试重新登录后失效缓存条目，其他进程重新加载到未吊销的新状态"""
+        from django.contrib.auth import get_user_model
+        from shared_models.token_cache import TOKEN_REVOCATION_CHANNEL
+        client = self.FakeRedis()
+        user = get_user_model()(username='token-user')
+        first, second = self._cache(client), self._cache(client)
+        first.get('key-1', lambda token_key: {'user': user, 'scope': '', 'expires_at': None, 'is_revoked': False})
+        first.revoke('key-1')
+
+        first.invalidate('key-1')
+        self.assertEqual(client.published[-1], (TOKEN_REVOCATION_CHANNEL, 'key-1'))
+        entry = second.get('key-1', lambda token_key: {'user': user, 'scope': 'read', 'expires_at': None, 'is_revoked': False})
+        self.assertFalse(entry['is_revoked'])
+        self.assertEqual(entry['scope'], 'read')
+
+    def test_flush_keeps_each_last_used(self):
+        """测试批量写回时每个Token保留各自的last_used"""
+        from unittest import mock
+        from django.db.models import Case
+        from django.utils import timezone
+        cache = self._cache(self.FakeRedis())
+        earlier = timezone.now() - timezone.timedelta(minutes=5)
+        later = timezone.now()
+        cache._last_used = {'key-1': earlier, 'key-2': later}
+
+        with mock.patch('shared_models.token_cache.apps.get_model') as get_model:
+            cache.flush_last_used()
+        update = get_model.return_value.objects.filter.return_value.update
+        update.assert_called_once()
+        case = update.call_args.kwargs['last_used']
+        self.assertIsInstance(case, Case)
+        self.assertEqual({when.result.value for when in case.cases}, {earlier, later})
+        self.assertEqual(cache._last_used, {})
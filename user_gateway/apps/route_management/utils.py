@@ -1,26 +1,42 @@
 from django.utils import timezone
 from rest_framework import exceptions
 from userdb.models import Token
+from shared_models.token_cache import get_token_cache
 
 class TokenValidator:
+    @staticmethod
+    def _load_token(token_key):
+        """缓存未命中时从数据库加载Token"""
+        try:
+            token = Token.objects.select_related('user').get(key=token_key)
+        except Token.DoesNotExist:
+            return None
+        return {
+            'user': token.user,
+            'scope': token.scope,
+            'expires_at': token.expires_at,
+            'is_revoked': token.is_revoked,
+        }
+
     @staticmethod
     def validate_token(token_key, required_scope=None):
         """验证Token有效性、过期时间、吊销状态和权限范围"""
-        try:
-            token = Token.objects.get(key=token_key)
+        token_cache = get_token_cache()
+        token = token_cache.get(token_key, TokenValidator._load_token)
+        if token is None:
+            raise exceptions.AuthenticationFailed('Invalid token')
             
-            # 检查Token是否被吊销
-            if token.is_revoked:
-                raise exceptions.AuthenticationFailed('Token has been revoked')
-                
-            # 检查Token是否过期
-            if token.expires_at and token.expires_at < timezone.now():
-                raise exceptions.AuthenticationFailed('Token has expired')
-                
-            # 检查权限范围
-            if required_scope and required_scope not in token.scope.split(','):
-                raise exceptions.AuthenticationFailed('Token does not have required scope')
-                
-            return token.user
-        except Token.DoesNotExist:
-            raise exceptions.AuthenticationFailed('Invalid token')
\ No newline at end of file
+        # 检查Token是否被吊销
+        if token['is_revoked']:
+            raise exceptions.AuthenticationFailed('Token has been revoked')
+            
+        # 检查Token是否过期
+        if token['expires_at'] and token['expires_at'] < timezone.now():
+            raise exceptions.AuthenticationFailed('Token has expired')
+            
+        # 检查权限范围
+        if required_scope and required_scope not in token['scope'].split(','):
+            raise exceptions.AuthenticationFailed('Token does not have required scope')
+            
+        token_cache.touch(token_key)
+        return token['user']
@@ -4,7 +4,7 @@ from django.shortcuts import render
 from rest_framework import status, viewsets, permissions
 from rest_framework.decorators import action
 from rest_framework.authtoken.views import ObtainAuthToken
-from rest_framework.authtoken.models import Token
+from userdb.models import Token
 from rest_framework.response import Response
 from rest_framework import status
 from django.utils import timezone
@@ -19,8 +19,9 @@ from .serializers import (
     ContainerRegistryCreateSerializer,
     RouteMetricsSerializer
 )
-from .route_manager import RouteManager, K8sRouteManager
+from .route_manager import RouteManager, K8sRouteManager, get_k8s_route_manager
 from .services import RouteManagementService
+from shared_models.token_cache import get_token_cache
 from common.permissions import IsGatewayService
 from shared_models.userdb.models import BusinessErrorLog
 from .serializers import BusinessErrorLogSerializer
@@ -105,9 +106,16 @@ class ContainerRegistryViewSet(viewsets.ModelViewSet):
         """获取路由信息"""
         tenant_id = pk  # 这里 pk 就是 tenant_id，因为 DRF 默认用 pk 作为主键参数
         try:
-            route_manager = K8sRouteManager()
+            route_manager = get_k8s_route_manager()
             target_url, route_info = route_manager.route_request(tenant_id, request.data)
             if not target_url:
+                if route_info.get('status') in ('creating', 'resolving'):
+                    # 容器创建/路由解析中，提示客户端稍后重试
+                    return Response(
+                        {'error': 'Container not ready', **route_info},
+                        status=status.HTTP_503_SERVICE_UNAVAILABLE,
+                        headers={'Retry-After': str(route_info.get('retry_after', 1))}
+                    )
                 return Response(
                     {'error': 'Container not available', **route_info},
                     status=status.HTTP_404_NOT_FOUND
@@ -167,6 +175,7 @@ class CustomAuthToken(ObtainAuthToken):
             serializer.is_valid(raise_exception=True)
             user = serializer.validated_data['user']
             token, created = Token.objects.get_or_create(user=user)
+            previous_key = token.key
             
             # 设置Token过期时间、吊销状态和权限范围
             if not created:
@@ -181,6 +190,12 @@ class CustomAuthToken(ObtainAuthToken):
             # 设置默认权限范围
             token.scope = request.data.get('scope', 'read,write')  # 从请求中获取权限范围，默认为read,write
             token.save()
+            # 吊销状态、过期时间和权限范围已改写，丢弃各进程缓存的旧条目
+            if not created:
+                token_cache = get_token_cache()
+                token_cache.invalidate(token.key)
+                if previous_key != token.key:
+                    token_cache.invalidate(previous_key)
             
             return Response({
                 'token': token.key,
@@ -208,6 +223,8 @@ class TokenManagementViewSet(viewsets.ViewSet):
             token = Token.objects.get(key=token_key, user=request.user)
             token.is_revoked = True
             token.save()
+            # 通知各进程丢弃缓存的Token
+            get_token_cache().revoke(token_key)
             
             return Response({'status': 'success', 'message': 'Token has been revoked'})
         except Token.DoesNotExist:
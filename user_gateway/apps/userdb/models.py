@@ -414,7 +414,7 @@ class RouteLog(models.Model):
     )
     error_message = models.TextField(null=True, blank=True, verbose_name='错误信息')
     
-    timestamp = models.DateTimeField(auto_now_add=True, db_index=True, verbose_name='时间戳')
+    timestamp = models.DateTimeField(default=timezone.now, db_index=True, verbose_name='时间戳')
     
     class Meta:
         db_table = 'route_logs'
@@ -494,8 +494,12 @@ class GatewayNode(models.Model):
 from rest_framework.authtoken.models import Token
 from django.utils import timezone
 
+def default_token_expiry():
+    """Token默认有效期：创建后7天"""
+    return timezone.now() + timezone.timedelta(days=7)
+
 class Token(Token):
-    expires_at = models.DateTimeField(default=timezone.now() + timezone.timedelta(days=7))
+    expires_at = models.DateTimeField(default=default_token_expiry)
     is_revoked = models.BooleanField(default=False)
     scope = models.CharField(max_length=100, blank=True, default='default')
     last_used = models.DateTimeField(null=True, blank=True)
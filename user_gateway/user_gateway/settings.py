@@ -54,6 +54,7 @@ MIDDLEWARE = [
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
     'django_prometheus.middleware.PrometheusAfterMiddleware',
     'apps.route_management.middleware.TokenAuthenticationMiddleware',  # 添加Token认证中间件
+    'apps.route_management.middleware.RateLimitMiddleware',  # 按租户路由限流
 ]
 
 ROOT_URLCONF = 'user_gateway.urls'
@@ -134,9 +135,62 @@ STATIC_URL = 'static/'
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
 # 添加容器管理核心配置
-ENABLE_DIRECT_CONTAINER_CREATION = False  # 禁用直接容器创建
 CONTAINER_NAMESPACE = 'mission-django-app'  # 统一命名空间
 ROUTE_CACHE_TTL = 30  # 路由缓存30秒
+ROUTE_TABLE_TTL = 30  # 进程内路由表条目有效期(秒)
+ROUTE_TABLE_REFRESH_INTERVAL = 10  # 进程内路由表后台刷新间隔(秒)
+ROUTE_TABLE_MAX_SIZE = 10000  # 单个worker最多缓存的租户路由数
+ROUTE_WRITER_BATCH_SIZE = 500  # 路由日志/指标每批写入条数
+ROUTE_WRITER_FLUSH_INTERVAL_MS = 200  # 路由日志/指标刷新间隔(毫秒)
+ROUTE_WRITER_MAX_BUFFER = 10000  # 路由事件缓冲区上限，超出后丢弃
+ENDPOINT_INFORMER_WATCH_TIMEOUT = 300  # Service/Endpoints watch单次超时(秒)
+ENDPOINT_INFORMER_LEADER_TTL = 30  # informer写库租约有效期(秒)
+LB_HASH_RING_VNODES = 160  # ip_hash一致性哈希环每个实例的虚拟节点数
+LB_HASH_BOUNDED_LOAD_FACTOR = 1.25  # ip_hash有界负载系数，单实例负载上限为平均值的倍数
+LB_PEAK_EWMA_DECAY_SECONDS = 10.0  # peak_ewma延迟衰减时间常数(秒)
+LB_PEAK_EWMA_DEFAULT_RTT_MS = 100.0  # peak_ewma尚无样本实例的默认延迟(毫秒)
+CIRCUIT_BREAKER_WINDOW_SECONDS = 60  # 熔断器失败计数滑动窗口(秒)
+CIRCUIT_BREAKER_HALF_OPEN_PROBES = 3  # 半开状态允许的探测请求数
+CIRCUIT_BREAKER_LOCAL_TTL = 1.0  # 熔断状态进程内镜像有效期(秒)
+HEALTH_CHECK_CONCURRENCY = 200  # 健康检查最大并发探测数
+HEALTH_CHECK_MIN_INTERVAL = 5  # 状态翻转或失败Pod的探测间隔(秒)
+HEALTH_CHECK_MAX_INTERVAL = 300  # 稳定健康Pod的最长探测间隔(秒)
+HEALTH_CHECK_BACKOFF = 1.5  # 稳定健康时探测间隔的放大倍数
+HEALTH_CHECK_SYNC_TIMEOUT = 30  # 健康检查等待informer首次同步的最长时间(秒)
+TARGET_HEALTH_TTL = 30  # 路由目标健康评分有效期(秒)
+TARGET_HEALTH_PROBE_INTERVAL = 10  # 路由目标后台探测间隔(秒)
+TARGET_HEALTH_THRESHOLD = 0.5  # 健康评分低于该值的目标视为不健康
+TOKEN_CACHE_PREFIX = 'gateway_token_cache'  # Token缓存Redis键前缀
+TOKEN_CACHE_LOCAL_SIZE = 10000  # 单个worker缓存的Token数
+TOKEN_CACHE_LOCAL_TTL = 60  # Token进程内缓存有效期(秒)
+TOKEN_CACHE_REDIS_TTL = 300  # Token Redis缓存有效期(秒)
+TOKEN_LAST_USED_FLUSH_INTERVAL = 60  # Token last_used批量写回间隔(秒)
+ROUTE_REGISTRY_CACHE_TTL = 30  # 用户路由注册进程内缓存有效期(秒)
+HTTP_SESSION_POOL_SIZE = 20  # 访问Admin Service/监控系统的keep-alive连接数
+RATE_LIMIT_LEASE_SECONDS = 1.0  # 每次从Redis预取多少秒速率的令牌
+RATE_LIMIT_MIN_LEASE = 10  # 每次从Redis预取的最少令牌数
+RATE_LIMIT_LEASE_TTL = 1.0  # 预取令牌的本地有效期(秒)
+
+# 冷路由请求合并配置
+SINGLE_FLIGHT_WAIT_TIMEOUT = 5  # 等待同租户在途路由解析的最长时间(秒)
+SINGLE_FLIGHT_RESULT_TTL = 2  # 路由解析结果在Redis中供其他进程复用的时间(秒)
+SINGLE_FLIGHT_CREATE_TTL = 60  # 容器创建锁有效期(秒)，期间不重复触发创建
+SINGLE_FLIGHT_RETRY_AFTER = 5  # 容器创建中返回的Retry-After(秒)
+
+# 缩容到零后的冷启动配置
+SCALE_TO_ZERO_ENABLED = True  # 无就绪Pod时是否排队等待扩容
+COLD_START_QUEUE_SIZE = 200  # 每个进程最多缓冲的冷启动请求数
+COLD_START_TIMEOUT = 60  # 等待Endpoints就绪的最长时间(秒)
+COLD_START_WAKE_TTL = 30  # 扩容触发锁有效期(秒)，期间不重复扩容
+
+# Kubernetes API客户端配置
+K8S_CONNECTION_POOL_MAXSIZE = 32  # 每个进程共享的ApiClient连接池大小
+K8S_CONNECT_TIMEOUT = 5  # K8s API连接超时(秒)
+K8S_READ_TIMEOUT = 30  # K8s API读超时(秒)，watch调用不受限
+
+PROXY_READ_TIMEOUT = 60  # 上游读超时(秒)
+PROXY_HEDGE_DELAY_MS = 300  # 幂等请求对冲延迟(毫秒)
+PROXY_REPLAY_BODY_LIMIT = 1048576  # 不超过该大小的请求体可重试/对冲(字节)
 HEALTH_CHECK_INTERVAL = 10  # 健康检查间隔(秒)
 MAX_LATENCY_THRESHOLD = 300  # 最大延迟阈值(毫秒)
 
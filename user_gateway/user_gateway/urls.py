@@ -17,10 +17,12 @@ Including another URLconf
 from django.contrib import admin
 from django.urls import path, include
 from apps.route_management.views import CustomAuthToken
+from apps.load_balancer.proxy import proxy_request
 
 urlpatterns = [
     path('admin/', admin.site.urls),
     path('prometheus/', include('django_prometheus.urls')),
     path('api/token/', CustomAuthToken.as_view(), name='api_token_auth'),
     path('api/load-balancer/', include('apps.load_balancer.urls')),  # 添加此行
+    path('proxy/<path:path>', proxy_request, name='proxy'),  # 转发到用户容器
 ]